@@ -0,0 +1,304 @@
+import copy
+import functools
+import re
+
+# Python Module generating the MediaLive ABR ladder of a channel from a
+# compact spec
+
+# A ladder is a list of rungs, each a resolution, a bitrate and a QVBR
+# quality level, written as e.g. "1080p:4M:9,720p:2M,576p:1.2M:7". The
+# VideoDescriptions, the outputs of the MediaPackage output group and the
+# audio description are all generated from it, so they can't drift apart.
+# for_audience() builds a ladder from a top bitrate and the bandwidths of
+# the expected viewers instead, leaving out rungs nobody would pick.
+# Generated encoder settings are cached per ladder and latency profile.
+
+FRAMERATE = 50
+AUDIO_BITRATE = 192000
+
+# MaxBitrate of every rung relative to its average (QVBR) bitrate
+MAX_BITRATE_RATIO = 1.5
+
+# Bounds on bits per pixel per frame: below it a resolution is starved,
+# above it the bits would be better spent on a larger resolution
+MIN_BITS_PER_PIXEL = 0.02
+MAX_BITS_PER_PIXEL = 0.25
+
+# Bits per pixel for_audience() picks resolutions by
+TARGET_BITS_PER_PIXEL = 0.035
+
+# Rungs closer than this ratio cost encoding and cache space without
+# giving players a noticeably different choice
+MIN_STEP_RATIO = 1.3
+MAX_RUNGS = 8
+
+# Heights for_audience() chooses from, all 16:9 with even widths
+HEIGHTS = (1080, 720, 576, 432, 360, 270)
+
+# Share of measured bandwidth players commit to video, as HlsLoadTest's viewers do
+BANDWIDTH_HEADROOM = 0.8
+
+
+class Rung:
+    def __init__(self, height, bitrate, qvbr_quality_level=None):
+        self.height = height
+        self.width = round(height * 16 / 9 / 2) * 2
+        self.bitrate = bitrate
+        # Small renditions are watched on small screens, where a lower QVBR level isn't noticed
+        self.qvbr_quality_level = (9 if height >= 720 else 7) if qvbr_quality_level is None else qvbr_quality_level
+        self.max_bitrate = int(bitrate * MAX_BITRATE_RATIO)
+
+    @property
+    def name(self):
+        # The historical "mpbs" spelling keeps the outputs of existing channels unchanged
+        return "video_" + f"{self.bitrate / 1e6:g}".replace(".", "_") + "mpbs"
+
+    @property
+    def bits_per_pixel(self):
+        return self.bitrate / (self.width * self.height * FRAMERATE)
+
+    @property
+    def spec(self):
+        return f"{self.height}p:{format_bitrate(self.bitrate)}:{self.qvbr_quality_level}"
+
+    def _key(self):
+        return self.height, self.bitrate, self.qvbr_quality_level
+
+    def __eq__(self, other):
+        return isinstance(other, Rung) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+
+class Ladder:
+    def __init__(self, name, rungs):
+        rungs = sorted(rungs, key=lambda r: r.bitrate, reverse=True)
+        if not rungs:
+            raise ValueError(f"ABR ladder '{name}' has no rungs")
+        if len(rungs) > MAX_RUNGS:
+            raise ValueError(f"ABR ladder '{name}' has {len(rungs)} rungs, at most {MAX_RUNGS} are supported")
+        for rung in rungs:
+            if not 144 <= rung.height <= 2160 or rung.height % 2:
+                raise ValueError(f"ABR ladder '{name}': {rung.height}p is not an even height between 144 and 2160")
+            if not 1 <= rung.qvbr_quality_level <= 10:
+                raise ValueError(f"ABR ladder '{name}': QVBR quality level {rung.qvbr_quality_level} of "
+                                 f"{rung.spec} is not between 1 and 10")
+            if not MIN_BITS_PER_PIXEL <= rung.bits_per_pixel <= MAX_BITS_PER_PIXEL:
+                raise ValueError(f"ABR ladder '{name}': {format_bitrate(rung.bitrate)} is too "
+                                 f"{'low' if rung.bits_per_pixel < MIN_BITS_PER_PIXEL else 'high'} "
+                                 f"a bitrate for {rung.height}p")
+        for higher, lower in zip(rungs, rungs[1:]):
+            if higher.bitrate < lower.bitrate * MIN_STEP_RATIO:
+                raise ValueError(f"ABR ladder '{name}': {higher.spec} and {lower.spec} are less than "
+                                 f"{MIN_STEP_RATIO}x apart")
+            if higher.height < lower.height:
+                raise ValueError(f"ABR ladder '{name}': {lower.spec} has a larger resolution than the higher "
+                                 f"bitrate {higher.spec}")
+        self.name = name
+        self.rungs = tuple(rungs)
+
+    @property
+    def spec(self):
+        return ",".join(rung.spec for rung in self.rungs)
+
+    def rung_for(self, bandwidth, headroom=BANDWIDTH_HEADROOM):
+        # The rung a player with this much bandwidth settles on
+        for rung in self.rungs:
+            if rung.bitrate <= bandwidth * headroom:
+                return rung
+        return self.rungs[-1]
+
+    def expected_bitrate(self, bandwidths, headroom=BANDWIDTH_HEADROOM):
+        # Mean video bitrate delivered per viewer, each bandwidth an equal share of viewers
+        return sum(self.rung_for(b, headroom).bitrate for b in bandwidths) / len(bandwidths)
+
+    def __eq__(self, other):
+        return isinstance(other, Ladder) and self.rungs == other.rungs
+
+    def __hash__(self):
+        return hash(self.rungs)
+
+
+def parse(spec, name=None):
+    # "1080p:4M:9,720p:2M,576p:1200k" -> Ladder, the QVBR level is optional
+    rungs = []
+    for part in spec.split(","):
+        match = re.fullmatch(r"\s*(\d+)p?:([\d.]+[kKmM]?)(?::(\d+))?\s*", part)
+        if not match:
+            raise ValueError(f"Can't parse ABR ladder rung '{part}', expected e.g. 720p:2M or 720p:2M:8")
+        height, bitrate, level = match.groups()
+        rungs.append(Rung(int(height), parse_bitrate(bitrate), int(level) if level else None))
+    return Ladder(name or "custom", rungs)
+
+
+def parse_bitrate(value):
+    # "1.2M" -> 1200000, "800k" -> 800000, "500000" -> 500000
+    value = value.strip()
+    multiplier = {"k": 1e3, "m": 1e6}.get(value[-1:].lower(), 1)
+    try:
+        return int(float(value[:-1] if multiplier != 1 else value) * multiplier)
+    except ValueError:
+        raise ValueError(f"Can't parse bitrate '{value}', expected e.g. 800k or 2.5M")
+
+
+def format_bitrate(bitrate):
+    if bitrate >= 1e6:
+        return f"{bitrate / 1e6:g}M"
+    return f"{bitrate / 1e3:g}k"
+
+
+def for_audience(max_bitrate, bandwidths, headroom=BANDWIDTH_HEADROOM, max_rungs=4, min_bitrate=300000,
+                 step_ratio=1.5):
+    # One rung at the most each share of viewers can sustain, top capped at
+    # max_bitrate, skipping rungs within step_ratio of the previous one
+    sustainable = sorted((min(max_bitrate, max(min_bitrate, b * headroom)) for b in bandwidths), reverse=True)
+    bitrates = []
+    for bitrate in sustainable:
+        bitrate = int(bitrate // 100000 * 100000) or min_bitrate
+        if not bitrates or bitrate * max(step_ratio, MIN_STEP_RATIO) <= bitrates[-1]:
+            bitrates.append(bitrate)
+    if len(bitrates) > max_rungs:
+        # Keep the top and the bottom, the slowest viewers still need something to play
+        bitrates = bitrates[:max_rungs - 1] + bitrates[-1:]
+    rungs = [Rung(_height_for(bitrate), bitrate) for bitrate in bitrates]
+    return Ladder(f"audience-{format_bitrate(max_bitrate)}", rungs)
+
+
+def _height_for(bitrate):
+    for height in HEIGHTS:
+        if Rung(height, bitrate).bits_per_pixel >= TARGET_BITS_PER_PIXEL:
+            return height
+    return HEIGHTS[-1]
+
+
+LADDERS = {
+    "standard": parse("1080p:4M:9,720p:2M:9,576p:1.2M:7", "standard"),
+    # Lower QVBR levels spend less on easy content, 432p serves phones on poor connections
+    "lean": parse("1080p:3.5M:8,720p:1.8M:8,432p:800k:7", "lean"),
+}
+
+
+def get_ladder(spec):
+    # A LADDERS name or a ladder spec
+    if spec in LADDERS:
+        return LADDERS[spec]
+    if ":" not in spec:
+        raise ValueError(f"Unknown ABR ladder '{spec}', expected one of {', '.join(LADDERS)} or a spec "
+                         f"like 720p:2M,360p:600k")
+    return parse(spec)
+
+
+def encoder_settings(ladder, profile, destination_id, audio_selector_name):
+    # MediaLive EncoderSettings of the ladder, callers get their own copy
+    settings = copy.deepcopy(_template(ladder, profile))
+    settings["AudioDescriptions"][0]["AudioSelectorName"] = audio_selector_name
+    settings["OutputGroups"][0]["OutputGroupSettings"]["MediaPackageGroupSettings"]["Destination"][
+        "DestinationRefId"] = destination_id
+    return settings
+
+
+@functools.lru_cache(maxsize=64)
+def _template(ladder, profile):
+    outputs = [_output(rung.name, rung.name) for rung in ladder.rungs]
+    audio_output = _output("audio", None)
+    audio_output["AudioDescriptionNames"] = ["audio"]
+    return {
+        "AudioDescriptions": [{
+            "AudioSelectorName": None,
+            "AudioTypeControl": "FOLLOW_INPUT",
+            "CodecSettings": {
+                "AacSettings": {
+                    "Bitrate": AUDIO_BITRATE,
+                    "CodingMode": "CODING_MODE_2_0",
+                    "InputType": "NORMAL",
+                    "Profile": "LC",
+                    "RateControlMode": "CBR",
+                    "RawFormat": "NONE",
+                    "SampleRate": 48000,
+                    "Spec": "MPEG4"
+                }
+            },
+            "LanguageCodeControl": "FOLLOW_INPUT",
+            "Name": "audio"
+        }],
+        "OutputGroups": [{
+            "Name": "emp_output",
+            "OutputGroupSettings": {
+                "MediaPackageGroupSettings": {
+                    "Destination": {
+                        "DestinationRefId": None
+                    }
+                }
+            },
+            "Outputs": outputs + [audio_output]
+        }],
+        "TimecodeConfig": {
+            "Source": "EMBEDDED"
+        },
+        "VideoDescriptions": [_video_description(rung, profile) for rung in ladder.rungs],
+    }
+
+
+def _output(name, video_description_name):
+    output = {
+        "AudioDescriptionNames": [],
+        "CaptionDescriptionNames": [],
+        "OutputName": name,
+        "OutputSettings": {
+            "MediaPackageOutputSettings": {}
+        },
+    }
+    if video_description_name:
+        output["VideoDescriptionName"] = video_description_name
+    return output
+
+
+def _video_description(rung, profile):
+    return {
+        "Name": rung.name,
+        "Width": rung.width,
+        "Height": rung.height,
+        "RespondToAfd": "NONE",
+        "ScalingBehavior": "DEFAULT",
+        "Sharpness": 50,
+        "CodecSettings": {
+            "H264Settings": {
+                "AdaptiveQuantization": "HIGH",
+                "AfdSignaling": "NONE",
+                "Bitrate": rung.bitrate,
+                "BufFillPct": 90,
+                "BufSize": int(rung.bitrate * profile.buffer_seconds),
+                "ColorMetadata": "INSERT",
+                "EntropyEncoding": "CABAC",
+                "FlickerAq": "DISABLED",
+                "FramerateControl": "SPECIFIED",
+                "FramerateDenominator": 1,
+                "FramerateNumerator": FRAMERATE,
+                "GopBReference": "DISABLED",
+                "GopClosedCadence": 1,
+                "GopNumBFrames": profile.b_frames,
+                "GopSize": profile.gop_seconds,
+                "GopSizeUnits": "SECONDS",
+                "Level": "H264_LEVEL_AUTO",
+                "LookAheadRateControl": profile.look_ahead,
+                "MaxBitrate": rung.max_bitrate,
+                "NumRefFrames": 3,
+                "ParControl": "SPECIFIED",
+                "ParDenominator": 1,
+                "ParNumerator": 1,
+                "Profile": "HIGH" if rung.height >= 720 else "MAIN",
+                "QvbrQualityLevel": rung.qvbr_quality_level,
+                "RateControlMode": "QVBR",
+                "ScanType": "PROGRESSIVE",
+                "SceneChangeDetect": "ENABLED",
+                # More slices let the encoder spread a large frame over more cores
+                "Slices": 4 if rung.height >= 1080 else 2 if rung.height >= 720 else 1,
+                "SpatialAq": "ENABLED",
+                "SubgopLength": "FIXED",
+                "Syntax": "DEFAULT",
+                "TemporalAq": "DISABLED",
+                "TimecodeInsertion": "DISABLED"
+            }
+        },
+    }
@@ -0,0 +1,179 @@
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import botocore
+
+# Python Module that watches MediaLive channel state transitions
+
+# A single background thread polls every watched channel. When more than
+# one channel is due in the same tick the states come from one paginated
+# list_channels sweep instead of a describe_channel per channel. Poll
+# intervals follow the expected duration of the current state and then
+# back off exponentially with jitter, and each watch has an overall timeout.
+
+# Rough time MediaLive spends in each transitional state, in seconds
+EXPECTED_STATE_SECONDS = {
+    "CREATING": 15,
+    "UPDATING": 10,
+    "STARTING": 60,
+    "STOPPING": 30,
+    "DELETING": 20,
+}
+
+
+class _Watch:
+    def __init__(self, channel_id, target_states, failure_states, deadline):
+        self.channel_id = channel_id
+        self.target_states = target_states
+        self.failure_states = failure_states
+        self.deadline = deadline
+        self.future = Future()
+        self.state = None
+        self.state_since = time.monotonic()
+        self.attempt = 0
+        self.next_poll = time.monotonic()
+
+
+class ChannelWaiter:
+    def __init__(self, client, initial_delay=1.0, max_delay=20.0, timeout=900, jitter=0.25, batch_window=1.0,
+                 expected_state_seconds=None, verbose=True):
+        self.client = client
+        self.expected_state_seconds = expected_state_seconds or EXPECTED_STATE_SECONDS
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.jitter = jitter
+        self.batch_window = batch_window
+        self.verbose = verbose
+        self.polls = 0
+        self._watches = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, channel_id, target_states, failure_states=("DELETED",), timeout=None):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        watch = _Watch(channel_id, tuple(target_states), tuple(failure_states), deadline)
+        with self._condition:
+            self._watches.append(watch)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ChannelWaiter", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return watch.future
+
+    def wait(self, channel_id, target_states, failure_states=("DELETED",), timeout=None):
+        return self.watch(channel_id, target_states, failure_states, timeout).result()
+
+    def _run(self):
+        try:
+            self._loop()
+        finally:
+            # Only still set when the loop died, fail what it was watching rather than leave it hanging
+            with self._condition:
+                stranded = []
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                    stranded, self._watches = self._watches, []
+            for watch in stranded:
+                if not watch.future.done():
+                    watch.future.set_exception(RuntimeError(
+                        f"Stopped watching channel {watch.channel_id} after the state poller failed"))
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                if not self._watches:
+                    self._thread = None
+                    return
+                now = time.monotonic()
+                next_poll = min(w.next_poll for w in self._watches)
+                if next_poll > now:
+                    self._condition.wait(next_poll - now)
+                    continue
+                # Pull in watches that are almost due so they share this poll
+                due = [w for w in self._watches if w.next_poll <= now + self.batch_window]
+
+            states, error = self._poll({w.channel_id for w in due})
+            resolved = []
+            with self._condition:
+                for watch in due:
+                    outcome = self._update(watch, states.get(watch.channel_id), error)
+                    if outcome:
+                        self._watches.remove(watch)
+                        resolved.append((watch.future, outcome))
+            # Resolve outside the lock, callbacks may register new watches or call MediaLive
+            for future, (result, exception) in resolved:
+                if exception:
+                    future.set_exception(exception)
+                else:
+                    future.set_result(result)
+
+    def _poll(self, channel_ids):
+        self.polls += 1
+        try:
+            if len(channel_ids) == 1:
+                channel_id = next(iter(channel_ids))
+                return {channel_id: self._describe_state(channel_id)}, None
+            return self._list_states(channel_ids), None
+        except Exception as e:
+            # API errors as well as connection and read timeouts, retried like any failed poll
+            return {}, e
+
+    def _describe_state(self, channel_id):
+        try:
+            return self.client.describe_channel(ChannelId=channel_id)["State"]
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] == "NotFoundException":
+                return "DELETED"
+            raise
+
+    def _list_states(self, channel_ids):
+        states = {}
+        for page in self.client.get_paginator("list_channels").paginate():
+            for channel in page["Channels"]:
+                if channel["Id"] in channel_ids:
+                    states[channel["Id"]] = channel["State"]
+        # Deleted channels eventually drop out of the listing, but so may a
+        # channel the listing hasn't caught up with, so each one is confirmed
+        for channel_id in channel_ids - states.keys():
+            states[channel_id] = self._describe_state(channel_id)
+        return states
+
+    def _update(self, watch, state, error):
+        now = time.monotonic()
+        changed = state is not None and state != watch.state
+        if changed:
+            watch.state = state
+            watch.state_since = now
+            watch.attempt = 0
+
+        if state in watch.target_states:
+            return state, None
+        if state in watch.failure_states:
+            return None, RuntimeError(
+                f"Channel {watch.channel_id} entered state {state} while waiting for {'/'.join(watch.target_states)}")
+        if now >= watch.deadline:
+            detail = f" (last error: {error})" if error else ""
+            return None, TimeoutError(
+                f"Timed out waiting for channel {watch.channel_id} to reach {'/'.join(watch.target_states)}, "
+                f"last state {watch.state}{detail}")
+
+        delay = self._next_delay(watch, now, error)
+        watch.next_poll = now + delay
+        if self.verbose and changed:
+            print(f"Channel {watch.channel_id} is {watch.state}, checking again in {delay:.1f} seconds ...")
+        return None
+
+    def _next_delay(self, watch, now, error):
+        expected = self.expected_state_seconds.get(watch.state, 0)
+        remaining = expected - (now - watch.state_since)
+        if remaining > 0 and not error:
+            # Close in on the expected completion time rather than overshooting it
+            delay = max(self.initial_delay, remaining / 2)
+        else:
+            delay = self.initial_delay * 2 ** watch.attempt
+            watch.attempt += 1
+        delay = min(self.max_delay, delay)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
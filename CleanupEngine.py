@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Python Module for tearing down one or more pipelines concurrently
+
+# Each helper contributes a chain of stages that must run in order
+# (MediaLive: channel -> input -> security group, MediaPackage:
+# origin endpoint -> channel). Chains are independent of each other and
+# every resource within a stage is deleted in parallel on a bounded pool.
+
+
+class CleanupResult:
+    def __init__(self, resource_type, resource_id, error=None, duration=0.0):
+        self.resource_type = resource_type
+        self.resource_id = resource_id
+        self.error = error
+        self.duration = duration
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        status = "deleted" if self.ok else f"FAILED ({self.error})"
+        return f"{self.resource_type} {self.resource_id}: {status} in {self.duration:.1f}s"
+
+
+class CleanupEngine:
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self.results = []
+        self._lock = threading.Lock()
+
+    def run(self, media_live_helpers=(), media_package_helpers=(), cloudfront_helpers=()):
+        chains = [self.media_live_stages(h) for h in media_live_helpers]
+        chains += [self.media_package_stages(h) for h in media_package_helpers]
+        chains += [self.cloudfront_stages(h) for h in cloudfront_helpers]
+        return self.run_chains(chains)
+
+    def run_chains(self, chains):
+        # Each chain is a list of (resource type, discover(), delete(resource_id)) stages
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            finished = [threading.Event() for _ in chains]
+            for stages, event in zip(chains, finished):
+                self._run_stage(pool, stages, event)
+            for event in finished:
+                event.wait()
+        return self.results
+
+    @staticmethod
+    def media_live_stages(helper):
+        return [
+            ("MediaLive channel", helper.list_channel_ids, helper.teardown_channel),
+            ("MediaLive input", helper.list_input_ids, helper.delete_input),
+            ("MediaLive input security group", helper.list_input_security_group_ids,
+             helper.delete_input_security_group),
+        ]
+
+    @staticmethod
+    def media_package_stages(helper):
+        return [
+            ("MediaPackage origin endpoint", helper.list_origin_endpoint_ids, helper.delete_origin_endpoint),
+            ("MediaPackage channel", helper.list_channel_ids, helper.delete_channel),
+        ]
+
+    @staticmethod
+    def cloudfront_stages(helper):
+        return [
+            ("CloudFront distribution", helper.list_distribution_ids, helper.delete_distribution),
+        ]
+
+    def _run_stage(self, pool, stages, finished):
+        if not stages:
+            finished.set()
+            return
+        resource_type, discover, delete = stages[0]
+
+        def on_discovered(future):
+            try:
+                resource_ids = future.result()
+            except Exception as e:
+                self._record(CleanupResult(resource_type, "<discovery>", describe_error(e)))
+                resource_ids = []
+            if not resource_ids:
+                self._run_stage(pool, stages[1:], finished)
+                return
+
+            remaining = [len(resource_ids)]
+
+            def on_deleted(future):
+                self._record(future.result())
+                with self._lock:
+                    remaining[0] -= 1
+                    stage_done = remaining[0] == 0
+                if stage_done:
+                    self._run_stage(pool, stages[1:], finished)
+
+            for resource_id in resource_ids:
+                pool.submit(self._delete, resource_type, resource_id, delete).add_done_callback(on_deleted)
+
+        pool.submit(discover).add_done_callback(on_discovered)
+
+    def _delete(self, resource_type, resource_id, delete):
+        start = time.monotonic()
+        try:
+            delete(resource_id)
+            error = None
+        except Exception as e:
+            error = describe_error(e)
+        return CleanupResult(resource_type, resource_id, error, time.monotonic() - start)
+
+    def _record(self, result):
+        with self._lock:
+            self.results.append(result)
+        print(result)
+
+    def report(self):
+        failures = [r for r in self.results if not r.ok]
+        print()
+        print(f"Cleanup processed {len(self.results)} resources, {len(failures)} failed")
+        for result in failures:
+            print(f"\t {result}")
+        return not failures
+
+
+def describe_error(e):
+    response = getattr(e, "response", None)
+    if response and "Error" in response:
+        return response["Error"].get("Code", str(e))
+    return str(e) or e.__class__.__name__
@@ -0,0 +1,38 @@
+import threading
+
+import boto3
+import botocore.config
+
+# Python Module handing out AWS clients from one shared session
+
+# Credentials are resolved once, each (service, region) client is built
+# once and then shared between helpers and worker threads (boto3 clients
+# are thread safe, sessions are not, so creation is serialised). All
+# clients use a connection pool sized for concurrent work, adaptive
+# retries and TCP keep-alive.
+
+
+class ClientFactory:
+    def __init__(self, session=None, region_name=None, max_pool_connections=50, max_attempts=10,
+                 retry_mode="adaptive", tcp_keepalive=True):
+        self.session = session or boto3.session.Session(region_name=region_name)
+        self.config = botocore.config.Config(
+            max_pool_connections=max_pool_connections,
+            retries={"mode": retry_mode, "max_attempts": max_attempts},
+            tcp_keepalive=tcp_keepalive,
+        )
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, service_name, region_name=None, **kwargs):
+        region_name = region_name or self.session.region_name
+        key = (service_name, region_name)
+        with self._lock:
+            if key not in self._clients:
+                config = self.config.merge(kwargs.pop("config")) if "config" in kwargs else self.config
+                self._clients[key] = self.session.client(
+                    service_name, region_name=region_name, config=config, **kwargs)
+            return self._clients[key]
+
+    def get_available_regions(self, service_name):
+        return self.session.get_available_regions(service_name)
@@ -0,0 +1,205 @@
+import random
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlparse
+
+import boto3
+import botocore
+
+# Python Modules with a series of useful helper methods
+# for putting an Amazon CloudFront distribution in front of MediaPackage
+
+# Distributions take several minutes to deploy, so create_async() returns
+# straight away with a Future that resolves to the CDN playback URL once
+# the distribution is usable, leaving the rest of the pipeline to carry on.
+# Distributions are found again through the Comment they were created with
+# and confirmed with their 'project' tag.
+
+# Live manifests change every segment and must only be cached briefly,
+# segments never change once written and can be cached for as long as
+# CloudFront likes.
+MANIFEST_PATTERNS = ("*.m3u8", "*.mpd")
+SEGMENT_TTL = {"MinTTL": 0, "DefaultTTL": 86400, "MaxTTL": 31536000}
+
+# Query strings MediaPackage uses to select renditions or time windows
+QUERY_STRING_KEYS = ["aws.manifestfilter", "start", "end", "m"]
+
+# Regions Origin Shield runs in, and the one CloudFront recommends for
+# origins in other regions. Origins anywhere else go without it.
+ORIGIN_SHIELD_REGIONS = ("us-east-1", "us-east-2", "us-west-2", "ap-south-1", "ap-northeast-1", "ap-northeast-2",
+                         "ap-southeast-1", "ap-southeast-2", "eu-central-1", "eu-west-1", "eu-west-2", "sa-east-1")
+NEAREST_ORIGIN_SHIELD_REGION = {
+    "us-west-1": "us-west-2",
+    "ca-central-1": "us-east-1",
+    "af-south-1": "eu-west-1",
+    "ap-east-1": "ap-southeast-1",
+    "ap-northeast-3": "ap-northeast-1",
+    "ap-southeast-3": "ap-southeast-1",
+    "eu-south-1": "eu-central-1",
+    "eu-west-3": "eu-west-2",
+    "eu-north-1": "eu-west-2",
+    "me-south-1": "ap-south-1",
+}
+
+
+def nearest_origin_shield_region(region_name):
+    # The Origin Shield region closest to an origin in region_name, None if there is none
+    if region_name in ORIGIN_SHIELD_REGIONS:
+        return region_name
+    return NEAREST_ORIGIN_SHIELD_REGION.get(region_name)
+
+
+class CloudFrontHelper:
+    def __init__(self, resource_prefix, tags, origin_shield_region, latency_profile, session=None,
+                 poll_interval=20, timeout=1800):
+        self.client = (session or boto3).client('cloudfront')
+        self.resource_prefix = resource_prefix
+        self.tags = tags
+        # Origin Shield is best placed in (or next to) the region the origin runs in
+        self.origin_shield_region = nearest_origin_shield_region(origin_shield_region)
+        if self.origin_shield_region is None:
+            print(f"Origin Shield isn't available near {origin_shield_region}, "
+                  f"the distribution will fetch from the origin without it")
+        elif self.origin_shield_region != origin_shield_region:
+            print(f"Using Origin Shield in {self.origin_shield_region}, the nearest to {origin_shield_region}")
+        self.latency_profile = latency_profile
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.distribution_id = None
+        self.cdn_url = None
+
+    @property
+    def comment(self):
+        return f"{self.resource_prefix} live stream CDN"
+
+    def create_async(self, origin_url):
+        # Reuses this pipeline's distribution if there already is one
+        existing = self.list_distribution_ids()
+        if existing:
+            self.distribution_id = existing[0]
+            response = self.client.get_distribution(Id=self.distribution_id)
+            print(f"Using existing CloudFront distribution with ID: {self.distribution_id}")
+        else:
+            response = self.client.create_distribution_with_tags(DistributionConfigWithTags={
+                "DistributionConfig": self._distribution_config(origin_url),
+                "Tags": {"Items": [{"Key": k, "Value": v} for k, v in self.tags.items()]},
+            })
+            self.distribution_id = response["Distribution"]["Id"]
+            print(f"Created CloudFront distribution with ID: {self.distribution_id}")
+        domain_name = response["Distribution"]["DomainName"]
+        playback_url = f"https://{domain_name}{urlparse(origin_url).path}"
+
+        future = Future()
+        threading.Thread(target=self._report_deployed, args=(self.distribution_id, playback_url, future),
+                         daemon=True).start()
+        return future
+
+    def _report_deployed(self, distribution_id, playback_url, future):
+        try:
+            elapsed = self._wait_deployed(distribution_id)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        self.cdn_url = playback_url
+        print(f"CloudFront distribution {distribution_id} deployed after {elapsed:.0f}s")
+        future.set_result(playback_url)
+
+    def _wait_deployed(self, distribution_id):
+        start = time.monotonic()
+        while True:
+            status = self.client.get_distribution(Id=distribution_id)["Distribution"]["Status"]
+            if status == "Deployed":
+                return time.monotonic() - start
+            if time.monotonic() - start > self.timeout:
+                raise TimeoutError(f"CloudFront distribution {distribution_id} still {status} after {self.timeout}s")
+            time.sleep(self.poll_interval * random.uniform(0.75, 1.25))
+
+    def _distribution_config(self, origin_url):
+        origin_id = f"{self.resource_prefix}_mediapackage"
+        manifest_ttl = max(1, self.latency_profile.segment_seconds // 2)
+        return {
+            "CallerReference": f"{self.resource_prefix}-{time.time()}",
+            "Comment": self.comment,
+            "Enabled": True,
+            "HttpVersion": "http2and3",
+            "IsIPV6Enabled": True,
+            "PriceClass": "PriceClass_100",
+            "Origins": {"Quantity": 1, "Items": [{
+                "Id": origin_id,
+                "DomainName": urlparse(origin_url).hostname,
+                "OriginPath": "",
+                "CustomOriginConfig": {
+                    "HTTPPort": 80,
+                    "HTTPSPort": 443,
+                    "OriginProtocolPolicy": "https-only",
+                    "OriginSslProtocols": {"Quantity": 1, "Items": ["TLSv1.2"]},
+                },
+                "OriginShield": self._origin_shield(),
+            }]},
+            # Segments
+            "DefaultCacheBehavior": self._cache_behavior(origin_id, compress=False, **SEGMENT_TTL),
+            # Manifests, cached for at most one segment duration
+            "CacheBehaviors": {"Quantity": len(MANIFEST_PATTERNS), "Items": [
+                dict(self._cache_behavior(origin_id, compress=True, MinTTL=0, DefaultTTL=manifest_ttl,
+                                          MaxTTL=self.latency_profile.segment_seconds), PathPattern=pattern)
+                for pattern in MANIFEST_PATTERNS
+            ]},
+            # Don't let a 404 from before the first segment was packaged linger
+            "CustomErrorResponses": {"Quantity": 1, "Items": [{"ErrorCode": 404, "ErrorCachingMinTTL": 1}]},
+        }
+
+    def _origin_shield(self):
+        if self.origin_shield_region is None:
+            return {"Enabled": False}
+        return {"Enabled": True, "OriginShieldRegion": self.origin_shield_region}
+
+    @staticmethod
+    def _cache_behavior(origin_id, compress, **ttl):
+        return dict(
+            TargetOriginId=origin_id,
+            ViewerProtocolPolicy="redirect-to-https",
+            AllowedMethods={"Quantity": 2, "Items": ["GET", "HEAD"],
+                            "CachedMethods": {"Quantity": 2, "Items": ["GET", "HEAD"]}},
+            Compress=compress,
+            ForwardedValues={
+                "QueryString": True,
+                "QueryStringCacheKeys": {"Quantity": len(QUERY_STRING_KEYS), "Items": QUERY_STRING_KEYS},
+                "Cookies": {"Forward": "none"},
+                "Headers": {"Quantity": 0},
+            },
+            **ttl,
+        )
+
+    def list_distribution_ids(self):
+        ids = []
+        for page in self.client.get_paginator("list_distributions").paginate():
+            for item in page["DistributionList"].get("Items", []):
+                if item["Comment"] != self.comment:
+                    continue
+                tags = self.client.list_tags_for_resource(Resource=item["ARN"])["Tags"].get("Items", [])
+                if {t["Key"]: t["Value"] for t in tags}.get("project") == self.tags["project"]:
+                    ids.append(item["Id"])
+        return ids
+
+    def cleanup(self):
+        for distribution_id in self.list_distribution_ids():
+            try:
+                self.delete_distribution(distribution_id)
+            except botocore.exceptions.ClientError as e:
+                print(e.response['Error']['Code'])
+
+    def delete_distribution(self, distribution_id):
+        # Only a disabled, fully deployed distribution can be deleted, and
+        # every change has to quote the ETag of the config it replaces
+        response = self.client.get_distribution_config(Id=distribution_id)
+        config, etag = response["DistributionConfig"], response["ETag"]
+        if config["Enabled"]:
+            print(f"Disabling CloudFront distribution with ID: {distribution_id}")
+            config["Enabled"] = False
+            etag = self.client.update_distribution(
+                Id=distribution_id, IfMatch=etag, DistributionConfig=config)["ETag"]
+        print(f"Waiting for CloudFront distribution {distribution_id} to finish deploying...")
+        self._wait_deployed(distribution_id)
+        print(f"Deleting CloudFront distribution with ID: {distribution_id}")
+        self.client.delete_distribution(Id=distribution_id, IfMatch=etag)
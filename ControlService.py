@@ -0,0 +1,447 @@
+import itertools
+import json
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import AbrLadder
+import ChannelWaiter
+import CleanupEngine
+import ClientFactory
+import LatencyProfiles
+import MediaLiveHelper
+import MediaPackageHelper
+import PackagingFormats
+import ProvisioningJournal
+import RateLimiter
+import Reconciler
+import ResourceIndex
+
+# Python Module running the pipeline operations as a long-lived local service
+
+# A scheduler talks to it over a small JSON API instead of starting a new
+# process per operation:
+#
+#   POST /pipelines/<name>/create   body: {"latency_profile": "low", "packaging": ["cmaf"], "start": false, ...}
+#   POST /pipelines/<name>/start    (also stop and cleanup)
+#   GET  /pipelines[/<name>]        cached state of the pipelines this service knows
+#   GET  /jobs[/<id>]               job status to poll
+#
+# POSTs return 202 with a job straight away and the job runs on a bounded
+# worker pool. A request for an operation already queued or running on the
+# same pipeline, with nothing queued after it, gets that job back instead of
+# a new one (its body is ignored). Jobs for one pipeline run one at a time
+# in the order they were queued. AWS clients, the rate limiter, the channel
+# state poller, the IAM role and every pipeline's helpers (with the resource
+# IDs they found) are kept between requests.
+
+OPERATIONS = ("create", "start", "stop", "cleanup")
+
+# Keys a create request body may set, with their defaults coming from the service
+CREATE_SETTINGS = ("security_cidr", "latency_profile", "packaging", "standby", "ladder")
+
+# Finished jobs kept for polling, oldest forgotten first
+MAX_JOBS = 1000
+
+# Seconds a pipeline's channel state is served from cache before it is described again
+STATE_TTL = 5.0
+
+PIPELINE_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class Job:
+    def __init__(self, job_id, pipeline, op, body):
+        self.id = job_id
+        self.pipeline = pipeline
+        self.op = op
+        self.body = body
+        self.state = "queued"
+        self.result = None
+        self.error = None
+        # Requests answered with this job rather than a new one
+        self.coalesced = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.state in ("succeeded", "failed")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "pipeline": self.pipeline,
+            "op": self.op,
+            "state": self.state,
+            "result": self.result,
+            "error": self.error,
+            "coalesced": self.coalesced,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class Pipeline:
+    def __init__(self, name):
+        self.name = name
+        self.settings = None
+        self.media_live_helper = None
+        self.media_package_helper = None
+        self.journal = None
+        self.state = None
+        self.state_time = 0.0
+        self.origin_urls = {}
+        self.input_destinations = []
+        # Latest job id per operation
+        self.jobs = {}
+        # Jobs waiting for the running one to finish, in arrival order
+        self.queue = deque()
+        self.running = None
+        # Held by the running job or a status refresh, so the two never overlap
+        self.lock = threading.Lock()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "channel_id": self.media_live_helper.channel_id if self.media_live_helper else None,
+            "state": self.state,
+            "origin_urls": self.origin_urls,
+            "input_destinations": self.input_destinations,
+            "jobs": self.jobs,
+        }
+
+
+class ControlService:
+    def __init__(self, session=None, max_workers=8, rate_limiter=None, index_path=ResourceIndex.DEFAULT_PATH,
+                 journal_dir=ProvisioningJournal.DEFAULT_DIRECTORY, defaults=None):
+        self.session = session or ClientFactory.ClientFactory(max_pool_connections=max(50, 4 * max_workers))
+        self.rate_limiter = rate_limiter or RateLimiter.RateLimiter()
+        self.waiter = ChannelWaiter.ChannelWaiter(self.session.client("medialive"))
+        self.rate_limiter.attach(self.waiter.client)
+        self.rate_limiter.attach(self.session.client("mediapackage"))
+        self.region_name = self.waiter.client.meta.region_name
+        self.index_path = index_path
+        self.journal_dir = journal_dir
+        self.defaults = dict({"security_cidr": "0.0.0.0/0", "latency_profile": "standard", "packaging": ["hls"],
+                              "standby": None, "ladder": "standard"}, **(defaults or {}))
+        self.role_arn = None
+        self.pipelines = {}
+        self.jobs = OrderedDict()
+        self._in_flight = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        # Handed to the pool but maybe not started yet, cancelled on shutdown
+        self._futures = set()
+
+    def submit(self, name, op, body=None):
+        # Queues op on the pipeline, or returns the job already doing it
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{op}', expected one of {list(OPERATIONS)}")
+        body = dict(body or {})
+        if op == "create":
+            self._check_create(body)
+        with self._lock:
+            pipeline = self._pipeline(name)
+            job = self._in_flight.get((name, op))
+            # Only the pipeline's latest job can stand in for a new request,
+            # a start queued before a stop doesn't satisfy a start sent after it
+            latest = pipeline.queue[-1] if pipeline.queue else pipeline.running
+            if job is not None and job is latest:
+                job.coalesced += 1
+                return job, True
+            job = Job(str(next(self._ids)), name, op, body)
+            self.jobs[job.id] = job
+            self._in_flight[(name, op)] = job
+            pipeline.jobs[op] = job.id
+            pipeline.queue.append(job)
+            self._forget_jobs()
+            self._dispatch(pipeline)
+        return job, False
+
+    def job(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self._lock:
+            return list(self.jobs.values())
+
+    def status(self, name):
+        # Cached state of a pipeline this service has had a job for, None for
+        # any other. The channel state is refreshed once older than STATE_TTL.
+        with self._lock:
+            pipeline = self.pipelines.get(name)
+        if pipeline is None:
+            return None
+        if time.monotonic() - pipeline.state_time > STATE_TTL:
+            self._refresh_state(pipeline)
+        return pipeline.to_dict()
+
+    def list_pipelines(self):
+        with self._lock:
+            return [p.to_dict() for p in self.pipelines.values()]
+
+    def shutdown(self):
+        # Waits for running jobs, queued ones are dropped
+        with self._lock:
+            self._closed = True
+            # cancel_futures needs Python 3.9, cancel() only succeeds on jobs that haven't started
+            for future in list(self._futures):
+                future.cancel()
+        self._pool.shutdown(wait=True)
+
+    def _check_create(self, body):
+        unknown = set(body) - set(CREATE_SETTINGS) - {"start"}
+        if unknown:
+            raise ValueError(f"Unknown create settings {sorted(unknown)}, expected some of "
+                             f"{list(CREATE_SETTINGS) + ['start']}")
+        settings = self._settings(body)
+        LatencyProfiles.get_profile(settings["latency_profile"])
+        AbrLadder.get_ladder(settings["ladder"])
+
+    def _settings(self, body):
+        settings = {k: body.get(k, self.defaults[k]) for k in CREATE_SETTINGS}
+        settings["packaging"] = PackagingFormats.parse_packaging(settings["packaging"])
+        return settings
+
+    def _pipeline(self, name):
+        # Called with the lock held
+        if not PIPELINE_NAME.match(name or ""):
+            raise ValueError(f"Invalid pipeline name '{name}'")
+        pipeline = self.pipelines.get(name)
+        if pipeline is None:
+            pipeline = self.pipelines[name] = Pipeline(name)
+        return pipeline
+
+    def _forget_jobs(self):
+        # Called with the lock held
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self.jobs) - MAX_JOBS)]:
+            del self.jobs[job_id]
+
+    def _dispatch(self, pipeline):
+        # Called with the lock held. Only one job per pipeline is ever handed
+        # to the pool, so waiting jobs don't tie up workers other pipelines need.
+        if pipeline.running is None and pipeline.queue and not self._closed:
+            pipeline.running = pipeline.queue.popleft()
+            future = self._pool.submit(self._run, pipeline, pipeline.running)
+            self._futures.add(future)
+            future.add_done_callback(self._futures.discard)
+
+    def _run(self, pipeline, job):
+        with pipeline.lock:
+            with self._lock:
+                job.state = "running"
+                job.started = time.time()
+            print(f"Job {job.id}: {job.op} {pipeline.name}")
+            try:
+                result = getattr(self, f"_{job.op}")(pipeline, job.body)
+                state, error = "succeeded", None
+            except (Exception, SystemExit) as e:
+                # SystemExit comes from helpers written for the command line
+                result, state, error = None, "failed", CleanupEngine.describe_error(e) or repr(e)
+            with self._lock:
+                job.result = result
+                job.error = error
+                job.state = state
+                job.finished = time.time()
+                if self._in_flight.get((pipeline.name, job.op)) is job:
+                    del self._in_flight[(pipeline.name, job.op)]
+            print(f"Job {job.id}: {job.op} {pipeline.name} {state} in {job.finished - job.started:.1f}s"
+                  + (f" ({error})" if error else ""))
+        with self._lock:
+            pipeline.running = None
+            self._dispatch(pipeline)
+
+    def _helpers(self, pipeline, settings=None):
+        # The pipeline's helpers, rebuilt only when a create asks for different settings
+        if settings is None:
+            settings = pipeline.settings or self._settings({})
+        if pipeline.media_live_helper is not None and settings == pipeline.settings:
+            return pipeline.media_live_helper, pipeline.media_package_helper
+        name = pipeline.name
+        tags = {"project": name}
+        index = ResourceIndex.ResourceIndex(name, self.region_name, self.index_path) if self.index_path else None
+        media_package_helper = MediaPackageHelper.MediaPackageHelper(
+            resource_prefix=name,
+            tags=tags,
+            latency_profile=settings["latency_profile"],
+            session=self.session,
+            index=index,
+            packaging=settings["packaging"])
+        media_live_helper = MediaLiveHelper.MediaLiveHelper(
+            security_cidr=settings["security_cidr"],
+            media_package_channel_id=media_package_helper.channel_id,
+            resource_prefix=name,
+            tags=tags,
+            waiter=self.waiter,
+            latency_profile=settings["latency_profile"],
+            session=self.session,
+            index=index,
+            standby=settings["standby"],
+            ladder=settings["ladder"])
+        if pipeline.media_live_helper is not None:
+            media_live_helper.channel_id = pipeline.media_live_helper.channel_id
+        if self.role_arn:
+            # A cached_property, so this stands in for the IAM lookup
+            media_live_helper.get_medialive_role_arn = self.role_arn
+        pipeline.settings = settings
+        pipeline.media_live_helper = media_live_helper
+        pipeline.media_package_helper = media_package_helper
+        pipeline.journal = ProvisioningJournal.ProvisioningJournal(name, self.region_name, self.journal_dir)
+        return media_live_helper, media_package_helper
+
+    def _create(self, pipeline, body):
+        # Idempotent, so a repeated create only starts what is missing
+        media_live_helper, media_package_helper = self._helpers(pipeline, self._settings(body))
+        self.role_arn = media_live_helper.get_medialive_role_arn
+        Reconciler.Reconciler(media_live_helper, media_package_helper, pipeline.journal).apply(start=False)
+        pipeline.origin_urls = dict(media_package_helper.origin_urls)
+        pipeline.input_destinations = media_live_helper.input_destinations
+        if body.get("start", True):
+            return self._start(pipeline, body)
+        self._set_state(pipeline, self.waiter.wait(media_live_helper.channel_id, ("IDLE", "RUNNING")))
+        return self._result(pipeline)
+
+    def _start(self, pipeline, body):
+        media_live_helper, _ = self._helpers(pipeline)
+        media_live_helper.start_channel()
+        self._set_state(pipeline, self.waiter.wait(media_live_helper.channel_id, ("RUNNING",)))
+        return self._result(pipeline)
+
+    def _stop(self, pipeline, body):
+        media_live_helper, _ = self._helpers(pipeline)
+        media_live_helper.stop_channel()
+        self._set_state(pipeline, "IDLE")
+        return self._result(pipeline)
+
+    def _cleanup(self, pipeline, body):
+        media_live_helper, media_package_helper = self._helpers(pipeline)
+        engine = CleanupEngine.CleanupEngine()
+        engine.run([media_live_helper], [media_package_helper])
+        if not engine.report():
+            failures = [str(r) for r in engine.results if not r.ok]
+            raise RuntimeError(f"{len(failures)} resources failed to delete: {'; '.join(failures)}")
+        pipeline.journal.archive()
+        # Nothing left to remember, the next create starts afresh
+        pipeline.media_live_helper = pipeline.media_package_helper = pipeline.settings = None
+        pipeline.origin_urls = {}
+        pipeline.input_destinations = []
+        self._set_state(pipeline, "DELETED")
+        return {"deleted": [f"{r.resource_type} {r.resource_id}" for r in engine.results]}
+
+    def _result(self, pipeline):
+        return {"channel_id": pipeline.media_live_helper.channel_id, "state": pipeline.state,
+                "origin_urls": pipeline.origin_urls, "input_destinations": pipeline.input_destinations}
+
+    def _set_state(self, pipeline, state):
+        pipeline.state = state
+        pipeline.state_time = time.monotonic()
+
+    def _refresh_state(self, pipeline):
+        if not pipeline.lock.acquire(blocking=False):
+            # A job is changing it and sets it when done
+            return
+        try:
+            media_live_helper, media_package_helper = self._helpers(pipeline)
+            try:
+                channel_id = media_live_helper.get_channel_id()
+                state = self.waiter.client.describe_channel(ChannelId=channel_id)["State"]
+            except Exception:
+                # Either never created or already gone
+                media_live_helper.channel_id = None
+                state = "NOT_FOUND" if pipeline.state != "DELETED" else "DELETED"
+            if state not in ("NOT_FOUND", "DELETED") and not pipeline.origin_urls:
+                try:
+                    media_package_helper.get_origin_url()
+                    pipeline.origin_urls = dict(media_package_helper.origin_urls)
+                except Exception:
+                    pass
+            self._set_state(pipeline, state)
+        finally:
+            pipeline.lock.release()
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "ElementalDemo"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def do_GET(self):
+        parts = self._parts()
+        if parts == ["pipelines"]:
+            return self._send(200, {"pipelines": self.service.list_pipelines()})
+        if len(parts) == 2 and parts[0] == "pipelines":
+            status = self.service.status(parts[1])
+            if status is None:
+                return self._send(404, {"error": f"No pipeline {parts[1]}"})
+            return self._send(200, status)
+        if parts == ["jobs"]:
+            return self._send(200, {"jobs": [job.to_dict() for job in self.service.list_jobs()]})
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self.service.job(parts[1])
+            if job is None:
+                return self._send(404, {"error": f"No job {parts[1]}"})
+            return self._send(200, job.to_dict())
+        self._send(404, {"error": f"No route for GET {self.path}"})
+
+    def do_POST(self):
+        parts = self._parts()
+        if len(parts) != 3 or parts[0] != "pipelines":
+            return self._send(404, {"error": f"No route for POST {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            if not isinstance(body, dict):
+                raise ValueError("The request body must be a JSON object")
+            job, coalesced = self.service.submit(parts[1], parts[2], body)
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        self._send(202, dict(job.to_dict(), coalesced_request=coalesced), {"Location": f"/jobs/{job.id}"})
+
+    def _parts(self):
+        return [p for p in self.path.split("?", 1)[0].split("/") if p]
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload, indent=2).encode() + b"\n"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_request(self, code="-", size="-"):
+        # Job progress is printed by the service, requests only when they fail
+        if not isinstance(code, int) or code >= 400:
+            super().log_request(code, size)
+
+
+def make_server(service, host="127.0.0.1", port=8750):
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(service, host="127.0.0.1", port=8750):
+    server = make_server(service, host, port)
+    print(f"Control service listening on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Shutting down, waiting for running jobs...")
+        server.server_close()
+        service.shutdown()
@@ -1,46 +1,667 @@
 #!/usr/bin/env python3
 
 import sys
-import boto3
-import botocore
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import click
 
-import MediaLiveHelper
-import MediaPackageHelper
+import AbrLadder
+import CleanupEngine
+import Instrumentation
+import LatencyProfiles
+import PackagingFormats
+import ProvisioningJournal
+import RateLimiter
+import ResourceIndex
+
+# boto3/botocore and the modules built on them (ClientFactory, Fleet and the
+# helpers) take most of the start-up time, so they are only imported on the
+# code paths that talk to AWS. StartupBenchmark.py guards this.
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option("--pipeline-name", default="elementalTest", help="Resources created will be tagged as project:$pipeline-name")
 @click.option("--security-cidr", default="0.0.0.0/0", help="Specify a CIDR range that is allowed to send traffic to the RTMP endpoint")
 @click.option("--cleanup", is_flag=True, help="Cleanup the resources created by this script based on the given pipeline-name")
-def main(pipeline_name, security_cidr, cleanup):
+@click.option("--server-side-discovery", is_flag=True, help="Find tagged MediaLive resources through the Resource Groups Tagging API instead of listing them")
+@click.option("--parallel", is_flag=True, help="Delete independent resources concurrently during --cleanup")
+@click.option("--max-workers", default=8, show_default=True, help="Number of concurrent workers used by --parallel and --manifest")
+@click.option("--manifest", type=click.Path(exists=True, dir_okay=False), help="Provision (or with --cleanup, delete) every pipeline listed in this JSON/YAML manifest")
+@click.option("--rate-limit", default=5.0, show_default=True, help="Initial AWS API requests per second shared by all --manifest workers")
+@click.option("--latency-profile", type=click.Choice(list(LatencyProfiles.PROFILES)), default="standard", show_default=True, help="Trade stream robustness for lower glass-to-glass latency")
+@click.option("--measure-latency", is_flag=True, help="Measure the live-edge delay of the running pipeline's HLS endpoint instead of creating it")
+@click.option("--metrics", type=click.Choice(["json", "prometheus"]), help="Record AWS API and phase timings and write them out in this format when finished")
+@click.option("--metrics-file", default="-", show_default=True, help="Where --metrics are written, - for stdout")
+@click.option("--max-pool-connections", default=50, show_default=True, help="HTTP connections kept open per AWS client")
+@click.option("--apply", is_flag=True, help="Create only what is missing, update what has drifted and adopt what already exists")
+@click.option("--rollback", is_flag=True, help="Delete exactly the resources recorded in the pipeline's provisioning journal")
+@click.option("--prune", is_flag=True, help="With --apply, also delete tagged MediaLive resources the journal doesn't own")
+@click.option("--journal-dir", default=ProvisioningJournal.DEFAULT_DIRECTORY, show_default=True, help="Where provisioning journals are kept")
+@click.option("--index-path", default=ResourceIndex.DEFAULT_PATH, show_default=True, help="Local cache of resource IDs used to skip discovery calls")
+@click.option("--no-index", is_flag=True, help="Neither read nor update the local resource ID cache")
+@click.option("--inventory", is_flag=True, help="List the pipeline's resources in every --regions region (with --cleanup, delete them)")
+@click.option("--regions", default="", help="Comma separated regions for --inventory, 'all' for every MediaLive region, the default region if empty")
+@click.option("--all-projects", is_flag=True, help="Make --inventory match every 'project' tagged resource, not just --pipeline-name")
+@click.option("--packaging", default="hls", show_default=True, callback=lambda ctx, param, value: _check_packaging(value), help="Comma separated origin endpoints to create: hls, cmaf (HLS over fMP4) and/or dash")
+@click.option("--cdn", is_flag=True, help="Serve the stream through a CloudFront distribution (with --cleanup, delete it)")
+@click.option("--warm-pool", help="Claim an idle pipeline from this warm pool instead of creating one, then refill the pool")
+@click.option("--pool-size", default=2, show_default=True, help="Idle pipelines the --warm-pool is refilled to")
+@click.option("--ladder", default="standard", show_default=True, callback=lambda ctx, param, value: _check_ladder(value), help=f"ABR ladder to encode: {', '.join(AbrLadder.LADDERS)} or a spec like 1080p:4M:9,720p:2M,360p:600k (height, bitrate, optional QVBR level)")
+@click.option("--standby", help="Also attach a standby input to switch to: 'rtmp' for a backup encoder, or the URL of an MP4 slate to loop")
+@click.pass_context
+def main(ctx, pipeline_name, security_cidr, cleanup, server_side_discovery, parallel, max_workers, manifest,
+         rate_limit, latency_profile, measure_latency, metrics, metrics_file, max_pool_connections, apply, rollback,
+         prune, journal_dir, index_path, no_index, inventory, regions, all_projects, packaging, cdn, warm_pool,
+         pool_size, ladder, standby):
+    if warm_pool and apply:
+        raise click.UsageError("--warm-pool can't be combined with --apply")
+    if warm_pool and standby:
+        raise click.UsageError("--warm-pool pipelines have no standby input")
+    if warm_pool and ladder != "standard":
+        raise click.UsageError("--warm-pool pipelines are encoded with the standard --ladder")
+    instrumentation = Instrumentation.Instrumentation()
+    session = LazySession(max_pool_connections, instrumentation if metrics else None)
+    index_path = None if no_index else index_path
+    if metrics:
+        # Written once the command (or subcommand) finishes, including failed runs
+        ctx.call_on_close(lambda: instrumentation.write(metrics, metrics_file))
+
+    if ctx.invoked_subcommand is not None:
+        ctx.obj = {"pipeline_name": pipeline_name, "manifest": manifest, "max_workers": max_workers,
+                   "latency_profile": latency_profile, "packaging": packaging.split(","),
+                   "security_cidr": security_cidr, "session": session, "instrumentation": instrumentation,
+                   "index_path": index_path, "ladder": ladder, "journal_dir": journal_dir,
+                   "rate_limit": rate_limit, "standby": standby}
+    elif inventory:
+        project = None if all_projects else pipeline_name
+        inventory_main(project, regions, cleanup, max_workers, session, instrumentation)
+    elif manifest:
+        fleet_main(manifest, cleanup, server_side_discovery, max_workers, rate_limit, session, instrumentation,
+                   index_path)
+    else:
+        return pipeline_main(pipeline_name, security_cidr, cleanup, server_side_discovery, parallel,
+                             max_workers, latency_profile, measure_latency, session, instrumentation, apply,
+                             rollback, prune, journal_dir, index_path, packaging.split(","), cdn, warm_pool,
+                             pool_size, standby, ladder)
+
+
+@main.command()
+@click.option("--pipelines", help="Comma separated pipeline names, by default --pipeline-name or every pipeline in --manifest")
+@click.option("--interval", default=60.0, show_default=True, help="Seconds between refreshes, each one a single GetMetricData call")
+@click.option("--period", default=60, show_default=True, help="CloudWatch period the metrics are aggregated over, in seconds")
+@click.option("--history", default=60, show_default=True, help="Datapoints kept in memory per metric")
+@click.option("--output", type=click.Choice(["table", "json"]), default="table", show_default=True, help="A refreshing table or one JSON line per pipeline and refresh")
+@click.option("--count", default=0, show_default=True, help="Stop after this many refreshes, 0 to run until interrupted")
+@click.pass_obj
+def monitor(obj, pipelines, interval, period, history, output, count):
+    """Watch the health of running pipelines through CloudWatch metrics."""
+    if pipelines:
+        names = [p.strip() for p in pipelines.split(",") if p.strip()]
+    elif obj["manifest"]:
+        import Fleet
+
+        names = [p["name"] for p in Fleet.load_manifest(obj["manifest"])]
+    else:
+        names = [obj["pipeline_name"]]
+    monitor_main(names, interval, period, history, output, count, obj["max_workers"], obj["session"],
+                 obj["index_path"])
+
+
+def _check_ladder(value):
+    try:
+        AbrLadder.get_ladder(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    return value
+
+
+def _check_packaging(value):
+    try:
+        return ",".join(PackagingFormats.parse_packaging(value))
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+class LazySession:
+    # Stands in for the session until a client is first asked for, so that
+    # commands which never talk to AWS don't import boto3 at all
+    def __init__(self, max_pool_connections, instrumentation=None):
+        self.max_pool_connections = max_pool_connections
+        self.instrumentation = instrumentation
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        with self._lock:
+            if self._session is None:
+                self._session = create_session(self.max_pool_connections, self.instrumentation)
+            return self._session
+
+    def client(self, *args, **kwargs):
+        return self._resolve().client(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+
+def create_session(max_pool_connections, instrumentation=None):
+    import ClientFactory
+
+    session = ClientFactory.ClientFactory(max_pool_connections=max_pool_connections)
+    if instrumentation is not None:
+        session = instrumentation.session(session)
+    return session
+
+
+def pipeline_main(pipeline_name, security_cidr, cleanup, server_side_discovery, parallel, max_workers,
+                  latency_profile, measure_latency, session, instrumentation, apply=False, rollback=False,
+                  prune=False, journal_dir=ProvisioningJournal.DEFAULT_DIRECTORY, index_path=None, packaging=("hls",),
+                  cdn=False, warm_pool=None, pool_size=2, standby=None, ladder="standard"):
+    import CloudFrontHelper
+    import MediaLiveHelper
+    import MediaPackageHelper
+    import Reconciler
+
     tags = {"project": pipeline_name}
+    region_name = session.client("medialive").meta.region_name
+    index = ResourceIndex.ResourceIndex(pipeline_name, region_name, index_path) if index_path else None
 
     media_package_helper = MediaPackageHelper.MediaPackageHelper(
         resource_prefix=pipeline_name,
-        tags=tags)
+        tags=tags,
+        latency_profile=latency_profile,
+        session=session,
+        index=index,
+        packaging=packaging)
+    if measure_latency:
+        print_latency(media_package_helper.get_origin_url(), LatencyProfiles.get_profile(latency_profile))
+        return
+
     media_live_helper = MediaLiveHelper.MediaLiveHelper(
         security_cidr=security_cidr,
         media_package_channel_id=media_package_helper.channel_id,
         resource_prefix=pipeline_name,
-        tags=tags)
+        tags=tags,
+        server_side_discovery=server_side_discovery,
+        latency_profile=latency_profile,
+        session=session,
+        index=index,
+        standby=standby,
+        ladder=ladder)
+    cloudfront_helpers = []
+    if cdn:
+        cloudfront_helpers.append(CloudFrontHelper.CloudFrontHelper(
+            pipeline_name, tags, region_name, LatencyProfiles.get_profile(latency_profile), session=session))
+    journal = ProvisioningJournal.ProvisioningJournal(pipeline_name, region_name, journal_dir)
+    reconciler = Reconciler.Reconciler(media_live_helper, media_package_helper, journal)
 
-    if cleanup:
+    if rollback:
+        print(f"Rolling back the resources recorded in {journal.path}...")
+        with instrumentation.span("rollback", pipeline=pipeline_name):
+            ok = reconciler.rollback()
+        if not ok:
+            sys.exit(1)
+        print("Rollback successful!")
+    elif cleanup and parallel:
+        print("Beginning parallel cleanup...")
+        engine = CleanupEngine.CleanupEngine(max_workers=max_workers)
+        with instrumentation.span("cleanup", pipeline=pipeline_name):
+            engine.run([media_live_helper], [media_package_helper], cloudfront_helpers)
+        if not engine.report():
+            sys.exit(1)
+        journal.archive()
+        print("Cleanup successful!")
+    elif cleanup:
         print("Beginning cleanup...")
-        media_live_helper.cleanup()
-        media_package_helper.cleanup()
+        with instrumentation.span("cleanup", pipeline=pipeline_name):
+            media_live_helper.cleanup()
+            media_package_helper.cleanup()
+            for cloudfront_helper in cloudfront_helpers:
+                cloudfront_helper.cleanup()
+        journal.archive()
         print("Cleanup successful!")
     else:
-        media_package_helper.create()
-        media_live_helper.create()
-        media_live_helper.start_channel()
+        graph = None
+        refill = None
+        if warm_pool:
+            import WarmPool
+
+            pool = WarmPool.WarmPool(warm_pool, pool_size, latency_profile, packaging, security_cidr,
+                                     session=session, waiter=media_live_helper.waiter, max_workers=max_workers)
+            with instrumentation.span("claim", pipeline=pipeline_name):
+                claimed = pool.claim(media_live_helper, media_package_helper)
+            if claimed:
+                reconciler.record_adopted()
+            else:
+                print(f"Warm pool '{warm_pool}' is empty, creating the pipeline from scratch")
+            # Refilled while this pipeline starts
+            refill = pool.fill_async()
+        if not warm_pool or not claimed:
+            with instrumentation.span("create", pipeline=pipeline_name):
+                if apply:
+                    graph = reconciler.apply(start=False, prune=prune)
+                else:
+                    graph = reconciler.create(start=False)
+        # CloudFront takes minutes to deploy, the channel starts in the meantime
+        cdn_futures = [h.create_async(media_package_helper.origin_url) for h in cloudfront_helpers]
+        with instrumentation.span("start", pipeline=pipeline_name):
+            media_live_helper.start_channel()
 
         print()
-        print(f"MediaPackage HLS Endpoint URL: {media_package_helper.origin_url}")
+        if graph is not None:
+            graph.print_timings()
+            print()
+        for packaging_format, url in media_package_helper.origin_urls.items():
+            print(f"MediaPackage {MediaPackageHelper.PACKAGING[packaging_format]} Endpoint URL: {url}")
         print("MediaLive Input Paramaters")
         destination = media_live_helper.input_destinations[0]
         for k, v in destination.items():
             print(f"\t {k}: {v}")
+        if standby == "rtmp":
+            print("MediaLive Standby Input Parameters")
+            for k, v in media_live_helper.standby_destinations[0].items():
+                print(f"\t {k}: {v}")
+
+        urls = dict(media_package_helper.origin_urls)
+        for future in cdn_futures:
+            print()
+            print("Waiting for the CloudFront distribution to deploy, the URLs above can be used until then...")
+            with instrumentation.span("cdn", pipeline=pipeline_name):
+                urls["cdn"] = future.result()
+            print(f"CloudFront URL: {urls['cdn']}")
+        if refill is not None:
+            print()
+            print(f"Waiting for warm pool '{warm_pool}' to be refilled...")
+            refill.result()
+        return urls
+
+
+def print_latency(url, profile):
+    result = LatencyProfiles.measure_latency(url)
+    print(f"Media playlist: {result['media_playlist']}")
+    print(f"Live-edge delay (median of {result['samples']} samples): {result['live_edge_delay']:.1f}s")
+    print(f"Estimated player latency: {result['estimated_player_latency']:.1f}s")
+    print(f"Expected for the '{profile.name}' latency profile: {profile.expected_latency():.1f}s")
+
+
+def inventory_main(project, regions, cleanup, max_workers, session, instrumentation):
+    import Inventory
+
+    if regions == "all":
+        regions = session.get_available_regions("medialive")
+    elif regions:
+        regions = [r.strip() for r in regions.split(",") if r.strip()]
+    else:
+        regions = [session.client("medialive").meta.region_name]
+
+    inventory = Inventory.Inventory(session, regions, project=project, max_workers=max_workers)
+    tag = f"project:{project}" if project else "project"
+    print(f"Listing {tag} tagged resources in {len(regions)} regions...")
+    with instrumentation.span("inventory", regions=len(regions)):
+        for item in inventory.scan():
+            print(item)
+    inventory.print_timings()
+
+    if cleanup and inventory.items:
+        print()
+        print(f"Beginning parallel cleanup of {len(inventory.items)} resources...")
+        engine = CleanupEngine.CleanupEngine(max_workers=max_workers)
+        with instrumentation.span("cleanup", regions=len(regions)):
+            engine.run_chains(inventory.cleanup_chains())
+        if not engine.report():
+            sys.exit(1)
+        print("Cleanup successful!")
+
+
+@main.command()
+@click.argument("action", type=click.Choice(["status", "fill", "drain"]))
+@click.option("--name", default="default", show_default=True, help="Warm pool to manage")
+@click.option("--size", default=2, show_default=True, help="Idle pipelines to keep in the pool")
+@click.pass_obj
+def pool(obj, action, name, size):
+    """Show, fill or drain a warm pool of idle pipelines.
+
+    Pool pipelines use the global --latency-profile, --packaging and --security-cidr.
+    """
+    import WarmPool
+
+    warm_pool = WarmPool.WarmPool(name, size, obj["latency_profile"], obj["packaging"], obj["security_cidr"],
+                                  session=obj["session"], max_workers=obj["max_workers"])
+    if action == "fill":
+        with obj["instrumentation"].span("fill", pool=name):
+            warm_pool.fill()
+    elif action == "drain":
+        with obj["instrumentation"].span("drain", pool=name):
+            if not warm_pool.drain():
+                sys.exit(1)
+    warm_pool.print_status()
+
+
+@main.command()
+@click.argument("action", type=click.Choice(["start", "stop"]))
+@click.option("--pipelines", help="Comma separated pipeline names, by default --pipeline-name or every pipeline in --manifest")
+@click.pass_obj
+def channels(obj, action, pipelines):
+    """Start or stop the MediaLive channels of many pipelines with batch requests."""
+    if pipelines:
+        names = [p.strip() for p in pipelines.split(",") if p.strip()]
+    elif obj["manifest"]:
+        import Fleet
+
+        names = [p["name"] for p in Fleet.load_manifest(obj["manifest"])]
+    else:
+        names = [obj["pipeline_name"]]
+    channels_main(action, names, obj["max_workers"], obj["session"], obj["instrumentation"], obj["index_path"])
+
+
+@main.command()
+@click.option("--bandwidths", help="Comma separated viewer bandwidths such as 1.5M,3M,8M, each an equal share of the audience")
+@click.option("--max-bitrate", help="With --bandwidths, also build a ladder for that audience topping out at this bitrate")
+@click.option("--max-rungs", default=4, show_default=True, help="Rungs of the ladder built for --bandwidths")
+@click.pass_obj
+def ladder(obj, bandwidths, max_bitrate, max_rungs):
+    """Show the --ladder renditions, or build a leaner ladder for an audience."""
+    if max_bitrate and not bandwidths:
+        raise click.UsageError("--max-bitrate needs --bandwidths")
+    try:
+        audience = [AbrLadder.parse_bitrate(b) for b in bandwidths.split(",")] if bandwidths else None
+        current = AbrLadder.get_ladder(obj["ladder"])
+        print_ladder(current, audience)
+        if max_bitrate:
+            proposed = AbrLadder.for_audience(AbrLadder.parse_bitrate(max_bitrate), audience, max_rungs=max_rungs)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    if max_bitrate:
+        print()
+        print_ladder(proposed, audience)
+        change = proposed.expected_bitrate(audience) / current.expected_bitrate(audience) - 1
+        print(f"Video egress per viewer {change:+.0%} compared to '{current.name}'")
+        print(f"Use it with --ladder {proposed.spec}")
+
+
+def print_ladder(abr_ladder, audience=None):
+    print(f"ABR ladder '{abr_ladder.name}': {abr_ladder.spec}")
+    print(f"\t {'rendition':<16} {'resolution':>10} {'bitrate':>8} {'max':>8} {'QVBR':>5} {'bits/px':>8}"
+          + (f" {'viewers':>8}" if audience else ""))
+    for rung in abr_ladder.rungs:
+        share = ""
+        if audience:
+            picked = sum(1 for b in audience if abr_ladder.rung_for(b) == rung) / len(audience)
+            share = f" {picked:>8.0%}"
+        print(f"\t {rung.name:<16} {f'{rung.width}x{rung.height}':>10} {AbrLadder.format_bitrate(rung.bitrate):>8} "
+              f"{AbrLadder.format_bitrate(rung.max_bitrate):>8} {rung.qvbr_quality_level:>5} "
+              f"{rung.bits_per_pixel:>8.3f}{share}")
+    if audience:
+        print(f"Mean video bitrate per viewer: {abr_ladder.expected_bitrate(audience) / 1e6:.2f} Mbps")
+
+
+@main.command()
+@click.argument("target", type=click.Choice(["primary", "standby"]))
+@click.option("--prepare", "prepare_only", is_flag=True, help="Only prepare TARGET, so that a later switch to it is fast")
+@click.option("--lead", default=10.0, show_default=True, help="Seconds to let TARGET decode before switching when it wasn't prepared")
+@click.option("--output", type=click.Choice(["table", "json"]), default="table", show_default=True, help="A summary or the report as JSON")
+@click.pass_obj
+def switch(obj, target, prepare_only, lead, output):
+    """Switch the running channel between its primary and standby inputs."""
+    switch_main(obj["pipeline_name"], target, prepare_only, lead, output, obj["latency_profile"], obj["session"],
+                obj["index_path"])
+
+
+@main.command()
+@click.option("--viewers", default=10, show_default=True, help="Concurrent viewers to simulate")
+@click.option("--duration", default=60.0, show_default=True, help="Seconds to keep the viewers watching")
+@click.option("--ramp-up", default=10.0, show_default=True, help="Seconds over which the viewers join")
+@click.option("--url", help="Master playlist to watch, by default the pipeline's MediaPackage HLS endpoint")
+@click.option("--local", is_flag=True, help="Watch canned playlists served from localhost instead, no AWS needed")
+@click.option("--output", type=click.Choice(["table", "json"]), default="table", show_default=True, help="A summary or the report as JSON")
+@click.pass_obj
+def loadtest(obj, viewers, duration, ramp_up, url, local, output):
+    """Simulate concurrent HLS viewers and report how the stream holds up."""
+    loadtest_main(obj["pipeline_name"], obj["latency_profile"], viewers, duration, ramp_up, url, local, output,
+                  obj["session"], obj["index_path"], obj["ladder"])
+
+
+@main.command()
+@click.option("--url", help="RTMP URL to publish to, by default the pipeline's MediaLive input")
+@click.option("--stream-name", help="Stream name to publish, by default the last part of the URL")
+@click.option("--file", "flv_path", type=click.Path(exists=True, dir_okay=False), help="Pre-encoded FLV file to stream, looped for --duration. By default a test pattern is encoded with ffmpeg")
+@click.option("--duration", default=60.0, show_default=True, help="Seconds of media to publish")
+@click.option("--local", is_flag=True, help="Publish to an RTMP stand-in on localhost instead, no AWS needed")
+@click.option("--output", type=click.Choice(["table", "json"]), default="table", show_default=True, help="A summary or the report as JSON")
+@click.pass_obj
+def publish(obj, url, stream_name, flv_path, duration, local, output):
+    """Stream a test source to the pipeline's RTMP input in real time."""
+    publish_main(obj["pipeline_name"], url, stream_name, flv_path, duration, local, output, obj["session"],
+                 obj["index_path"])
+
+
+def publish_main(pipeline_name, url, stream_name, flv_path, duration, local, output, session, index_path=None):
+    import json
+    import shutil
+    import tempfile
+
+    import RtmpPublisher
+
+    server = None
+    if local:
+        server = RtmpPublisher.LocalRtmpServer().start()
+        url = server.url
+    elif not url:
+        import MediaLiveHelper
+
+        region_name = session.client("medialive").meta.region_name
+        index = ResourceIndex.ResourceIndex(pipeline_name, region_name, index_path) if index_path else None
+        media_live_helper = MediaLiveHelper.MediaLiveHelper(
+            None, None, pipeline_name, {"project": pipeline_name}, session=session, index=index)
+        url = media_live_helper.get_input_destinations()[0]["Url"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        flv = None
+        if flv_path:
+            flv = RtmpPublisher.FlvFile(flv_path)
+        elif shutil.which("ffmpeg"):
+            print("Encoding a test pattern...", file=sys.stderr)
+            flv = RtmpPublisher.FlvFile(RtmpPublisher.test_pattern(f"{directory}/test_pattern.flv"))
+        elif not local:
+            raise click.UsageError("Publishing a test pattern needs ffmpeg on the PATH, or pass --file")
+        # Without ffmpeg the local stand-in gets undecodable filler at the ladder's top bitrate
+        tags = flv.looped(duration) if flv else RtmpPublisher.synthetic_tags(duration)
+
+        publisher = RtmpPublisher.RtmpPublisher(url, stream_name)
+        print(f"Publishing to {url} for {duration:.0f}s...", file=sys.stderr)
+        try:
+            publisher.connect()
+            report = publisher.publish(tags)
+        finally:
+            publisher.close()
+            if flv:
+                flv.close()
+            if server:
+                server.stop()
+
+    if output == "json":
+        print(json.dumps(report.as_dict(), indent=2))
+    else:
+        RtmpPublisher.print_report(report)
+
+
+def loadtest_main(pipeline_name, latency_profile, viewers, duration, ramp_up, url, local, output, session,
+                  index_path=None, ladder="standard"):
+    import json
+
+    import HlsLoadTest
+
+    tags = {"project": pipeline_name}
+    profile = LatencyProfiles.get_profile(latency_profile)
+    # Viewers switch between the renditions the channel is encoded with,
+    # built without a MediaLive client so that --local needs no AWS setup
+    renditions = HlsLoadTest.ladder(AbrLadder.encoder_settings(
+        AbrLadder.get_ladder(ladder), profile, "loadtest", f"{pipeline_name}_audio"))
+
+    server = None
+    if local:
+        stream = HlsLoadTest.CannedStream(renditions, profile.segment_seconds)
+        server = HlsLoadTest.LocalHlsServer(stream).start()
+        url = server.url
+    elif not url:
+        import MediaPackageHelper
+
+        region_name = session.client("medialive").meta.region_name
+        index = ResourceIndex.ResourceIndex(pipeline_name, region_name, index_path) if index_path else None
+        url = MediaPackageHelper.MediaPackageHelper(
+            pipeline_name, tags, latency_profile=latency_profile, session=session, index=index).get_origin_url()
+
+    print(f"Simulating {viewers} viewers of {url} for {duration:.0f}s...", file=sys.stderr)
+    try:
+        report = HlsLoadTest.LoadTest(url, viewers, duration, ramp_up, renditions).run()
+    finally:
+        if server:
+            server.stop()
+    if output == "json":
+        print(json.dumps(report, indent=2))
+    else:
+        HlsLoadTest.print_report(report)
+
+
+@main.command()
+@click.option("--host", default="127.0.0.1", show_default=True, help="Address to listen on")
+@click.option("--port", default=8750, show_default=True, help="Port to listen on")
+@click.pass_obj
+def serve(obj, host, port):
+    """Run a local HTTP API that queues create, start, stop and cleanup jobs.
+
+    Global options set the workers, the shared rate limit and the defaults of create requests.
+    """
+    serve_main(host, port, obj)
+
+
+def serve_main(host, port, obj):
+    import ControlService
+
+    defaults = {"security_cidr": obj["security_cidr"], "latency_profile": obj["latency_profile"],
+                "packaging": obj["packaging"], "standby": obj["standby"], "ladder": obj["ladder"]}
+    service = ControlService.ControlService(
+        session=obj["session"],
+        max_workers=obj["max_workers"],
+        rate_limiter=RateLimiter.RateLimiter(rate=obj["rate_limit"]),
+        index_path=obj["index_path"],
+        journal_dir=obj["journal_dir"],
+        defaults=defaults)
+    ControlService.serve(service, host, port)
+
+
+def switch_main(pipeline_name, target, prepare_only, lead, output, latency_profile, session, index_path=None):
+    import json
+
+    import botocore.exceptions
+
+    import MediaLiveHelper
+
+    region_name = session.client("medialive").meta.region_name
+    index = ResourceIndex.ResourceIndex(pipeline_name, region_name, index_path) if index_path else None
+    media_live_helper = MediaLiveHelper.MediaLiveHelper(
+        None, None, pipeline_name, {"project": pipeline_name}, latency_profile=latency_profile, session=session,
+        index=index)
+    attachment_name = MediaLiveHelper.PRIMARY_ATTACHMENT if target == "primary" else MediaLiveHelper.STANDBY_ATTACHMENT
+    try:
+        if prepare_only:
+            media_live_helper.prepare_input(attachment_name)
+            return
+        report = media_live_helper.switch_input(attachment_name, lead)
+    except (RuntimeError, TimeoutError, botocore.exceptions.ClientError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    if output == "json":
+        print(json.dumps(report, indent=2))
+        return
+    if report["from"] == report["to"]:
+        return
+    segment_seconds = media_live_helper.latency_profile.segment_seconds
+    within = "within" if report["switch_seconds"] <= segment_seconds else "more than"
+    print(f"Switched from {report['from']} to {report['to']} in {report['switch_seconds']:.1f}s, "
+          f"{within} one {segment_seconds}s segment "
+          f"({'prepared beforehand' if report['prepared'] else 'not prepared beforehand'})")
+
+
+def channels_main(action, names, max_workers, session, instrumentation, index_path=None):
+    import Fleet
+    import MediaLiveHelper
+
+    # Only the names matter for finding the channels
+    pipelines = [{"name": name, "security_cidr": None, "latency_profile": "standard", "packaging": ["hls"]}
+                 for name in names]
+    fleet = Fleet.Fleet(pipelines, max_workers=max_workers, session=session, instrumentation=instrumentation,
+                        index_path=index_path)
+    batch = MediaLiveHelper.batch_start if action == "start" else MediaLiveHelper.batch_stop
+    with instrumentation.span(action, pipelines=len(pipelines)):
+        result = batch(fleet.media_live_helpers(), max_workers)
+    if not result.report():
+        sys.exit(1)
+
+
+def monitor_main(names, interval, period, history, output, count, max_workers, session, index_path=None):
+    import HealthMonitor
+    import MediaLiveHelper
+    import MediaPackageHelper
+
+    region_name = session.client("medialive").meta.region_name
+
+    def find(name):
+        tags = {"project": name}
+        index = ResourceIndex.ResourceIndex(name, region_name, index_path) if index_path else None
+        media_package_helper = MediaPackageHelper.MediaPackageHelper(name, tags, session=session, index=index)
+        media_live_helper = MediaLiveHelper.MediaLiveHelper(
+            None, media_package_helper.channel_id, name, tags, session=session, index=index)
+        try:
+            channel_id = media_live_helper.get_channel_id()
+        except RuntimeError:
+            print(f"No MediaLive channel found for pipeline '{name}', skipping it", file=sys.stderr)
+            return None
+        return HealthMonitor.MonitoredPipeline(name, channel_id, media_package_helper.channel_id, history)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pipelines = [p for p in pool.map(find, names) if p is not None]
+    if not pipelines:
+        sys.exit(1)
+
+    monitor = HealthMonitor.HealthMonitor(session.client("cloudwatch"), pipelines, period=period)
+    try:
+        monitor.run(interval=interval, count=count, output=output)
+    except KeyboardInterrupt:
+        pass
+
+
+def fleet_main(manifest, cleanup, server_side_discovery, max_workers, rate_limit, session, instrumentation,
+               index_path=None):
+    import Fleet
+
+    fleet = Fleet.Fleet(
+        Fleet.load_manifest(manifest),
+        max_workers=max_workers,
+        rate_limiter=RateLimiter.RateLimiter(rate=rate_limit),
+        server_side_discovery=server_side_discovery,
+        session=session,
+        instrumentation=instrumentation,
+        index_path=index_path)
+
+    if cleanup:
+        import MediaLiveHelper
+
+        print(f"Beginning parallel cleanup of {len(fleet.pipelines)} pipelines...")
+        engine = CleanupEngine.CleanupEngine(max_workers=max_workers)
+        with instrumentation.span("cleanup", pipelines=len(fleet.pipelines)):
+            # MediaLive resources go in batch requests, MediaPackage has no batch API
+            batch = MediaLiveHelper.batch_delete(fleet.media_live_helpers(), max_workers)
+            engine.run(media_package_helpers=fleet.media_package_helpers())
+        ok = batch.report()
+        if not engine.report() or not ok:
+            sys.exit(1)
+        print("Cleanup successful!")
+    else:
+        results = fleet.provision()
+        if any(r.error for r in results):
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,823 @@
+import functools
+import itertools
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+import botocore
+import botocore.session
+import botocore.validate
+
+# In-process stand-in for the parts of MediaLive, MediaPackage, IAM,
+# CloudFront and CloudWatch used by this repo, for benchmarking and
+# exercising the helpers without an AWS account
+
+# FakeSession().client(name) returns clients with the same method names,
+# response shapes, paginators and ClientError codes as boto3. Parameters are
+# checked against botocore's service models just like a real client checks
+# them, so a malformed request fails here too. Channels move
+# through the real MediaLive state machine on a (scalable) clock, every
+# call can be given latency, and calls above a per-service request rate
+# are throttled and retried the way botocore does.
+
+# Time a CloudFront distribution spends InProgress after each change, in seconds
+DISTRIBUTION_SECONDS = 300
+
+# Regions reported by get_available_regions(), each with its own resources
+REGIONS = ("us-east-1", "us-west-2", "eu-west-1", "eu-central-1", "ap-southeast-2", "ap-northeast-1")
+
+# Time MediaLive typically spends in each transitional state, in seconds
+STATE_SECONDS = {
+    "CREATING": 15,
+    "UPDATING": 10,
+    "STARTING": 60,
+    "STOPPING": 30,
+    "DELETING": 20,
+}
+
+# State a channel settles in once the transitional state has elapsed
+NEXT_STATE = {
+    "CREATING": "IDLE",
+    "UPDATING": "IDLE",
+    "STARTING": "RUNNING",
+    "STOPPING": "IDLE",
+    "DELETING": "DELETED",
+}
+
+# Seconds before a scheduled input switch shows in PipelineDetails, for an
+# input that was prepared beforehand and one that wasn't
+INPUT_SWITCH_SECONDS = {"prepared": 1, "cold": 8}
+
+# Seconds a prepared input takes to start decoding
+INPUT_PREPARE_SECONDS = 5
+
+# Resources accepted by one BatchStart, BatchStop or BatchDelete request
+BATCH_LIMIT = 20
+
+
+class FakeSession:
+    def __init__(self, time_scale=1.0, latency=0.0, throttle_tps=None, page_size=20, max_attempts=5,
+                 region_name="us-east-1"):
+        self.time_scale = time_scale
+        self.latency = latency
+        self.throttle_tps = throttle_tps
+        self.page_size = page_size
+        self.max_attempts = max_attempts
+        self.region_name = region_name
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.lock = threading.RLock()
+        self.medialive = _MediaLiveState(self)
+        self.mediapackage = _MediaPackageState()
+        self.distributions = {}
+        self._ids = itertools.count(1000000)
+        self._windows = {}
+        self._regions = {}
+
+    @property
+    def state_seconds(self):
+        return {state: seconds * self.time_scale for state, seconds in STATE_SECONDS.items()}
+
+    def client(self, service_name, region_name=None, **kwargs):
+        if region_name and region_name != self.region_name:
+            return self.region(region_name).client(service_name)
+        clients = {
+            "medialive": FakeMediaLiveClient,
+            "mediapackage": FakeMediaPackageClient,
+            "iam": FakeIamClient,
+            "cloudfront": FakeCloudFrontClient,
+            "cloudwatch": FakeCloudWatchClient,
+        }
+        if service_name not in clients:
+            raise ValueError(f"FakeSession does not implement the '{service_name}' service")
+        return clients[service_name](self, service_name)
+
+    def region(self, region_name):
+        # A session for another region, with separate resources but shared call counters
+        with self.lock:
+            if region_name not in self._regions:
+                session = FakeSession(self.time_scale, self.latency, self.throttle_tps, self.page_size,
+                                      self.max_attempts, region_name)
+                session.calls = self.calls
+                session.throttled = self.throttled
+                session._ids = self._ids
+                self._regions[region_name] = session
+            return self._regions[region_name]
+
+    def get_available_regions(self, service_name):
+        return list(REGIONS)
+
+    def next_id(self):
+        return str(next(self._ids))
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls.clear()
+            self.throttled.clear()
+
+    def _throttled(self, service_name):
+        if not self.throttle_tps:
+            return False
+        with self.lock:
+            second = int(time.monotonic())
+            window = self._windows.get(service_name)
+            if window is None or window[0] != second:
+                window = [second, 0]
+                self._windows[service_name] = window
+            window[1] += 1
+            return window[1] > self.throttle_tps
+
+
+class _Events:
+    # Just enough of botocore's hierarchical event emitter for the
+    # before-call, before-send, needs-retry and after-call hooks used in this repo
+    def __init__(self):
+        self._handlers = []
+        self._unique_ids = set()
+
+    def register(self, event_name, handler, unique_id=None, **kwargs):
+        if unique_id is not None:
+            if unique_id in self._unique_ids:
+                return
+            self._unique_ids.add(unique_id)
+        self._handlers.append((event_name, handler))
+
+    def emit(self, event_name, **kwargs):
+        responses = []
+        for registered, handler in self._handlers:
+            if event_name == registered or event_name.startswith(registered + "."):
+                responses.append((handler, handler(event_name=event_name, **kwargs)))
+        return responses
+
+
+class _Meta:
+    def __init__(self, region_name):
+        self.region_name = region_name
+        self.events = _Events()
+
+
+class _Paginator:
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        while True:
+            page = self.method(**kwargs)
+            yield page
+            if not page.get("NextToken"):
+                return
+            kwargs["NextToken"] = page["NextToken"]
+
+
+@functools.lru_cache(maxsize=None)
+def _operation_models(service_name):
+    # botocore's model of each operation by method name, as a real client has
+    model = botocore.session.get_session().get_service_model(service_name)
+    return {botocore.xform_name(name): model.operation_model(name) for name in model.operation_names}
+
+
+def _validated(method):
+    # Rejects parameters the real client would, before they reach the fake
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        operation_model = _operation_models(self.service_name).get(method.__name__)
+        if operation_model is not None and operation_model.input_shape is not None:
+            report = botocore.validate.ParamValidator().validate(kwargs, operation_model.input_shape)
+            if report.has_errors():
+                raise botocore.exceptions.ParamValidationError(report=report.generate_report())
+        return method(self, *args, **kwargs)
+    return call
+
+
+class _FakeClient:
+    PAGINATORS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, value in list(vars(cls).items()):
+            if callable(value) and not name.startswith("_"):
+                setattr(cls, name, _validated(value))
+
+    def __init__(self, session, service_name):
+        self.session = session
+        self.service_name = service_name
+        self.meta = _Meta(session.region_name)
+
+    def get_paginator(self, operation):
+        if operation not in self.PAGINATORS:
+            raise ValueError(f"{self.service_name} operation '{operation}' cannot be paginated")
+        return _Paginator(getattr(self, operation))
+
+    def can_paginate(self, operation):
+        return operation in self.PAGINATORS
+
+    def _call(self, operation, func):
+        session = self.session
+        event_suffix = f"{self.service_name}.{operation}"
+        context = {}
+        self.meta.events.emit(f"before-call.{event_suffix}", model=None, params={}, context=context)
+        for attempt in range(1, session.max_attempts + 1):
+            self.meta.events.emit(f"before-send.{event_suffix}", request=None)
+            with session.lock:
+                session.calls[event_suffix] += 1
+            if session.latency:
+                time.sleep(random.uniform(0.5, 1.5) * session.latency)
+
+            if session._throttled(self.service_name):
+                with session.lock:
+                    session.throttled[event_suffix] += 1
+                parsed = self._metadata({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}},
+                                        429, attempt)
+                self.meta.events.emit(f"needs-retry.{event_suffix}", response=(None, parsed), attempts=attempt)
+                if attempt == session.max_attempts:
+                    self.meta.events.emit(f"after-call.{event_suffix}", http_response=None, parsed=parsed,
+                                          model=None, context=context)
+                    raise botocore.exceptions.ClientError(parsed, operation)
+                time.sleep(random.uniform(0, min(20, 0.05 * 2 ** attempt)))
+                continue
+
+            try:
+                with session.lock:
+                    parsed = self._metadata(func(), 200, attempt)
+            except botocore.exceptions.ClientError as e:
+                parsed = self._metadata(e.response, 400, attempt)
+            self.meta.events.emit(f"needs-retry.{event_suffix}", response=(None, parsed), attempts=attempt)
+            self.meta.events.emit(f"after-call.{event_suffix}", http_response=None, parsed=parsed,
+                                  model=None, context=context)
+            if "Error" in parsed:
+                raise botocore.exceptions.ClientError(parsed, operation)
+            return parsed
+
+    @staticmethod
+    def _metadata(parsed, status, attempt):
+        return dict(parsed, ResponseMetadata={"HTTPStatusCode": status, "RetryAttempts": attempt - 1})
+
+    def _page(self, items, result_key, next_token=None):
+        # Tokens name the last Id returned, so deletes between pages don't shift the listing
+        items = sorted((i for i in items if next_token is None or i["Id"] > next_token), key=lambda i: i["Id"])
+        page = {result_key: items[:self.session.page_size]}
+        if len(items) > self.session.page_size:
+            page["NextToken"] = page[result_key][-1]["Id"]
+        return page
+
+
+def _error(code, operation, message=""):
+    return botocore.exceptions.ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+class _MediaLiveState:
+    def __init__(self, session):
+        self.session = session
+        self.channels = {}
+        self.inputs = {}
+        self.security_groups = {}
+        # channel ID -> schedule actions
+        self.schedules = {}
+        # channel ID -> active, prepared and pending switch of a started channel
+        self.input_states = {}
+
+    def channel_state(self, channel):
+        # Advance the channel through any transitional states that have elapsed
+        while channel["State"] in NEXT_STATE:
+            elapsed = (time.monotonic() - channel["Since"])
+            duration = STATE_SECONDS[channel["State"]] * self.session.time_scale
+            if elapsed < duration:
+                break
+            channel["State"] = NEXT_STATE[channel["State"]]
+            channel["Since"] += duration
+        return channel["State"]
+
+    def set_state(self, channel, state):
+        channel["State"] = state
+        channel["Since"] = time.monotonic()
+        if state == "STARTING":
+            # Every start begins on the first attachment with nothing prepared
+            attachments = channel["InputAttachments"]
+            self.input_states[channel["Id"]] = {
+                "active": attachments[0]["InputAttachmentName"] if attachments else None,
+                "switch_action": None, "prepared": None, "pending": None}
+
+    def input_state(self, channel):
+        # Completes a pending input switch once it has had time to happen
+        inputs = self.input_states[channel["Id"]]
+        pending = inputs["pending"]
+        if pending and time.monotonic() >= pending[2]:
+            inputs["active"], inputs["switch_action"], _ = pending
+            inputs["pending"] = None
+        return inputs
+
+    def run_action(self, channel, action):
+        inputs = self.input_state(channel)
+        settings = action["ScheduleActionSettings"]
+        now = time.monotonic()
+        if "InputPrepareSettings" in settings:
+            inputs["prepared"] = (settings["InputPrepareSettings"]["InputAttachmentNameReference"], now)
+        elif "InputSwitchSettings" in settings:
+            target = settings["InputSwitchSettings"]["InputAttachmentNameReference"]
+            prepared = inputs["prepared"]
+            warm = prepared and prepared[0] == target and \
+                now - prepared[1] >= INPUT_PREPARE_SECONDS * self.session.time_scale
+            delay = INPUT_SWITCH_SECONDS["prepared" if warm else "cold"] * self.session.time_scale
+            inputs["pending"] = (target, action["ActionName"], now + delay)
+            inputs["prepared"] = None
+
+
+class FakeMediaLiveClient(_FakeClient):
+    PAGINATORS = ("list_channels", "list_inputs", "list_input_security_groups", "describe_schedule")
+
+    @property
+    def _state(self):
+        return self.session.medialive
+
+    def create_input_security_group(self, WhitelistRules=(), Tags=None):
+        def create():
+            group_id = self.session.next_id()
+            group = {"Id": group_id, "Arn": self._arn("inputSecurityGroup", group_id), "Tags": dict(Tags or {}),
+                     "WhitelistRules": list(WhitelistRules), "State": "IDLE"}
+            self._state.security_groups[group_id] = group
+            return {"SecurityGroup": dict(group)}
+        return self._call("CreateInputSecurityGroup", create)
+
+    def create_input(self, Name, Type, InputSecurityGroups=(), Destinations=(), Tags=None, **kwargs):
+        def create():
+            input_id = self.session.next_id()
+            address = f"203.0.113.{int(input_id) % 250 + 1}"
+            destinations = [{"Ip": address, "Port": "1935", "Url": f"rtmp://{address}:1935/{d['StreamName']}"}
+                            for d in Destinations]
+            item = {"Id": input_id, "Arn": self._arn("input", input_id), "Name": Name, "Type": Type,
+                    "SecurityGroups": list(InputSecurityGroups), "Destinations": destinations,
+                    "Sources": list(kwargs.get("Sources", [])),
+                    "AttachedChannels": [], "State": "DETACHED", "Tags": dict(Tags or {})}
+            self._state.inputs[input_id] = item
+            return {"Input": dict(item)}
+        return self._call("CreateInput", create)
+
+    def create_channel(self, Name, InputAttachments=(), Tags=None, **kwargs):
+        def create():
+            for attachment in InputAttachments:
+                if attachment["InputId"] not in self._state.inputs:
+                    raise _error("BadRequestException", "CreateChannel", f"Input {attachment['InputId']} not found")
+            channel_id = self.session.next_id()
+            channel = dict(kwargs, Id=channel_id, Arn=self._arn("channel", channel_id), Name=Name,
+                           InputAttachments=list(InputAttachments), Tags=dict(Tags or {}), PipelinesRunningCount=0)
+            self._state.set_state(channel, "CREATING")
+            for attachment in InputAttachments:
+                attached = self._state.inputs[attachment["InputId"]]
+                attached["AttachedChannels"].append(channel_id)
+                attached["State"] = "ATTACHED"
+            self._state.channels[channel_id] = channel
+            return {"Channel": self._describe(channel)}
+        return self._call("CreateChannel", create)
+
+    def describe_channel(self, ChannelId):
+        return self._call("DescribeChannel", lambda: self._describe(self._channel(ChannelId, "DescribeChannel")))
+
+    def describe_input(self, InputId):
+        def describe():
+            if InputId not in self._state.inputs:
+                raise _error("NotFoundException", "DescribeInput", f"Input {InputId} not found")
+            return dict(self._state.inputs[InputId])
+        return self._call("DescribeInput", describe)
+
+    def describe_input_security_group(self, InputSecurityGroupId):
+        def describe():
+            if InputSecurityGroupId not in self._state.security_groups:
+                raise _error("NotFoundException", "DescribeInputSecurityGroup")
+            return dict(self._state.security_groups[InputSecurityGroupId])
+        return self._call("DescribeInputSecurityGroup", describe)
+
+    def update_channel(self, ChannelId, **kwargs):
+        def update():
+            channel = self._channel(ChannelId, "UpdateChannel")
+            state = self._state.channel_state(channel)
+            if state != "IDLE":
+                raise _error("ConflictException", "UpdateChannel", f"Channel {ChannelId} is {state}")
+            channel.update(kwargs)
+            return {"Channel": self._describe(channel)}
+        return self._call("UpdateChannel", update)
+
+    def update_input_security_group(self, InputSecurityGroupId, WhitelistRules=()):
+        def update():
+            group = self._state.security_groups.get(InputSecurityGroupId)
+            if group is None:
+                raise _error("NotFoundException", "UpdateInputSecurityGroup")
+            group["WhitelistRules"] = list(WhitelistRules)
+            return {"SecurityGroup": dict(group)}
+        return self._call("UpdateInputSecurityGroup", update)
+
+    def start_channel(self, ChannelId):
+        return self._call("StartChannel", lambda: self._transition(ChannelId, "StartChannel", "IDLE", "STARTING"))
+
+    def stop_channel(self, ChannelId):
+        return self._call("StopChannel", lambda: self._transition(ChannelId, "StopChannel", "RUNNING", "STOPPING"))
+
+    def delete_channel(self, ChannelId):
+        return self._call("DeleteChannel", lambda: self._delete_channel(ChannelId))
+
+    def delete_input(self, InputId):
+        return self._call("DeleteInput", lambda: self._delete_input(InputId))
+
+    def delete_input_security_group(self, InputSecurityGroupId):
+        return self._call("DeleteInputSecurityGroup", lambda: self._delete_input_security_group(InputSecurityGroupId))
+
+    def batch_start(self, ChannelIds=(), MultiplexIds=()):
+        return self._call("BatchStart", lambda: self._batch("BatchStart", [
+            (channel_id, lambda c=channel_id: self._transition(c, "BatchStart", "IDLE", "STARTING"))
+            for channel_id in ChannelIds]))
+
+    def batch_stop(self, ChannelIds=(), MultiplexIds=()):
+        return self._call("BatchStop", lambda: self._batch("BatchStop", [
+            (channel_id, lambda c=channel_id: self._transition(c, "BatchStop", "RUNNING", "STOPPING"))
+            for channel_id in ChannelIds]))
+
+    def batch_delete(self, ChannelIds=(), InputIds=(), InputSecurityGroupIds=(), MultiplexIds=()):
+        # Like the real API the kinds are deleted independently, not in dependency order
+        return self._call("BatchDelete", lambda: self._batch("BatchDelete", [
+            (channel_id, lambda c=channel_id: self._delete_channel(c)) for channel_id in ChannelIds] + [
+            (input_id, lambda i=input_id: self._delete_input(i)) for input_id in InputIds] + [
+            (group_id, lambda g=group_id: self._delete_input_security_group(g)) for group_id in InputSecurityGroupIds]))
+
+    def _batch(self, operation, actions):
+        if len(actions) > BATCH_LIMIT:
+            raise _error("BadRequestException", operation, f"At most {BATCH_LIMIT} resources per request")
+        response = {"Successful": [], "Failed": []}
+        for resource_id, action in actions:
+            try:
+                result = action() or {}
+                response["Successful"].append({"Id": resource_id, "Arn": result.get("Arn"),
+                                               "State": result.get("State")})
+            except botocore.exceptions.ClientError as e:
+                error = e.response["Error"]
+                response["Failed"].append({"Id": resource_id, "Code": error["Code"], "Message": error["Message"]})
+        return response
+
+    def batch_update_schedule(self, ChannelId, Creates=None, Deletes=None):
+        def update():
+            channel = self._channel(ChannelId, "BatchUpdateSchedule")
+            schedule = self._state.schedules.setdefault(ChannelId, [])
+            actions = (Creates or {}).get("ScheduleActions", [])
+            names = {a["ActionName"] for a in schedule}
+            attachments = {a["InputAttachmentName"] for a in channel["InputAttachments"]}
+            for action in actions:
+                settings = action["ScheduleActionSettings"]
+                reference = next(iter(settings.values())).get("InputAttachmentNameReference")
+                if action["ActionName"] in names:
+                    raise _error("BadRequestException", "BatchUpdateSchedule",
+                                 f"Duplicate action name {action['ActionName']}")
+                if reference is not None and reference not in attachments:
+                    raise _error("BadRequestException", "BatchUpdateSchedule",
+                                 f"Channel {ChannelId} has no input attachment {reference}")
+                if "InputPrepareSettings" in settings and \
+                        channel.get("EncoderSettings", {}).get("FeatureActivations", {}).get(
+                            "InputPrepareScheduleActions") != "ENABLED":
+                    raise _error("BadRequestException", "BatchUpdateSchedule",
+                                 "Input prepare schedule actions are not enabled on this channel")
+                immediate = "ImmediateModeScheduleActionStartSettings" in action["ScheduleActionStartSettings"]
+                if immediate and self._state.channel_state(channel) != "RUNNING":
+                    raise _error("BadRequestException", "BatchUpdateSchedule",
+                                 f"Immediate actions need a running channel, {ChannelId} is {channel['State']}")
+            for action in actions:
+                schedule.append(action)
+                self._state.run_action(channel, action)
+            return {"Creates": {"ScheduleActions": list(actions)}}
+        return self._call("BatchUpdateSchedule", update)
+
+    def describe_schedule(self, ChannelId, NextToken=None, **kwargs):
+        def describe():
+            self._channel(ChannelId, "DescribeSchedule")
+            return {"ScheduleActions": list(self._state.schedules.get(ChannelId, []))}
+        return self._call("DescribeSchedule", describe)
+
+    def _delete_channel(self, channel_id):
+        response = self._transition(channel_id, "DeleteChannel", "IDLE", "DELETING")
+        for attachment in self._state.channels[channel_id]["InputAttachments"]:
+            attached = self._state.inputs.get(attachment["InputId"])
+            if attached and channel_id in attached["AttachedChannels"]:
+                attached["AttachedChannels"].remove(channel_id)
+                attached["State"] = "ATTACHED" if attached["AttachedChannels"] else "DETACHED"
+        return response
+
+    def _delete_input(self, input_id):
+        item = self._state.inputs.get(input_id)
+        if item is None:
+            raise _error("NotFoundException", "DeleteInput", f"Input {input_id} not found")
+        if item["AttachedChannels"]:
+            raise _error("BadRequestException", "DeleteInput", f"Input {input_id} is attached to a channel")
+        del self._state.inputs[input_id]
+        return {}
+
+    def _delete_input_security_group(self, security_group_id):
+        if security_group_id not in self._state.security_groups:
+            raise _error("NotFoundException", "DeleteInputSecurityGroup")
+        if any(security_group_id in i["SecurityGroups"] for i in self._state.inputs.values()):
+            raise _error("BadRequestException", "DeleteInputSecurityGroup",
+                         f"Input security group {security_group_id} is in use")
+        del self._state.security_groups[security_group_id]
+        return {}
+
+    def create_tags(self, ResourceArn, Tags=None):
+        def create():
+            self._tagged(ResourceArn, "CreateTags")["Tags"].update(Tags or {})
+            return {}
+        return self._call("CreateTags", create)
+
+    def delete_tags(self, ResourceArn, TagKeys=()):
+        def delete():
+            tags = self._tagged(ResourceArn, "DeleteTags")["Tags"]
+            for key in TagKeys:
+                tags.pop(key, None)
+            return {}
+        return self._call("DeleteTags", delete)
+
+    def _tagged(self, arn, operation):
+        for resources in (self._state.channels, self._state.inputs, self._state.security_groups):
+            for resource in resources.values():
+                if resource["Arn"] == arn:
+                    return resource
+        raise _error("NotFoundException", operation, f"Resource {arn} not found")
+
+    def list_channels(self, NextToken=None, **kwargs):
+        def list_():
+            channels = [self._describe(c) for c in self._state.channels.values()]
+            return self._page([c for c in channels if c["State"] != "DELETED"], "Channels", NextToken)
+        return self._call("ListChannels", list_)
+
+    def list_inputs(self, NextToken=None, **kwargs):
+        return self._call("ListInputs", lambda: self._page(
+            [dict(i) for i in self._state.inputs.values()], "Inputs", NextToken))
+
+    def list_input_security_groups(self, NextToken=None, **kwargs):
+        return self._call("ListInputSecurityGroups", lambda: self._page(
+            [dict(g) for g in self._state.security_groups.values()], "InputSecurityGroups", NextToken))
+
+    def _channel(self, channel_id, operation):
+        channel = self._state.channels.get(channel_id)
+        if channel is None:
+            raise _error("NotFoundException", operation, f"Channel {channel_id} not found")
+        return channel
+
+    def _describe(self, channel):
+        state = self._state.channel_state(channel)
+        described = {k: v for k, v in channel.items() if k != "Since"}
+        if state == "RUNNING":
+            inputs = self._state.input_state(channel)
+            described["PipelineDetails"] = [{"PipelineId": "0", "ActiveInputAttachmentName": inputs["active"],
+                                             "ActiveInputSwitchActionName": inputs["switch_action"]}]
+        return described
+
+    def _transition(self, channel_id, operation, from_state, to_state):
+        channel = self._channel(channel_id, operation)
+        state = self._state.channel_state(channel)
+        if state != from_state:
+            raise _error("ConflictException", operation, f"Channel {channel_id} is {state}, expected {from_state}")
+        self._state.set_state(channel, to_state)
+        return self._describe(channel)
+
+    def _arn(self, resource_type, resource_id):
+        return f"arn:aws:medialive:{self.session.region_name}:123456789012:{resource_type}:{resource_id}"
+
+
+class _MediaPackageState:
+    def __init__(self):
+        self.channels = {}
+        self.origin_endpoints = {}
+
+
+class FakeMediaPackageClient(_FakeClient):
+    PAGINATORS = ("list_channels", "list_origin_endpoints")
+
+    @property
+    def _state(self):
+        return self.session.mediapackage
+
+    def create_channel(self, Id, Tags=None, **kwargs):
+        def create():
+            if Id in self._state.channels:
+                raise _error("UnprocessableEntityException", "CreateChannel", f"Channel {Id} already exists")
+            channel = {"Id": Id, "Arn": self._arn("channels"), "Tags": dict(Tags or {})}
+            self._state.channels[Id] = channel
+            return dict(channel)
+        return self._call("CreateChannel", create)
+
+    def create_origin_endpoint(self, ChannelId, Id, Tags=None, **kwargs):
+        def create():
+            if ChannelId not in self._state.channels:
+                raise _error("NotFoundException", "CreateOriginEndpoint", f"Channel {ChannelId} not found")
+            if Id in self._state.origin_endpoints:
+                raise _error("UnprocessableEntityException", "CreateOriginEndpoint", f"Endpoint {Id} already exists")
+            base = (f"https://{uuid.uuid4().hex[:16]}.mediapackage.{self.session.region_name}"
+                    f".amazonaws.com/out/v1/{uuid.uuid4().hex}")
+            endpoint = dict(Id=Id, ChannelId=ChannelId, Arn=self._arn("origin_endpoints"), Tags=dict(Tags or {}))
+            self._package(endpoint, base, kwargs)
+            self._state.origin_endpoints[Id] = endpoint
+            return self._endpoint(endpoint)
+        return self._call("CreateOriginEndpoint", create)
+
+    def describe_channel(self, Id):
+        def describe():
+            if Id not in self._state.channels:
+                raise _error("NotFoundException", "DescribeChannel", f"Channel {Id} not found")
+            return dict(self._state.channels[Id])
+        return self._call("DescribeChannel", describe)
+
+    def update_origin_endpoint(self, Id, **kwargs):
+        def update():
+            if Id not in self._state.origin_endpoints:
+                raise _error("NotFoundException", "UpdateOriginEndpoint", f"Endpoint {Id} not found")
+            endpoint = self._state.origin_endpoints[Id]
+            self._package(endpoint, endpoint.pop("Base"), kwargs)
+            return self._endpoint(endpoint)
+        return self._call("UpdateOriginEndpoint", update)
+
+    def describe_origin_endpoint(self, Id):
+        def describe():
+            if Id not in self._state.origin_endpoints:
+                raise _error("NotFoundException", "DescribeOriginEndpoint", f"Endpoint {Id} not found")
+            return self._endpoint(self._state.origin_endpoints[Id])
+        return self._call("DescribeOriginEndpoint", describe)
+
+    def delete_origin_endpoint(self, Id):
+        def delete():
+            if self._state.origin_endpoints.pop(Id, None) is None:
+                raise _error("NotFoundException", "DeleteOriginEndpoint", f"Endpoint {Id} not found")
+            return {}
+        return self._call("DeleteOriginEndpoint", delete)
+
+    def delete_channel(self, Id):
+        def delete():
+            if Id not in self._state.channels:
+                raise _error("NotFoundException", "DeleteChannel", f"Channel {Id} not found")
+            if any(e["ChannelId"] == Id for e in self._state.origin_endpoints.values()):
+                raise _error("UnprocessableEntityException", "DeleteChannel", f"Channel {Id} has origin endpoints")
+            del self._state.channels[Id]
+            return {}
+        return self._call("DeleteChannel", delete)
+
+    def list_channels(self, NextToken=None, **kwargs):
+        return self._call("ListChannels", lambda: self._page(
+            [dict(c) for c in self._state.channels.values()], "Channels", NextToken))
+
+    def list_origin_endpoints(self, NextToken=None, ChannelId=None, **kwargs):
+        def list_():
+            endpoints = [self._endpoint(e) for e in self._state.origin_endpoints.values()
+                         if ChannelId is None or e["ChannelId"] == ChannelId]
+            return self._page(endpoints, "OriginEndpoints", NextToken)
+        return self._call("ListOriginEndpoints", list_)
+
+    def tag_resource(self, ResourceArn, Tags=None):
+        def tag():
+            self._tagged(ResourceArn, "TagResource")["Tags"].update(Tags or {})
+            return {}
+        return self._call("TagResource", tag)
+
+    def untag_resource(self, ResourceArn, TagKeys=()):
+        def untag():
+            tags = self._tagged(ResourceArn, "UntagResource")["Tags"]
+            for key in TagKeys:
+                tags.pop(key, None)
+            return {}
+        return self._call("UntagResource", untag)
+
+    def _tagged(self, arn, operation):
+        for resources in (self._state.channels, self._state.origin_endpoints):
+            for resource in resources.values():
+                if resource["Arn"] == arn:
+                    return resource
+        raise _error("NotFoundException", operation, f"Resource {arn} not found")
+
+    @staticmethod
+    def _package(endpoint, base, packages):
+        endpoint.update(packages, Base=base, Url=f"{base}/index.{'mpd' if 'DashPackage' in packages else 'm3u8'}")
+        if "CmafPackage" in packages:
+            # Like MediaPackage, CMAF endpoints publish a URL per manifest instead
+            endpoint["Url"] = ""
+            endpoint["CmafPackage"] = dict(packages["CmafPackage"], HlsManifests=[
+                dict(m, Url=f"{base}/{m.get('ManifestName', 'index')}.m3u8")
+                for m in packages["CmafPackage"].get("HlsManifests", [])])
+
+    @staticmethod
+    def _endpoint(endpoint):
+        return {k: v for k, v in endpoint.items() if k != "Base"}
+
+    def _arn(self, resource_type):
+        return f"arn:aws:mediapackage:{self.session.region_name}:123456789012:{resource_type}/{uuid.uuid4().hex}"
+
+
+class FakeIamClient(_FakeClient):
+    def get_role(self, RoleName):
+        return self._call("GetRole", lambda: {
+            "Role": {"RoleName": RoleName, "Arn": f"arn:aws:iam::123456789012:role/{RoleName}"}})
+
+
+class FakeCloudFrontClient(_FakeClient):
+    PAGINATORS = ("list_distributions",)
+
+    def create_distribution_with_tags(self, DistributionConfigWithTags):
+        def create():
+            distribution_id = f"E{uuid.uuid4().hex[:13].upper()}"
+            distribution = {
+                "Id": distribution_id,
+                "ARN": f"arn:aws:cloudfront::123456789012:distribution/{distribution_id}",
+                "DomainName": f"d{uuid.uuid4().hex[:13]}.cloudfront.net",
+                "Config": dict(DistributionConfigWithTags["DistributionConfig"]),
+                "Tags": list(DistributionConfigWithTags["Tags"].get("Items", [])),
+            }
+            self._deploy(distribution)
+            self.session.distributions[distribution_id] = distribution
+            return {"Distribution": self._describe(distribution), "ETag": distribution["ETag"]}
+        return self._call("CreateDistributionWithTags", create)
+
+    def get_distribution(self, Id):
+        def get():
+            distribution = self._distribution(Id, "GetDistribution")
+            return {"Distribution": self._describe(distribution), "ETag": distribution["ETag"]}
+        return self._call("GetDistribution", get)
+
+    def get_distribution_config(self, Id):
+        def get():
+            distribution = self._distribution(Id, "GetDistributionConfig")
+            return {"DistributionConfig": dict(distribution["Config"]), "ETag": distribution["ETag"]}
+        return self._call("GetDistributionConfig", get)
+
+    def update_distribution(self, Id, IfMatch, DistributionConfig):
+        def update():
+            distribution = self._distribution(Id, "UpdateDistribution")
+            if IfMatch != distribution["ETag"]:
+                raise _error("PreconditionFailed", "UpdateDistribution")
+            distribution["Config"] = dict(DistributionConfig)
+            self._deploy(distribution)
+            return {"Distribution": self._describe(distribution), "ETag": distribution["ETag"]}
+        return self._call("UpdateDistribution", update)
+
+    def delete_distribution(self, Id, IfMatch):
+        def delete():
+            distribution = self._distribution(Id, "DeleteDistribution")
+            if IfMatch != distribution["ETag"]:
+                raise _error("PreconditionFailed", "DeleteDistribution")
+            if distribution["Config"]["Enabled"] or self._status(distribution) != "Deployed":
+                raise _error("DistributionNotDisabled", "DeleteDistribution")
+            del self.session.distributions[Id]
+            return {}
+        return self._call("DeleteDistribution", delete)
+
+    def list_distributions(self, **kwargs):
+        def list_():
+            items = [dict(self._describe(d), Comment=d["Config"]["Comment"])
+                     for d in self.session.distributions.values()]
+            return {"DistributionList": {"Items": items, "Quantity": len(items), "IsTruncated": False}}
+        return self._call("ListDistributions", list_)
+
+    def list_tags_for_resource(self, Resource):
+        def list_():
+            for distribution in self.session.distributions.values():
+                if distribution["ARN"] == Resource:
+                    return {"Tags": {"Items": list(distribution["Tags"])}}
+            raise _error("NoSuchResource", "ListTagsForResource")
+        return self._call("ListTagsForResource", list_)
+
+    def _distribution(self, distribution_id, operation):
+        distribution = self.session.distributions.get(distribution_id)
+        if distribution is None:
+            raise _error("NoSuchDistribution", operation, f"Distribution {distribution_id} not found")
+        return distribution
+
+    def _deploy(self, distribution):
+        distribution["ETag"] = uuid.uuid4().hex[:14].upper()
+        distribution["DeployedAt"] = time.monotonic() + DISTRIBUTION_SECONDS * self.session.time_scale
+
+    def _status(self, distribution):
+        return "Deployed" if time.monotonic() >= distribution["DeployedAt"] else "InProgress"
+
+    def _describe(self, distribution):
+        return {"Id": distribution["Id"], "ARN": distribution["ARN"], "DomainName": distribution["DomainName"],
+                "Status": self._status(distribution), "DistributionConfig": dict(distribution["Config"])}
+
+
+class FakeCloudWatchClient(_FakeClient):
+    # Plausible datapoints for running channels and existing MediaPackage channels
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime, **kwargs):
+        def get():
+            if len(MetricDataQueries) > 500:
+                raise _error("ValidationError", "GetMetricData", "At most 500 queries are allowed")
+            return {"MetricDataResults": [self._result(q, EndTime) for q in MetricDataQueries]}
+        return self._call("GetMetricData", get)
+
+    def _result(self, query, end_time):
+        metric = query["MetricStat"]["Metric"]
+        dimensions = {d["Name"]: d["Value"] for d in metric["Dimensions"]}
+        values = []
+        if "ChannelId" in dimensions:
+            channel = self.session.medialive.channels.get(dimensions["ChannelId"])
+            if channel and self.session.medialive.channel_state(channel) == "RUNNING":
+                values = [{
+                    "InputVideoFrameRate": random.gauss(50, 0.5),
+                    "NetworkIn": random.gauss(5.5, 0.3),
+                    "DroppedFrames": float(random.random() < 0.05),
+                    "ActiveAlerts": 0.0,
+                }.get(metric["MetricName"], 0.0)]
+        elif dimensions.get("Channel") in self.session.mediapackage.channels:
+            values = [max(0.0, random.gauss(45e6, 5e6))] if metric["MetricName"] == "EgressBytes" else [0.0]
+        return {"Id": query["Id"], "Label": metric["MetricName"], "StatusCode": "Complete",
+                "Timestamps": [end_time] * len(values), "Values": values}
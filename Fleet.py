@@ -0,0 +1,178 @@
+import contextlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import AbrLadder
+import ChannelWaiter
+import ClientFactory
+import LatencyProfiles
+import MediaLiveHelper
+import MediaPackageHelper
+import PackagingFormats
+import RateLimiter
+import ResourceIndex
+import TaskGraph
+
+# Python Module for provisioning many pipelines described in a manifest
+
+# Manifest format (JSON, or YAML when PyYAML is installed):
+#
+#   defaults:
+#     security_cidr: 0.0.0.0/0
+#   pipelines:
+#     - name: event-a
+#     - name: event-b
+#       security_cidr: 203.0.113.0/24
+#       latency_profile: low
+#       packaging: [cmaf, dash]
+#       standby: rtmp
+#       ladder: lean
+#
+# All helpers share one set of AWS clients, one rate limiter and one
+# channel state poller.
+
+
+def load_manifest(path):
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("PyYAML is required to read YAML manifests, run 'pip install pyyaml'")
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+
+    defaults = manifest.get("defaults", {})
+    pipelines = []
+    for entry in manifest.get("pipelines", []):
+        pipeline = dict(defaults, **entry)
+        if "name" not in pipeline:
+            raise ValueError(f"Pipeline entry without a name in {path}: {entry}")
+        pipeline.setdefault("security_cidr", "0.0.0.0/0")
+        pipeline.setdefault("latency_profile", "standard")
+        pipeline.setdefault("packaging", ["hls"])
+        pipeline.setdefault("ladder", "standard")
+        # Checked up front, a typo shouldn't surface after half the fleet was created
+        try:
+            LatencyProfiles.get_profile(pipeline["latency_profile"])
+            AbrLadder.get_ladder(pipeline["ladder"])
+            pipeline["packaging"] = PackagingFormats.parse_packaging(pipeline["packaging"])
+        except ValueError as e:
+            raise ValueError(f"Pipeline '{pipeline['name']}' in {path}: {e}")
+        pipelines.append(pipeline)
+    return pipelines
+
+
+class PipelineResult:
+    def __init__(self, name, duration, origin_urls=None, input_url=None, error=None):
+        self.name = name
+        self.duration = duration
+        self.origin_urls = origin_urls or {}
+        self.input_url = input_url
+        self.error = error
+
+
+class Fleet:
+    def __init__(self, pipelines, max_workers=8, rate_limiter=None, server_side_discovery=False, session=None,
+                 waiter=None, instrumentation=None, index_path=None):
+        self.pipelines = pipelines
+        self.instrumentation = instrumentation
+        self.max_workers = max_workers
+        self.session = session or ClientFactory.ClientFactory(max_pool_connections=max(50, 4 * max_workers))
+        self.rate_limiter = rate_limiter or RateLimiter.RateLimiter()
+        self.waiter = waiter or ChannelWaiter.ChannelWaiter(self.session.client('medialive'))
+        self.rate_limiter.attach(self.waiter.client)
+        self.server_side_discovery = server_side_discovery
+        self.index_path = index_path
+        self._print_lock = threading.Lock()
+        # Helpers are built up front so worker threads only ever use finished clients
+        self.helpers = [self._build_helpers(p) for p in pipelines]
+
+    def _build_helpers(self, pipeline):
+        name = pipeline["name"]
+        tags = {"project": name}
+        index = None
+        if self.index_path:
+            index = ResourceIndex.ResourceIndex(name, self.waiter.client.meta.region_name, self.index_path)
+        media_package_helper = MediaPackageHelper.MediaPackageHelper(
+            resource_prefix=name,
+            tags=tags,
+            latency_profile=pipeline["latency_profile"],
+            session=self.session,
+            index=index,
+            packaging=pipeline["packaging"])
+        media_live_helper = MediaLiveHelper.MediaLiveHelper(
+            security_cidr=pipeline["security_cidr"],
+            media_package_channel_id=media_package_helper.channel_id,
+            resource_prefix=name,
+            tags=tags,
+            server_side_discovery=self.server_side_discovery,
+            waiter=self.waiter,
+            latency_profile=pipeline["latency_profile"],
+            session=self.session,
+            index=index,
+            standby=pipeline.get("standby"),
+            ladder=pipeline["ladder"])
+        self.rate_limiter.attach(media_package_helper.client)
+        self.rate_limiter.attach(media_live_helper.client)
+        return media_live_helper, media_package_helper
+
+    def provision(self):
+        results = []
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self._provision_one, p["name"], *h) for p, h in zip(self.pipelines, self.helpers)]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                status = "provisioned" if not result.error else f"FAILED ({result.error})"
+                self._print(f"[{len(results)}/{len(futures)}] {result.name} {status} in {result.duration:.1f}s "
+                            f"(rate limit {self.rate_limiter.rate:.1f} req/s)")
+        self.print_summary(results, time.monotonic() - start)
+        return results
+
+    def _provision_one(self, name, media_live_helper, media_package_helper):
+        start = time.monotonic()
+        try:
+            with self._span("create", name):
+                TaskGraph.build_pipeline_graph(media_live_helper, media_package_helper, start=False).run()
+            with self._span("start", name):
+                media_live_helper.start_channel()
+        except Exception as e:
+            return PipelineResult(name, time.monotonic() - start, error=e)
+        return PipelineResult(
+            name,
+            time.monotonic() - start,
+            origin_urls=dict(media_package_helper.origin_urls),
+            input_url=media_live_helper.input_destinations[0].get("Url"))
+
+    def _span(self, phase, name):
+        if self.instrumentation is None:
+            return contextlib.nullcontext()
+        return self.instrumentation.span(phase, pipeline=name)
+
+    def media_live_helpers(self):
+        return [h[0] for h in self.helpers]
+
+    def media_package_helpers(self):
+        return [h[1] for h in self.helpers]
+
+    def print_summary(self, results, elapsed):
+        print()
+        print(f"Provisioned {len(results)} pipelines in {elapsed:.1f}s, "
+              f"{self.rate_limiter.throttles} throttled API calls")
+        for result in sorted(results, key=lambda r: r.duration, reverse=True):
+            if result.error:
+                print(f"\t {result.name}: FAILED after {result.duration:.1f}s - {result.error}")
+            else:
+                print(f"\t {result.name}: {result.duration:.1f}s")
+                for packaging_format, url in result.origin_urls.items():
+                    print(f"\t\t {MediaPackageHelper.PACKAGING[packaging_format]}: {url}")
+                print(f"\t\t RTMP: {result.input_url}")
+
+    def _print(self, message):
+        with self._print_lock:
+            print(message)
@@ -0,0 +1,167 @@
+import datetime
+import json
+import sys
+import time
+from collections import deque
+
+# Python Module watching the health of running pipelines through CloudWatch
+
+# Every refresh is one GetMetricData call covering every metric of every
+# monitored pipeline (split only past the 500 query limit of the API).
+# The latest datapoint of each metric is kept in a bounded ring buffer per
+# pipeline, which the terminal view uses for trends.
+
+MAX_QUERIES_PER_CALL = 500
+
+# (metric, CloudWatch namespace, metric name, statistic)
+MEDIALIVE_METRICS = (
+    ("frame_rate", "AWS/MediaLive", "InputVideoFrameRate", "Average"),
+    ("network_in", "AWS/MediaLive", "NetworkIn", "Average"),
+    ("dropped_frames", "AWS/MediaLive", "DroppedFrames", "Sum"),
+    ("active_alerts", "AWS/MediaLive", "ActiveAlerts", "Maximum"),
+)
+MEDIAPACKAGE_METRICS = (
+    ("egress_bytes", "AWS/MediaPackage", "EgressBytes", "Sum"),
+)
+
+SPARKS = "▁▂▃▄▅▆▇█"
+
+
+class MonitoredPipeline:
+    def __init__(self, name, channel_id, package_channel_id, history=60):
+        self.name = name
+        self.channel_id = channel_id
+        self.package_channel_id = package_channel_id
+        # metric -> deque of (timestamp, value), oldest first
+        self.samples = {metric: deque(maxlen=history) for metric, *_ in MEDIALIVE_METRICS + MEDIAPACKAGE_METRICS}
+
+    def latest(self, metric):
+        return self.samples[metric][-1][1] if self.samples[metric] else None
+
+    def record(self, metric, timestamp, value):
+        samples = self.samples[metric]
+        if samples and samples[-1][0] >= timestamp:
+            return
+        samples.append((timestamp, value))
+
+
+class HealthMonitor:
+    def __init__(self, cloudwatch_client, pipelines, period=60):
+        self.client = cloudwatch_client
+        self.pipelines = pipelines
+        self.period = period
+        self.calls = 0
+        self._queries = self._build_queries()
+
+    def _build_queries(self):
+        queries = {}
+        for i, pipeline in enumerate(self.pipelines):
+            for metric, namespace, metric_name, statistic in MEDIALIVE_METRICS:
+                dimensions = [{"Name": "ChannelId", "Value": pipeline.channel_id},
+                              {"Name": "Pipeline", "Value": "0"}]
+                queries[f"p{i}_{metric}"] = (pipeline, metric, namespace, metric_name, statistic, dimensions)
+            for metric, namespace, metric_name, statistic in MEDIAPACKAGE_METRICS:
+                dimensions = [{"Name": "Channel", "Value": pipeline.package_channel_id}]
+                queries[f"p{i}_{metric}"] = (pipeline, metric, namespace, metric_name, statistic, dimensions)
+        return queries
+
+    def refresh(self):
+        end = datetime.datetime.now(datetime.timezone.utc)
+        # A few periods back, as CloudWatch datapoints arrive with a delay
+        start = end - datetime.timedelta(seconds=5 * self.period)
+        query_ids = list(self._queries)
+        for offset in range(0, len(query_ids), MAX_QUERIES_PER_CALL):
+            self._fetch(query_ids[offset:offset + MAX_QUERIES_PER_CALL], start, end)
+
+    def _fetch(self, query_ids, start, end):
+        metric_data_queries = []
+        for query_id in query_ids:
+            _, _, namespace, metric_name, statistic, dimensions = self._queries[query_id]
+            metric_data_queries.append({
+                "Id": query_id,
+                "MetricStat": {
+                    "Metric": {"Namespace": namespace, "MetricName": metric_name, "Dimensions": dimensions},
+                    "Period": self.period,
+                    "Stat": statistic,
+                },
+                "ReturnData": True,
+            })
+        kwargs = {"MetricDataQueries": metric_data_queries, "StartTime": start, "EndTime": end,
+                  "ScanBy": "TimestampDescending"}
+        while True:
+            response = self.client.get_metric_data(**kwargs)
+            self.calls += 1
+            for result in response["MetricDataResults"]:
+                if not result["Values"]:
+                    continue
+                pipeline, metric, *_ = self._queries[result["Id"]]
+                # Newest first because of TimestampDescending
+                pipeline.record(metric, result["Timestamps"][0], result["Values"][0])
+            if not response.get("NextToken"):
+                return
+            kwargs["NextToken"] = response["NextToken"]
+
+    def snapshot(self, pipeline):
+        egress = pipeline.latest("egress_bytes")
+        return {
+            "pipeline": pipeline.name,
+            "channel_id": pipeline.channel_id,
+            "frame_rate": pipeline.latest("frame_rate"),
+            "network_in_mbps": pipeline.latest("network_in"),
+            "dropped_frames": pipeline.latest("dropped_frames"),
+            "active_alerts": pipeline.latest("active_alerts"),
+            "egress_mbps": None if egress is None else egress * 8 / self.period / 1e6,
+        }
+
+    def write_json_lines(self, out=sys.stdout):
+        now = time.time()
+        for pipeline in self.pipelines:
+            out.write(json.dumps(dict(self.snapshot(pipeline), time=now), default=str) + "\n")
+        out.flush()
+
+    def render(self, out=sys.stdout):
+        # Clear the screen and redraw from the top left
+        out.write("\033[2J\033[H")
+        out.write(f"{time.strftime('%H:%M:%S')}  {len(self.pipelines)} pipelines, "
+                  f"{self.calls} GetMetricData calls so far\n\n")
+        out.write(f"{'pipeline':<24} {'fps':>6} {'in Mbps':>8} {'dropped':>8} {'alerts':>6} {'out Mbps':>9}  "
+                  f"fps trend\n")
+        for pipeline in self.pipelines:
+            row = self.snapshot(pipeline)
+            alerts = row["active_alerts"]
+            status = " !" if (alerts or 0) > 0 or (row["dropped_frames"] or 0) > 0 else ""
+            out.write(f"{pipeline.name[:24]:<24} {_format(row['frame_rate'], 6, 1)} "
+                      f"{_format(row['network_in_mbps'], 8, 2)} {_format(row['dropped_frames'], 8, 0)} "
+                      f"{_format(alerts, 6, 0)} {_format(row['egress_mbps'], 9, 2)}  "
+                      f"{sparkline(pipeline.samples['frame_rate'])}{status}\n")
+        out.flush()
+
+    def run(self, interval=60, count=0, output="table"):
+        refreshes = 0
+        while True:
+            started = time.monotonic()
+            self.refresh()
+            if output == "json":
+                self.write_json_lines()
+            else:
+                self.render()
+            refreshes += 1
+            if count and refreshes >= count:
+                return
+            time.sleep(max(0, interval - (time.monotonic() - started)))
+
+
+def sparkline(samples, width=20):
+    values = [value for _, value in list(samples)[-width:]]
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARKS[len(SPARKS) // 2] * len(values)
+    return "".join(SPARKS[int((v - low) / (high - low) * (len(SPARKS) - 1))] for v in values)
+
+
+def _format(value, width, decimals):
+    if value is None:
+        return "-".rjust(width)
+    return f"{value:{width}.{decimals}f}"
@@ -0,0 +1,601 @@
+import asyncio
+import re
+import ssl
+import statistics
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Python Module simulating many concurrent HLS viewers of a live stream
+
+# Every viewer runs on one asyncio event loop with a small HTTP/1.1 client
+# built on asyncio streams, keeping a keep-alive connection per host.
+# Playlists are parsed line by line as they arrive, so a new segment is
+# queued for download before the rest of the playlist has been read.
+# Viewers switch between the renditions of the MediaLive encoder ladder
+# based on the throughput they measure, and keep a simulated playback
+# buffer to count stalls and the delay behind the live edge.
+
+# Renditions are picked when their bitrate fits in this share of the
+# measured throughput
+BANDWIDTH_HEADROOM = 0.8
+# Weight of the newest segment in the throughput estimate
+THROUGHPUT_SMOOTHING = 0.3
+# Players start this many segments behind the live edge
+PLAYER_SEGMENTS = 3
+
+_ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+class HttpError(Exception):
+    def __init__(self, status, url):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+        self.url = url
+
+
+class Rendition:
+    def __init__(self, name, width, height, bitrate):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.bitrate = bitrate
+
+
+def ladder(encoder_settings):
+    # The video renditions of MediaLive EncoderSettings, highest bitrate first
+    descriptions = {d["Name"]: d for d in encoder_settings["VideoDescriptions"]}
+    renditions = []
+    for group in encoder_settings["OutputGroups"]:
+        for output in group["Outputs"]:
+            description = descriptions.get(output.get("VideoDescriptionName"))
+            if description is None:
+                continue
+            bitrate = description["CodecSettings"]["H264Settings"]["Bitrate"]
+            renditions.append(Rendition(output["OutputName"], description["Width"], description["Height"], bitrate))
+    return sorted(renditions, key=lambda r: r.bitrate, reverse=True)
+
+
+class HttpClient:
+    # Just enough HTTP/1.1 for GETting playlists and segments, reusing one
+    # keep-alive connection per (scheme, host, port)
+    def __init__(self, timeout=10, chunk_size=65536):
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self._connections = {}
+
+    async def get(self, url):
+        # Returns an async iterator over the body, which must be consumed
+        # before the next request so the connection can be reused
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        request = (f"GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\nUser-Agent: HlsLoadTest\r\n"
+                   f"Accept-Encoding: identity\r\n\r\n").encode("ascii")
+        for attempt in range(2):
+            reused = key in self._connections
+            reader, writer = self._connections.pop(key, None) or await self._open(key)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, headers = await asyncio.wait_for(self._read_head(reader), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                # The server may have closed an idle keep-alive connection
+                if reused and attempt == 0:
+                    continue
+                raise
+            body = self._body(key, reader, writer, headers)
+            if status != 200:
+                async for _ in body:
+                    pass
+                raise HttpError(status, url)
+            return body
+
+    async def lines(self, url):
+        # Yields the lines of a text response as soon as each one arrives
+        pending = b""
+        async for data in await self.get(url):
+            pending += data
+            *complete, pending = pending.split(b"\n")
+            for line in complete:
+                yield line.decode("utf-8").strip()
+        if pending:
+            yield pending.decode("utf-8").strip()
+
+    async def download(self, url):
+        # Reads and discards a response, returning (bytes, seconds to first byte, seconds)
+        start = time.monotonic()
+        first_byte = None
+        size = 0
+        async for data in await self.get(url):
+            if first_byte is None:
+                first_byte = time.monotonic() - start
+            size += len(data)
+        elapsed = time.monotonic() - start
+        return size, first_byte if first_byte is not None else elapsed, elapsed
+
+    def close(self):
+        for _, writer in self._connections.values():
+            writer.close()
+        self._connections.clear()
+
+    async def _open(self, key):
+        scheme, host, port = key
+        context = ssl.create_default_context() if scheme == "https" else None
+        return await asyncio.wait_for(asyncio.open_connection(host, port, ssl=context), self.timeout)
+
+    @staticmethod
+    async def _read_head(reader):
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                return status, headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    async def _read(self, reader, size):
+        return await asyncio.wait_for(reader.read(size), self.timeout)
+
+    async def _body(self, key, reader, writer, headers):
+        reusable = headers.get("connection", "").lower() != "close"
+        try:
+            if headers.get("transfer-encoding", "").lower() == "chunked":
+                while True:
+                    line = await asyncio.wait_for(reader.readuntil(b"\r\n"), self.timeout)
+                    remaining = int(line.split(b";")[0], 16)
+                    if remaining == 0:
+                        # Skip any trailers up to the final empty line
+                        while await asyncio.wait_for(reader.readuntil(b"\r\n"), self.timeout) != b"\r\n":
+                            pass
+                        break
+                    while remaining:
+                        data = await self._read(reader, min(self.chunk_size, remaining))
+                        if not data:
+                            raise ConnectionError("Connection closed in the middle of a chunk")
+                        remaining -= len(data)
+                        yield data
+                    await asyncio.wait_for(reader.readexactly(2), self.timeout)
+            elif "content-length" in headers:
+                remaining = int(headers["content-length"])
+                while remaining:
+                    data = await self._read(reader, min(self.chunk_size, remaining))
+                    if not data:
+                        raise ConnectionError(f"Connection closed with {remaining} bytes still to come")
+                    remaining -= len(data)
+                    yield data
+            else:
+                # Delimited by the server closing the connection
+                reusable = False
+                while data := await self._read(reader, self.chunk_size):
+                    yield data
+        except BaseException:
+            writer.close()
+            raise
+        if reusable:
+            self._connections[key] = (reader, writer)
+        else:
+            writer.close()
+
+
+class Variant:
+    def __init__(self, uri, bandwidth, resolution=None, rendition=None):
+        self.uri = uri
+        self.bandwidth = bandwidth
+        self.resolution = resolution
+        self.rendition = rendition
+
+    @property
+    def name(self):
+        return self.rendition.name if self.rendition else f"{self.bandwidth // 1000}k"
+
+
+class Segment:
+    def __init__(self, sequence, uri, duration, program_date_time=None):
+        self.sequence = sequence
+        self.uri = uri
+        self.duration = duration
+        self.program_date_time = program_date_time
+
+
+async def parse_master_playlist(lines, url, renditions=()):
+    # Variants of a master playlist matched to the encoder ladder by
+    # resolution, lowest bandwidth first. Variants outside the ladder are
+    # dropped unless nothing matches at all (e.g. a playlist with no
+    # RESOLUTION attributes), and a media playlist is its own only variant.
+    variants = []
+    attributes = None
+    media_playlist = False
+    async for line in lines:
+        if line.startswith("#EXTINF"):
+            media_playlist = True
+        elif line.startswith("#EXT-X-STREAM-INF:"):
+            attributes = dict(_ATTRIBUTE.findall(line.split(":", 1)[1]))
+        elif line and not line.startswith("#") and attributes is not None:
+            resolution = attributes.get("RESOLUTION")
+            rendition = next((r for r in renditions if resolution == f"{r.width}x{r.height}"), None)
+            variants.append(Variant(urllib.parse.urljoin(url, line), int(attributes.get("BANDWIDTH", 0)),
+                                    resolution, rendition))
+            attributes = None
+    if media_playlist:
+        return [Variant(url, 0)]
+    if not variants:
+        raise RuntimeError(f"{url} does not list any renditions")
+    matched = [v for v in variants if v.rendition is not None]
+    return sorted(matched or variants, key=lambda v: v.bandwidth)
+
+
+class MediaPlaylist:
+    # Parses one fetch of a media playlist line by line, yielding each
+    # segment as soon as its URI has been read
+    def __init__(self, url):
+        self.url = url
+        self.target_duration = None
+        self.ended = False
+
+    async def segments(self, lines):
+        sequence = 0
+        duration = None
+        program_date_time = None
+        async for line in lines:
+            if line.startswith("#EXT-X-TARGETDURATION:"):
+                self.target_duration = float(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+                sequence = int(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-PROGRAM-DATE-TIME:"):
+                program_date_time = _parse_date_time(line.split(":", 1)[1])
+            elif line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+            elif line.startswith("#EXT-X-ENDLIST"):
+                self.ended = True
+            elif line and not line.startswith("#") and duration is not None:
+                yield Segment(sequence, urllib.parse.urljoin(self.url, line), duration, program_date_time)
+                sequence += 1
+                if program_date_time is not None:
+                    program_date_time += duration
+                duration = None
+
+
+class ViewerStats:
+    def __init__(self):
+        self.segments = 0
+        self.bytes = 0
+        self.fetch_seconds = []
+        self.first_byte_seconds = []
+        self.playlist_seconds = []
+        self.live_edge_delays = []
+        self.renditions = Counter()
+        self.switches = 0
+        self.stalls = 0
+        self.stalled_seconds = 0.0
+        self.startup_seconds = None
+        self.errors = Counter()
+
+
+class Viewer:
+    def __init__(self, url, renditions=(), timeout=10):
+        self.url = url
+        self.renditions = renditions
+        self.client = HttpClient(timeout=timeout)
+        self.stats = ViewerStats()
+        self.variants = []
+        self.variant = None
+        self.throughput = None
+        self._queue = asyncio.Queue()
+        self._started = None
+        # Simulated playback: wall clock time playback began, seconds of
+        # media downloaded so far and seconds spent stalled
+        self._playing_since = None
+        self._buffered = 0.0
+        self._stalled = 0.0
+
+    async def run(self):
+        self._started = time.monotonic()
+        try:
+            self.variants = await parse_master_playlist(self.client.lines(self.url), self.url, self.renditions)
+            # Start on the lowest rendition until there is a throughput measurement
+            self.variant = self.variants[0]
+            await asyncio.gather(self._refresh_playlist(), self._download_segments())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats.errors[type(e).__name__] += 1
+        finally:
+            self.client.close()
+
+    async def _refresh_playlist(self):
+        last_sequence = None
+        while True:
+            playlist = MediaPlaylist(self.variant.uri)
+            start = time.monotonic()
+            new_segments = 0
+            try:
+                segments = playlist.segments(self.client.lines(playlist.url))
+                if last_sequence is None:
+                    # Join the stream a few segments behind the live edge
+                    window = [s async for s in segments]
+                    for segment in window[-PLAYER_SEGMENTS:]:
+                        self._queue.put_nowait(segment)
+                        last_sequence = segment.sequence
+                        new_segments += 1
+                else:
+                    async for segment in segments:
+                        if segment.sequence > last_sequence:
+                            self._queue.put_nowait(segment)
+                            last_sequence = segment.sequence
+                            new_segments += 1
+                self.stats.playlist_seconds.append(time.monotonic() - start)
+            except (HttpError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                self.stats.errors[f"playlist {_describe(e)}"] += 1
+            if playlist.ended:
+                self._queue.put_nowait(None)
+                return
+            # Reload after a target duration, or half of one when nothing changed
+            target_duration = playlist.target_duration or 1
+            await asyncio.sleep(target_duration if new_segments else target_duration / 2)
+
+    async def _download_segments(self):
+        while True:
+            segment = await self._queue.get()
+            if segment is None:
+                return
+            variant = self.variant
+            try:
+                size, first_byte, elapsed = await self.client.download(segment.uri)
+            except (HttpError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                self.stats.errors[f"segment {_describe(e)}"] += 1
+                continue
+            self.stats.segments += 1
+            self.stats.bytes += size
+            self.stats.fetch_seconds.append(elapsed)
+            self.stats.first_byte_seconds.append(first_byte)
+            self.stats.renditions[variant.name] += 1
+            self._buffer(segment, time.monotonic())
+            self._adapt(size * 8 / max(elapsed, 1e-6), segment.duration)
+
+    def _buffer(self, segment, now):
+        if self._playing_since is None:
+            self._playing_since = now
+            self.stats.startup_seconds = now - self._started
+        else:
+            # The buffer ran dry once playback caught up with the media downloaded
+            empty_at = self._playing_since + self._stalled + self._buffered
+            if now > empty_at:
+                self.stats.stalls += 1
+                self._stalled += now - empty_at
+                self.stats.stalled_seconds = self._stalled
+        if segment.program_date_time is not None:
+            plays_at = self._playing_since + self._stalled + self._buffered
+            self.stats.live_edge_delays.append(time.time() + (plays_at - now) - segment.program_date_time)
+        self._buffered += segment.duration
+
+    def _adapt(self, measured, segment_duration):
+        if self.throughput is None:
+            self.throughput = measured
+        else:
+            self.throughput = THROUGHPUT_SMOOTHING * measured + (1 - THROUGHPUT_SMOOTHING) * self.throughput
+        fitting = [v for v in self.variants if v.bandwidth <= BANDWIDTH_HEADROOM * self.throughput]
+        variant = fitting[-1] if fitting else self.variants[0]
+        # Never step up while less than a segment is buffered
+        buffered = self._playing_since + self._stalled + self._buffered - time.monotonic()
+        if buffered < segment_duration and variant.bandwidth > self.variant.bandwidth:
+            return
+        if variant is not self.variant:
+            self.variant = variant
+            self.stats.switches += 1
+
+
+class LoadTest:
+    def __init__(self, url, viewers, duration, ramp_up=0, renditions=(), timeout=10):
+        self.url = url
+        self.viewer_count = viewers
+        self.duration = duration
+        self.ramp_up = ramp_up
+        self.renditions = renditions
+        self.timeout = timeout
+        self.viewers = []
+        self.elapsed = None
+
+    def run(self):
+        return asyncio.run(self._run())
+
+    async def _run(self):
+        start = time.monotonic()
+        self.viewers = [Viewer(self.url, self.renditions, self.timeout) for _ in range(self.viewer_count)]
+        tasks = [asyncio.create_task(self._watch(viewer, i)) for i, viewer in enumerate(self.viewers)]
+        await asyncio.wait(tasks, timeout=self.duration)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.elapsed = time.monotonic() - start
+        return self.report()
+
+    async def _watch(self, viewer, i):
+        # Viewers join evenly spread over the ramp up
+        if self.ramp_up and self.viewer_count > 1:
+            await asyncio.sleep(self.ramp_up * i / (self.viewer_count - 1))
+        await viewer.run()
+
+    def report(self):
+        stats = [viewer.stats for viewer in self.viewers]
+        fetch = [s for v in stats for s in v.fetch_seconds]
+        first_byte = [s for v in stats for s in v.first_byte_seconds]
+        playlist = [s for v in stats for s in v.playlist_seconds]
+        delays = [s for v in stats for s in v.live_edge_delays]
+        startup = [v.startup_seconds for v in stats if v.startup_seconds is not None]
+        total_bytes = sum(v.bytes for v in stats)
+        return {
+            "viewers": len(stats),
+            "seconds": self.elapsed,
+            "segments": sum(v.segments for v in stats),
+            "bytes": total_bytes,
+            "throughput_mbps": total_bytes * 8 / self.elapsed / 1e6 if self.elapsed else 0.0,
+            "segment_fetch_seconds": percentiles(fetch),
+            "segment_first_byte_seconds": percentiles(first_byte),
+            "playlist_fetch_seconds": percentiles(playlist),
+            "startup_seconds": percentiles(startup),
+            "live_edge_delay_seconds": percentiles(delays),
+            "stalls": sum(v.stalls for v in stats),
+            "stalled_seconds": sum(v.stalled_seconds for v in stats),
+            "viewers_stalled": sum(1 for v in stats if v.stalls),
+            "rendition_switches": sum(v.switches for v in stats),
+            "renditions": dict(sum((v.renditions for v in stats), Counter())),
+            "errors": dict(sum((v.errors for v in stats), Counter())),
+        }
+
+
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {f"p{p}": ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in points}
+    result["mean"] = statistics.fmean(ordered)
+    result["max"] = ordered[-1]
+    return result
+
+
+def print_report(report):
+    print(f"{report['viewers']} viewers for {report['seconds']:.0f}s: {report['segments']} segments, "
+          f"{report['bytes'] / 1e6:.1f} MB, {report['throughput_mbps']:.1f} Mbps")
+    for label, key, scale, unit in (
+            ("Segment fetch", "segment_fetch_seconds", 1000, "ms"),
+            ("Segment first byte", "segment_first_byte_seconds", 1000, "ms"),
+            ("Playlist fetch", "playlist_fetch_seconds", 1000, "ms"),
+            ("Startup", "startup_seconds", 1000, "ms"),
+            ("Live-edge delay", "live_edge_delay_seconds", 1, "s")):
+        values = report[key]
+        if values:
+            print(f"\t {label + ':':<20} " + "  ".join(
+                f"{name} {value * scale:.1f}{unit}" for name, value in values.items()))
+        else:
+            print(f"\t {label + ':':<20} no samples")
+    print(f"\t {'Stalls:':<20} {report['stalls']} ({report['stalled_seconds']:.1f}s) "
+          f"across {report['viewers_stalled']} viewers")
+    print(f"\t {'Rendition switches:':<20} {report['rendition_switches']}")
+    for name, count in sorted(report["renditions"].items()):
+        print(f"\t\t {name}: {count} segments")
+    for error, count in sorted(report["errors"].items()):
+        print(f"\t FAILED {error}: {count}")
+
+
+class CannedStream:
+    # A live stream with a sliding window of segments made up on the fly,
+    # with the renditions of the ladder and one segment completing every
+    # segment_seconds of wall clock time
+    def __init__(self, renditions, segment_seconds=4, window_segments=10, size_scale=1.0):
+        self.renditions = {r.name: r for r in renditions}
+        self.segment_seconds = segment_seconds
+        self.window_segments = window_segments
+        # Start with a full window already available
+        self.epoch = time.time() - window_segments * segment_seconds
+        # One zero filled segment body per rendition, sliced for every response
+        self.payloads = {r.name: memoryview(bytes(int(r.bitrate * segment_seconds / 8 * size_scale)))
+                         for r in renditions}
+
+    def master_playlist(self):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+        for rendition in self.renditions.values():
+            lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={rendition.bitrate},RESOLUTION="
+                         f"{rendition.width}x{rendition.height},CODECS=\"avc1.640029,mp4a.40.2\"")
+            lines.append(f"{rendition.name}/index.m3u8")
+        return "\n".join(lines) + "\n"
+
+    def media_playlist(self, name):
+        if name not in self.renditions:
+            return None
+        newest = self.newest_sequence()
+        first = max(0, newest - self.window_segments + 1)
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{self.segment_seconds}",
+                 f"#EXT-X-MEDIA-SEQUENCE:{first}"]
+        for sequence in range(first, newest + 1):
+            start = datetime.fromtimestamp(self.epoch + sequence * self.segment_seconds, timezone.utc)
+            lines.append(f"#EXT-X-PROGRAM-DATE-TIME:{start.isoformat(timespec='milliseconds')[:-6]}Z")
+            lines.append(f"#EXTINF:{self.segment_seconds:.3f},")
+            lines.append(f"{sequence}.ts")
+        return "\n".join(lines) + "\n"
+
+    def segment(self, name, sequence):
+        if name not in self.renditions or not 0 <= sequence <= self.newest_sequence():
+            return None
+        return self.payloads[name]
+
+    def newest_sequence(self):
+        return int((time.time() - self.epoch) // self.segment_seconds) - 1
+
+
+class LocalHlsServer:
+    # Serves a CannedStream over HTTP/1.1 keep-alive on localhost, from a
+    # background thread, optionally adding a delay to every response
+    def __init__(self, stream, port=0, response_delay=0):
+        stream_ref = stream
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if response_delay:
+                    time.sleep(response_delay)
+                body, content_type = self._route(urllib.parse.urlsplit(self.path).path.strip("/").split("/"))
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _route(self, parts):
+                if parts == ["index.m3u8"]:
+                    return stream_ref.master_playlist().encode(), "application/vnd.apple.mpegurl"
+                if len(parts) == 2 and parts[1] == "index.m3u8":
+                    playlist = stream_ref.media_playlist(parts[0])
+                    return (playlist.encode() if playlist else None), "application/vnd.apple.mpegurl"
+                if len(parts) == 2 and parts[1].endswith(".ts") and parts[1][:-3].isdigit():
+                    return stream_ref.segment(parts[0], int(parts[1][:-3])), "video/MP2T"
+                return None, None
+
+            def log_message(self, format, *args):
+                pass
+
+        self.stream = stream
+        self.server = _QuietServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/index.m3u8"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Viewers hang up mid response when a test ends
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def _parse_date_time(value):
+    return datetime.fromisoformat(value.strip().replace("Z", "+00:00")).timestamp()
+
+
+def _describe(e):
+    return f"HTTP {e.status}" if isinstance(e, HttpError) else type(e).__name__
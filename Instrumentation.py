@@ -0,0 +1,200 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import RateLimiter
+
+# Python Module recording where a run spends its time
+
+# Clients are instrumented through botocore's event hooks, so every AWS
+# call made by the helpers is counted per operation with a latency
+# histogram, retry and throttle counts. Provisioning phases are wrapped in
+# timed spans. The whole lot can be rendered as JSON or in the Prometheus
+# text exposition format.
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, latency):
+        self.latency_sum += latency
+        self.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "throttles": self.throttles,
+            "latency_seconds_sum": round(self.latency_sum, 6),
+            "latency_buckets": {str(le): n for le, n in zip(LATENCY_BUCKETS + ("+Inf",), self.latency_buckets)},
+        }
+
+
+class Span:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.started = time.time()
+        self.duration = None
+        self.error = None
+
+    def to_dict(self):
+        return dict(name=self.name, labels=self.labels, started=self.started,
+                    duration_seconds=self.duration, error=self.error)
+
+
+class InstrumentedSession:
+    # Wraps a boto3 style session so that every client it hands out is instrumented
+    def __init__(self, instrumentation, session):
+        self.instrumentation = instrumentation
+        self.session = session
+
+    def client(self, *args, **kwargs):
+        return self.instrumentation.attach(self.session.client(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+class Instrumentation:
+    def __init__(self):
+        self.operations = {}
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def session(self, session):
+        return InstrumentedSession(self, session)
+
+    def attach(self, client):
+        events = client.meta.events
+        for event_name, handler in (("before-call", self._before_call),
+                                    ("needs-retry", self._needs_retry),
+                                    ("after-call", self._after_call),
+                                    ("after-call-error", self._after_call_error)):
+            # unique_id keeps a shared client from being hooked twice
+            events.register(event_name, handler, unique_id=f"instrumentation-{event_name}-{id(self)}")
+        return client
+
+    @contextmanager
+    def span(self, name, **labels):
+        span = Span(name, labels)
+        start = time.monotonic()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.duration = time.monotonic() - start
+            with self._lock:
+                self.spans.append(span)
+
+    def _stats(self, event_name):
+        # Event names look like after-call.medialive.DescribeChannel
+        key = event_name.split(".", 1)[1]
+        with self._lock:
+            return self.operations.setdefault(key, OperationStats())
+
+    def _before_call(self, context=None, **kwargs):
+        if context is not None:
+            context["instrumentation_start"] = time.monotonic()
+
+    def _needs_retry(self, event_name, response=None, **kwargs):
+        if response is None:
+            return
+        _, parsed = response
+        if parsed.get("Error", {}).get("Code") in RateLimiter.THROTTLING_ERROR_CODES:
+            stats = self._stats(event_name)
+            with self._lock:
+                stats.throttles += 1
+
+    def _after_call(self, event_name, parsed, context=None, **kwargs):
+        self._record(event_name, context, "Error" in parsed, parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+
+    def _after_call_error(self, event_name, context=None, **kwargs):
+        self._record(event_name, context, True, 0)
+
+    def _record(self, event_name, context, error, retries):
+        stats = self._stats(event_name)
+        started = (context or {}).get("instrumentation_start")
+        with self._lock:
+            stats.calls += 1
+            stats.retries += retries
+            if error:
+                stats.errors += 1
+            if started is not None:
+                stats.observe(time.monotonic() - started)
+
+    def to_json(self):
+        with self._lock:
+            report = {
+                "operations": {name: stats.to_dict() for name, stats in sorted(self.operations.items())},
+                "spans": [span.to_dict() for span in self.spans],
+            }
+        return json.dumps(report, indent=2)
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            operations = sorted(self.operations.items())
+            spans = list(self.spans)
+
+        for metric, attribute, help_text in (
+                ("elemental_api_calls_total", "calls", "AWS API calls made"),
+                ("elemental_api_errors_total", "errors", "AWS API calls that returned an error"),
+                ("elemental_api_retries_total", "retries", "Retried AWS API attempts"),
+                ("elemental_api_throttles_total", "throttles", "AWS API attempts rejected with a throttling error")):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for name, stats in operations:
+                lines.append(f"{metric}{{{_operation_labels(name)}}} {getattr(stats, attribute)}")
+
+        metric = "elemental_api_call_duration_seconds"
+        lines.append(f"# HELP {metric} Latency of AWS API calls including retries")
+        lines.append(f"# TYPE {metric} histogram")
+        for name, stats in operations:
+            labels = _operation_labels(name)
+            cumulative = 0
+            for le, count in zip(LATENCY_BUCKETS + ("+Inf",), stats.latency_buckets):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{labels}}} {stats.latency_sum:.6f}")
+            lines.append(f"{metric}_count{{{labels}}} {cumulative}")
+
+        metric = "elemental_phase_duration_seconds"
+        lines.append(f"# HELP {metric} Wall-clock time of each provisioning phase")
+        lines.append(f"# TYPE {metric} gauge")
+        for span in spans:
+            labels = dict(span.labels, phase=span.name, status="error" if span.error else "ok")
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+            lines.append(f"{metric}{{{label_text}}} {span.duration:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_format, path="-"):
+        text = self.to_json() + "\n" if output_format == "json" else self.to_prometheus()
+        if path == "-":
+            print(text, end="")
+        else:
+            with open(path, "w") as f:
+                f.write(text)
+
+
+def _operation_labels(name):
+    service, operation = name.split(".", 1)
+    return f'service="{service}",operation="{operation}"'
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
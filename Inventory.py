@@ -0,0 +1,175 @@
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import ChannelWaiter
+import CleanupEngine
+import MediaLiveHelper
+import MediaPackageHelper
+
+# Python Module listing 'project' tagged resources across many regions at once
+
+# Every (region, resource type) listing runs on its own worker and each
+# page is filtered and handed to the caller as soon as it arrives, so a
+# slow region never holds up the others. Per-region timings are kept so
+# the slow ones can be spotted, and the results can be handed straight to
+# the CleanupEngine without listing anything again.
+
+# (service, resource type, list operation, result key), in the order
+# resources have to be deleted within each service
+RESOURCE_TYPES = (
+    ("medialive", "channel", "list_channels", "Channels"),
+    ("medialive", "input", "list_inputs", "Inputs"),
+    ("medialive", "input_security_group", "list_input_security_groups", "InputSecurityGroups"),
+    ("mediapackage", "origin_endpoint", "list_origin_endpoints", "OriginEndpoints"),
+    ("mediapackage", "package_channel", "list_channels", "Channels"),
+)
+
+_DONE = object()
+
+
+class RegionalSession:
+    # Pins every client() call of a shared session to one region
+    def __init__(self, session, region_name):
+        self.session = session
+        self.region_name = region_name
+
+    def client(self, service_name, **kwargs):
+        return self.session.client(service_name, region_name=self.region_name, **kwargs)
+
+
+class InventoryItem:
+    def __init__(self, region, resource_type, resource_id, project, name=None, state=None):
+        self.region = region
+        self.resource_type = resource_type
+        self.resource_id = resource_id
+        self.project = project
+        self.name = name
+        self.state = state
+
+    def __str__(self):
+        details = f"project={self.project}"
+        if self.name:
+            details += f", name={self.name}"
+        if self.state:
+            details += f", state={self.state}"
+        return f"[{self.region}] {self.resource_type} {self.resource_id} ({details})"
+
+
+class RegionTiming:
+    def __init__(self, region):
+        self.region = region
+        self.started = None
+        self.finished = None
+        self.resources = 0
+        self.errors = []
+
+    @property
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class Inventory:
+    def __init__(self, session, regions, project=None, max_workers=16):
+        # project=None matches every resource carrying a 'project' tag
+        self.session = session
+        self.regions = list(regions)
+        self.project = project
+        self.max_workers = max_workers
+        self.items = []
+        self.timings = {region: RegionTiming(region) for region in self.regions}
+        self._lock = threading.Lock()
+        self._remaining = {}
+
+    def scan(self):
+        # Yields InventoryItems as they arrive from any region
+        results = queue.Queue()
+        tasks = [(region, resource) for region in self.regions for resource in RESOURCE_TYPES]
+        self._remaining = {region: len(RESOURCE_TYPES) for region in self.regions}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for region, resource in tasks:
+                pool.submit(self._list, region, resource, results)
+            finished = 0
+            while finished < len(tasks):
+                item = results.get()
+                if item is _DONE:
+                    finished += 1
+                    continue
+                self.items.append(item)
+                yield item
+
+    def _list(self, region, resource, results):
+        service_name, resource_type, operation, result_key = resource
+        timing = self.timings[region]
+        with self._lock:
+            timing.started = timing.started or time.monotonic()
+        try:
+            client = self.session.client(service_name, region_name=region)
+            for page in client.get_paginator(operation).paginate():
+                for item in page.get(result_key, []):
+                    project = (item.get("Tags") or {}).get("project")
+                    if project is None or (self.project is not None and project != self.project):
+                        continue
+                    if item.get("State") in ("DELETING", "DELETED"):
+                        continue
+                    with self._lock:
+                        timing.resources += 1
+                    results.put(InventoryItem(
+                        region, resource_type, item["Id"], project, item.get("Name"), item.get("State")))
+        except Exception as e:
+            with self._lock:
+                timing.errors.append(f"{resource_type}: {CleanupEngine.describe_error(e)}")
+        finally:
+            with self._lock:
+                self._remaining[region] -= 1
+                if self._remaining[region] == 0:
+                    timing.finished = time.monotonic()
+            results.put(_DONE)
+
+    def print_timings(self):
+        print()
+        print(f"Found {len(self.items)} resources in {len(self.regions)} regions")
+        for timing in sorted(self.timings.values(), key=lambda t: t.duration or 0, reverse=True):
+            duration = f"{timing.duration:.2f}s" if timing.duration is not None else "not run"
+            print(f"\t {timing.region:<16} {duration:>8}  {timing.resources} resources")
+            for error in timing.errors:
+                print(f"\t\t FAILED {error}")
+
+    def cleanup_chains(self):
+        # CleanupEngine chains deleting exactly the inventoried resources, two
+        # per (region, project) with one shared channel waiter per region
+        grouped = defaultdict(lambda: defaultdict(list))
+        for item in self.items:
+            grouped[(item.region, item.project)][item.resource_type].append(item.resource_id)
+
+        waiters = {}
+        chains = []
+        for (region, project), ids in sorted(grouped.items()):
+            session = RegionalSession(self.session, region)
+            if region not in waiters:
+                waiters[region] = ChannelWaiter.ChannelWaiter(session.client("medialive"))
+            tags = {"project": project}
+            media_package_helper = MediaPackageHelper.MediaPackageHelper(project, tags, session=session)
+            media_live_helper = MediaLiveHelper.MediaLiveHelper(
+                None, media_package_helper.channel_id, project, tags, waiter=waiters[region], session=session)
+            label = f"[{region}] {project}"
+            chains.append([
+                (f"{label} MediaLive channel", _ids(ids, "channel"), media_live_helper.teardown_channel),
+                (f"{label} MediaLive input", _ids(ids, "input"), media_live_helper.delete_input),
+                (f"{label} MediaLive input security group", _ids(ids, "input_security_group"),
+                 media_live_helper.delete_input_security_group),
+            ])
+            chains.append([
+                (f"{label} MediaPackage origin endpoint", _ids(ids, "origin_endpoint"),
+                 media_package_helper.delete_origin_endpoint),
+                (f"{label} MediaPackage channel", _ids(ids, "package_channel"), media_package_helper.delete_channel),
+            ])
+        return chains
+
+
+def _ids(ids, resource_type):
+    return lambda: list(ids.get(resource_type, []))
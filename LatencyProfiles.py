@@ -0,0 +1,113 @@
+import re
+import statistics
+import time
+from datetime import datetime
+
+# Python Module describing the encoder/packager trade-offs between
+# stream quality and glass-to-glass latency
+
+# MediaLive and MediaPackage settings are derived from the same profile
+# so the GOP always divides the segment duration evenly and every
+# segment starts on an IDR frame.
+
+
+class LatencyProfile:
+    def __init__(self, name, gop_seconds, b_frames, look_ahead, buffer_seconds,
+                 segment_seconds, playlist_type, playlist_window_seconds, program_date_time_interval):
+        if segment_seconds % gop_seconds:
+            raise ValueError(f"Latency profile '{name}': {segment_seconds}s segments are not a multiple of "
+                             f"the {gop_seconds}s GOP")
+        self.name = name
+        self.gop_seconds = gop_seconds
+        self.b_frames = b_frames
+        self.look_ahead = look_ahead
+        self.buffer_seconds = buffer_seconds
+        self.segment_seconds = segment_seconds
+        self.playlist_type = playlist_type
+        self.playlist_window_seconds = playlist_window_seconds
+        self.program_date_time_interval = program_date_time_interval
+
+    def expected_latency(self, player_segments=3):
+        # Players start this many segments behind the live edge, plus the
+        # segment being packaged and the encoder's look-ahead/VBV delay
+        return (player_segments + 1) * self.segment_seconds + self.buffer_seconds + self.gop_seconds
+
+
+PROFILES = {
+    "standard": LatencyProfile(
+        "standard", gop_seconds=2, b_frames=3, look_ahead="HIGH", buffer_seconds=2,
+        segment_seconds=4, playlist_type="EVENT", playlist_window_seconds=300, program_date_time_interval=60),
+    "low": LatencyProfile(
+        "low", gop_seconds=1, b_frames=1, look_ahead="LOW", buffer_seconds=1,
+        segment_seconds=2, playlist_type="NONE", playlist_window_seconds=60, program_date_time_interval=2),
+    "ultra-low": LatencyProfile(
+        "ultra-low", gop_seconds=1, b_frames=0, look_ahead="LOW", buffer_seconds=0.5,
+        segment_seconds=1, playlist_type="NONE", playlist_window_seconds=12, program_date_time_interval=1),
+}
+
+
+def get_profile(name):
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown latency profile '{name}', expected one of {', '.join(PROFILES)}")
+
+
+def measure_latency(url, samples=5, player_segments=3):
+    # Live-edge delay is the gap between now and the wall-clock time of the
+    # end of the newest segment, as stamped by EXT-X-PROGRAM-DATE-TIME
+    media_url = _first_media_playlist(url)
+    edge_delays = []
+    target_duration = 0
+    for i in range(samples):
+        playlist = _fetch(media_url)
+        edge, target_duration = _live_edge(playlist)
+        if edge is None:
+            raise RuntimeError(f"{media_url} has no EXT-X-PROGRAM-DATE-TIME tags to measure against")
+        edge_delays.append(time.time() - edge)
+        if i + 1 < samples:
+            time.sleep(target_duration or 1)
+
+    edge_delay = statistics.median(edge_delays)
+    return {
+        "media_playlist": media_url,
+        "samples": len(edge_delays),
+        "live_edge_delay": edge_delay,
+        "estimated_player_latency": edge_delay + player_segments * target_duration,
+    }
+
+
+def _fetch(url):
+    # urllib is imported here rather than at the top so that importing the
+    # profiles for the CLI's --help stays cheap
+    import urllib.request
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return response.read().decode("utf-8")
+
+
+def _first_media_playlist(url):
+    import urllib.parse
+    playlist = _fetch(url)
+    if "#EXT-X-STREAM-INF" not in playlist:
+        return url
+    for line in playlist.splitlines():
+        if line and not line.startswith("#"):
+            return urllib.parse.urljoin(url, line.strip())
+    raise RuntimeError(f"Master playlist {url} does not list any renditions")
+
+
+def _live_edge(playlist):
+    edge = None
+    target_duration = 0
+    for line in playlist.splitlines():
+        if line.startswith("#EXT-X-TARGETDURATION:"):
+            target_duration = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-PROGRAM-DATE-TIME:"):
+            edge = _parse_date_time(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:") and edge is not None:
+            edge += float(re.match(r"#EXTINF:([\d.]+)", line).group(1))
+    return edge, target_duration
+
+
+def _parse_date_time(value):
+    return datetime.fromisoformat(value.strip().replace("Z", "+00:00")).timestamp()
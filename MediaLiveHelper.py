@@ -4,31 +4,64 @@ from pprint import pprint
 import random
 import math
 import functools
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import suppress
 
 import boto3
 import botocore
 
+import AbrLadder
+import ChannelWaiter
+import LatencyProfiles
+import ResourceDiscovery
+import ResourceIndex
+
 # Python Modules with a series of useful helper methods
 # for dealing with Elemental MediaLive using BOTO3
 
 # Underlying assumption is that this module will manipulate resources
 # with the specified 'tag_name':'tag_value' tags
 
+# Resources of one kind accepted by a single BatchStart, BatchStop or BatchDelete request
+MAX_BATCH_IDS = 20
+
+# Input attachment names, which schedule actions refer to
+PRIMARY_ATTACHMENT = "elemental_rtmp_push_input"
+STANDBY_ATTACHMENT = "standby_input"
+STANDBY_INPUT_SUFFIX = "_standby_input"
+
+# Seconds MediaLive is given to start decoding an input that wasn't
+# prepared before switching to it
+PREPARE_LEAD_SECONDS = 10
+
 
 class MediaLiveHelper:
-    def __init__(self, security_cidr, media_package_channel_id, resource_prefix, tags):
-        self.client = boto3.client('medialive')
+    def __init__(self, security_cidr, media_package_channel_id, resource_prefix, tags, server_side_discovery=False,
+                 waiter=None, latency_profile="standard", session=None, index=None, standby=None,
+                 ladder="standard"):
+        # session is anything with a boto3 style client() method, the boto3 module itself by default
+        self.session = session or boto3
+        self.client = self.session.client('medialive')
+        self.waiter = waiter or ChannelWaiter.ChannelWaiter(self.client)
+        tagging_client = self.session.client('resourcegroupstaggingapi') if server_side_discovery else None
+        self.discovery = ResourceDiscovery.ResourceDiscovery(self.client, tags, tagging_client)
         self.channel_id = None
         self.security_cidr = security_cidr
         self.resource_prefix = resource_prefix
         self.media_package_channel_id = media_package_channel_id
         self.tags = tags
-        self.waitTime = 2
+        self.latency_profile = LatencyProfiles.get_profile(latency_profile)
+        self.ladder = AbrLadder.get_ladder(ladder)
+        # Optional ResourceIndex remembering this pipeline's IDs between runs
+        self.index = index
+        # None, "rtmp" for a second RTMP push input or the URL of an MP4 slate
+        self.standby = standby
 
     def create(self):
         self._create_input_security_group()
         self._create_rtmp_input()
+        if self.standby:
+            self._create_standby_input()
         self._create_channel()
 
     def _create_input_security_group(self):
@@ -37,6 +70,7 @@ class MediaLiveHelper:
             WhitelistRules=[{"Cidr": self.security_cidr}]
         )
         self.security_group_id = response["SecurityGroup"]["Id"]
+        self._remember("input_security_group", self.security_group_id)
         print(f"Created Input Security Group with ID: {self.security_group_id}")
 
     def _create_rtmp_input(self):
@@ -50,246 +84,99 @@ class MediaLiveHelper:
         )
         self.input_id = response["Input"]["Id"]
         self.input_destinations = response["Input"]["Destinations"]
+        self._remember("input", self.input_id)
         print(f"Created RTMP Input with ID: {self.input_id}")
 
+    def _create_standby_input(self):
+        if self.standby == "rtmp":
+            # For a backup encoder, behind the same security group
+            kwargs = {"Type": "RTMP_PUSH", "InputSecurityGroups": [self.security_group_id],
+                      "Destinations": [{"StreamName": "standby"}]}
+        else:
+            # A slate file MediaLive pulls itself and loops
+            kwargs = {"Type": "MP4_FILE", "Sources": [{"Url": self.standby}]}
+        response = self.client.create_input(
+            Name=f"{self.resource_prefix}{STANDBY_INPUT_SUFFIX}",
+            RoleArn=self.get_medialive_role_arn,
+            Tags=self.tags,
+            **kwargs,
+        )
+        self.standby_input_id = response["Input"]["Id"]
+        self.standby_destinations = response["Input"]["Destinations"]
+        self._remember("standby_input", self.standby_input_id)
+        print(f"Created standby {kwargs['Type']} Input with ID: {self.standby_input_id}")
+
     def _create_channel(self):
         destination_id = str(math.floor(time.time()))
         response = self.client.create_channel(
             ChannelClass="SINGLE_PIPELINE",
-            Destinations=[{
+            Tags=self.tags,
+            **self._channel_settings(destination_id),
+        )
+        self.channel_id = response["Channel"]["Id"]
+        self._remember("channel", self.channel_id)
+
+    def adopt(self, channel_id, input_id, input_destinations, security_group_id):
+        # Takes over resources created under another name, e.g. from a warm pool
+        self.channel_id = channel_id
+        self.input_id = input_id
+        self.input_destinations = input_destinations
+        self.security_group_id = security_group_id
+        self._remember("channel", channel_id)
+        self._remember("input", input_id)
+        self._remember("input_security_group", security_group_id)
+
+    def update_channel(self, channel_id, destination_id):
+        self.client.update_channel(ChannelId=channel_id, **self._channel_settings(destination_id))
+        print(f"Updated Channel with ID: {channel_id}")
+
+    def update_input_security_group(self, security_group_id):
+        self.client.update_input_security_group(
+            InputSecurityGroupId=security_group_id,
+            WhitelistRules=[{"Cidr": self.security_cidr}]
+        )
+        print(f"Updated Input Security Group with ID: {security_group_id}")
+
+    def _channel_settings(self, destination_id):
+        settings = {
+            "Destinations": [{
                 "Id": destination_id,
                 "MediaPackageSettings": [{"ChannelId": self.media_package_channel_id}]
             }],
-            EncoderSettings=self._encoder_settings(destination_id),
-            InputAttachments=self._input_attachments(),
-            InputSpecification={
+            "EncoderSettings": self._encoder_settings(destination_id),
+            "InputAttachments": self._input_attachments(),
+            "InputSpecification": {
                 "Codec": "AVC",
                 "MaximumBitrate": "MAX_20_MBPS",
                 "Resolution": "HD",
             },
-            LogLevel="DEBUG",
-            Name=f"{self.resource_prefix}_channel",
-            RoleArn=self.get_medialive_role_arn,
-            Tags=self.tags,
-        )
-        self.channel_id = response["Channel"]["Id"]
+            "LogLevel": "DEBUG",
+            "Name": f"{self.resource_prefix}_channel",
+            "RoleArn": self.get_medialive_role_arn,
+        }
+        return settings
 
     def _encoder_settings(self, destination_id):
-        return {
-            "AudioDescriptions": [{
-                "AudioSelectorName": f"{self.resource_prefix}_audio",
-                "AudioTypeControl": "FOLLOW_INPUT",
-                "CodecSettings": {
-                    "AacSettings": {
-                        "Bitrate": 192000,
-                        "CodingMode": "CODING_MODE_2_0",
-                        "InputType": "NORMAL",
-                        "Profile": "LC",
-                        "RateControlMode": "CBR",
-                        "RawFormat": "NONE",
-                        "SampleRate": 48000,
-                        "Spec": "MPEG4"
-                    }
-                },
-                "LanguageCodeControl": "FOLLOW_INPUT",
-                "Name": "audio"
-            }],
-            "OutputGroups": [{
-                "Name": "emp_output",
-                "OutputGroupSettings": {
-                        "MediaPackageGroupSettings": {
-                            "Destination": {
-                                "DestinationRefId": destination_id
-                            }
-                        }
-                },
-                "Outputs": [
-                    {
-                        "AudioDescriptionNames": [],
-                        "CaptionDescriptionNames": [],
-                        "OutputName": "video_4mpbs",
-                        "OutputSettings": {
-                            "MediaPackageOutputSettings": {}
-                        },
-                        "VideoDescriptionName": "video_4mpbs"
-                    },
-                    {
-                        "AudioDescriptionNames": [],
-                        "CaptionDescriptionNames": [],
-                        "OutputName": "video_2mpbs",
-                        "OutputSettings": {
-                            "MediaPackageOutputSettings": {}
-                        },
-                        "VideoDescriptionName": "video_2mpbs"
-                    },
-                    {
-                        "AudioDescriptionNames": [],
-                        "CaptionDescriptionNames": [],
-                        "OutputName": "video_1_2mpbs",
-                        "OutputSettings": {
-                            "MediaPackageOutputSettings": {}
-                        },
-                        "VideoDescriptionName": "video_1_2mpbs"
-                    },
-                    {
-                        "AudioDescriptionNames": [
-                            "audio"
-                        ],
-                        "CaptionDescriptionNames": [],
-                        "OutputName": "audio",
-                        "OutputSettings": {
-                            "MediaPackageOutputSettings": {}
-                        }
-                    }
-                ]
-            }],
-            "TimecodeConfig": {
-                "Source": "EMBEDDED"
-            },
-            "VideoDescriptions": [{
-                "Name": "video_4mpbs",
-                "Width": 1920,
-                "Height": 1080,
-                "RespondToAfd": "NONE",
-                "ScalingBehavior": "DEFAULT",
-                "Sharpness": 50,
-                "CodecSettings": {
-                        "H264Settings": {
-                            "AdaptiveQuantization": "HIGH",
-                            "AfdSignaling": "NONE",
-                            "Bitrate": 4000000,
-                            "BufFillPct": 90,
-                            "BufSize": 8000000,
-                            "ColorMetadata": "INSERT",
-                            "EntropyEncoding": "CABAC",
-                            "FlickerAq": "DISABLED",
-                            "FramerateControl": "SPECIFIED",
-                            "FramerateDenominator": 1,
-                            "FramerateNumerator": 50,
-                            "GopBReference": "DISABLED",
-                            "GopClosedCadence": 1,
-                            "GopNumBFrames": 3,
-                            "GopSize": 2,
-                            "GopSizeUnits": "SECONDS",
-                            "Level": "H264_LEVEL_AUTO",
-                            "LookAheadRateControl": "HIGH",
-                            "MaxBitrate": 6000000,
-                            "NumRefFrames": 3,
-                            "ParControl": "SPECIFIED",
-                            "ParDenominator": 1,
-                            "ParNumerator": 1,
-                            "Profile": "HIGH",
-                            "QvbrQualityLevel": 9,
-                            "RateControlMode": "QVBR",
-                            "ScanType": "PROGRESSIVE",
-                            "SceneChangeDetect": "ENABLED",
-                            "Slices": 4,
-                            "SpatialAq": "ENABLED",
-                            "SubgopLength": "FIXED",
-                            "Syntax": "DEFAULT",
-                            "TemporalAq": "DISABLED",
-                            "TimecodeInsertion": "DISABLED"
-                        }
-                },
-            },
-                {
-                "Name": "video_2mpbs",
-                    "Width": 1280,
-                    "Height": 720,
-                    "RespondToAfd": "NONE",
-                    "ScalingBehavior": "DEFAULT",
-                    "Sharpness": 50,
-                    "CodecSettings": {
-                        "H264Settings": {
-                            "AdaptiveQuantization": "HIGH",
-                            "AfdSignaling": "NONE",
-                            "Bitrate": 2000000,
-                            "BufFillPct": 90,
-                            "BufSize": 4000000,
-                            "ColorMetadata": "INSERT",
-                            "EntropyEncoding": "CABAC",
-                            "FlickerAq": "DISABLED",
-                            "FramerateControl": "SPECIFIED",
-                            "FramerateDenominator": 1,
-                            "FramerateNumerator": 50,
-                            "GopBReference": "DISABLED",
-                            "GopClosedCadence": 1,
-                            "GopNumBFrames": 3,
-                            "GopSize": 2,
-                            "GopSizeUnits": "SECONDS",
-                            "Level": "H264_LEVEL_AUTO",
-                            "LookAheadRateControl": "HIGH",
-                            "MaxBitrate": 3000000,
-                            "NumRefFrames": 3,
-                            "ParControl": "SPECIFIED",
-                            "ParDenominator": 1,
-                            "ParNumerator": 1,
-                            "Profile": "HIGH",
-                            "QvbrQualityLevel": 9,
-                            "RateControlMode": "QVBR",
-                            "ScanType": "PROGRESSIVE",
-                            "SceneChangeDetect": "ENABLED",
-                            "Slices": 2,
-                            "SpatialAq": "ENABLED",
-                            "SubgopLength": "FIXED",
-                            "Syntax": "DEFAULT",
-                            "TemporalAq": "DISABLED",
-                            "TimecodeInsertion": "DISABLED"
-                        }
-                    },
-            },
-                {
-                "Name": "video_1_2mpbs",
-                    "Width": 1024,
-                    "Height": 576,
-                    "RespondToAfd": "NONE",
-                    "ScalingBehavior": "DEFAULT",
-                    "Sharpness": 50,
-                    "CodecSettings": {
-                        "H264Settings": {
-                            "AdaptiveQuantization": "HIGH",
-                            "AfdSignaling": "NONE",
-                            "Bitrate": 1200000,
-                            "BufFillPct": 90,
-                            "BufSize": 2400000,
-                            "ColorMetadata": "INSERT",
-                            "EntropyEncoding": "CABAC",
-                            "FlickerAq": "DISABLED",
-                            "FramerateControl": "SPECIFIED",
-                            "FramerateDenominator": 1,
-                            "FramerateNumerator": 50,
-                            "GopBReference": "DISABLED",
-                            "GopClosedCadence": 1,
-                            "GopNumBFrames": 3,
-                            "GopSize": 2,
-                            "GopSizeUnits": "SECONDS",
-                            "Level": "H264_LEVEL_AUTO",
-                            "LookAheadRateControl": "HIGH",
-                            "MaxBitrate": 1800000,
-                            "NumRefFrames": 3,
-                            "ParControl": "SPECIFIED",
-                            "ParDenominator": 1,
-                            "ParNumerator": 1,
-                            "Profile": "MAIN",
-                            "QvbrQualityLevel": 7,
-                            "RateControlMode": "QVBR",
-                            "ScanType": "PROGRESSIVE",
-                            "SceneChangeDetect": "ENABLED",
-                            "Slices": 1,
-                            "SpatialAq": "ENABLED",
-                            "SubgopLength": "FIXED",
-                            "Syntax": "DEFAULT",
-                            "TemporalAq": "DISABLED",
-                            "TimecodeInsertion": "DISABLED"
-                        }
-                    },
-            }]
-        }
+        settings = AbrLadder.encoder_settings(
+            self.ladder, self.latency_profile, destination_id, f"{self.resource_prefix}_audio")
+        if self.standby:
+            # Lets switch_input() prepare the input it is about to switch to
+            settings["FeatureActivations"] = {"InputPrepareScheduleActions": "ENABLED"}
+        return settings
 
     def _input_attachments(self):
-        return [{
-                "InputAttachmentName": "elemental_rtmp_push_input",
-                "InputId": self.input_id,
+        attachments = [self._input_attachment(PRIMARY_ATTACHMENT, self.input_id, "CONTINUE")]
+        if self.standby:
+            # A slate is looped for as long as the channel stays on it
+            source_end_behavior = "CONTINUE" if self.standby == "rtmp" else "LOOP"
+            attachments.append(self._input_attachment(STANDBY_ATTACHMENT, self.standby_input_id, source_end_behavior))
+        return attachments
+
+    @staticmethod
+    def _input_attachment(name, input_id, source_end_behavior):
+        return {
+                "InputAttachmentName": name,
+                "InputId": input_id,
                 "InputSettings": {
                     "AudioSelectors": [],
                     "CaptionSelectors": [],
@@ -297,15 +184,19 @@ class MediaLiveHelper:
                     "DenoiseFilter": "DISABLED",
                     "FilterStrength": 1,
                     "InputFilter": "AUTO",
-                    "SourceEndBehavior": "CONTINUE"
+                    "SourceEndBehavior": source_end_behavior
+                }
                 }
-                }]
 
     @functools.cached_property
     def get_medialive_role_arn(self):
-        iam = boto3.client("iam")
+        role_arn = self.index.get("role_arn") if self.index else None
+        if role_arn:
+            return role_arn
+        iam = self.session.client("iam")
         try:
             response = iam.get_role(RoleName="MediaLiveAccessRole")
+            self._remember("role_arn", response["Role"]["Arn"])
             return response["Role"]["Arn"]
         except botocore.exceptions.ClientError as e:
             if e.response['Error']['Code'] == 'NoSuchEntity':
@@ -315,59 +206,165 @@ class MediaLiveHelper:
                 print("Or follow this doc for more instructions: https://docs.aws.amazon.com/medialive/latest/ug/scenarios-for-medialive-role.html")
                 sys.exit(1)
 
-    def start_channel(self):
-        channel_id = self.get_channel_id()
-        channelRunning = False
-        while not channelRunning:
-            response = self.client.describe_channel(ChannelId=channel_id)
-            state = response['State']
-            if state == "IDLE":
-                try:
-                    print(f"Starting Channel with ID: {channel_id}")
-                    response = self.client.start_channel(ChannelId=channel_id)
-                except botocore.exceptions.ClientError as e:
-                    print(e.response['Error']['Code'])
-                    pprint(e)
-            elif state == "CREATING" or state == "UPDATING":
-                print(f"Channel still CREATING/UPDATING, wait {self.waitTime} seconds ...")
-                time.sleep(self.waitTime)
-            elif state == "STARTING":
-                print(f"Channel {channel_id} starting")
-                channelRunning = True
-            else:
-                print(f"Unknown condition STATE[{state}]")
-
-    def stop_channel(self):
+    def start_channel(self, channel_id=None):
+        self.start_channel_async(channel_id).result()
+
+    def start_channel_async(self, channel_id=None):
+        channel_id = channel_id or self.get_channel_id()
+        future = self.waiter.watch(channel_id, ("IDLE", "STARTING", "RUNNING"))
+        return _chain(future, lambda state: self._start_idle_channel(channel_id, state))
+
+    def _start_idle_channel(self, channel_id, state):
+        if state == "IDLE":
+            try:
+                print(f"Starting Channel with ID: {channel_id}")
+                self.client.start_channel(ChannelId=channel_id)
+            except botocore.exceptions.ClientError as e:
+                print(e.response['Error']['Code'])
+                pprint(e)
+                raise
+        print(f"Channel {channel_id} starting")
+        return "STARTING" if state == "IDLE" else state
+
+    def stop_channel(self, channel_id=None):
+        self.stop_channel_async(channel_id).result()
+
+    def stop_channel_async(self, channel_id=None):
+        channel_id = channel_id or self.get_channel_id()
+        future = self.waiter.watch(channel_id, ("RUNNING", "IDLE"))
+        return _chain(future, lambda state: self._stop_running_channel(channel_id, state))
+
+    def _stop_running_channel(self, channel_id, state):
+        if state == "RUNNING":
+            print(f"Stopping channel {channel_id}")
+            self.client.stop_channel(ChannelId=channel_id)
+            return self.waiter.watch(channel_id, ("IDLE",))
+        print("Channel " + channel_id + " has stopped")
+        return state
+
+    def active_input(self, channel_id=None):
+        # Attachment name of the input the running channel is encoding
+        return _active_input(self.client.describe_channel(ChannelId=channel_id or self.get_channel_id()))
+
+    def prepared_input(self, channel_id=None):
+        # Attachment name of the latest input prepare in the schedule, as far as
+        # the actions this helper names can tell
+        latest = (0, None)
+        paginator = self.client.get_paginator("describe_schedule")
+        for page in paginator.paginate(ChannelId=channel_id or self.get_channel_id()):
+            for action in page["ScheduleActions"]:
+                kind, _, rest = action["ActionName"].partition("-")
+                attachment_name, _, millis = rest.rpartition("-")
+                if kind == "prepare" and millis.isdigit():
+                    latest = max(latest, (int(millis), attachment_name))
+        return latest[1]
+
+    def prepare_input(self, attachment_name, channel_id=None):
+        print(f"Preparing input {attachment_name}")
+        self._schedule_now(channel_id or self.get_channel_id(), "prepare", attachment_name)
+
+    def switch_input(self, attachment_name, lead_seconds=PREPARE_LEAD_SECONDS, timeout=60, poll_interval=0.2):
+        # Switches the running channel to another input attachment and measures
+        # how long until MediaLive reports it active. The input switched away
+        # from is prepared straight after, ready for switching back.
         channel_id = self.get_channel_id()
-        channelRunning = True
-        while channelRunning:
-            response = self.client.describe_channel(ChannelId=channel_id)
-            state = response['State']
-            if state == "RUNNING":
-                print(f"Stopping channel {channel_id}")
-                self.client.stop_channel(ChannelId=channel_id)
-            elif state == "STOPPING" or state == "STARTING":
-                print(f"Channel still 'stopping', waiting {self.waitTime} seconds ...")
-                time.sleep(self.waitTime)
-            elif state == "IDLE":
-                print("Channel " + channel_id + " has stopped")
-                channelRunning = False
-            else:
-                print(f"Unknown condition STATE[{state}]")
+        channel = self.client.describe_channel(ChannelId=channel_id)
+        if attachment_name not in [a["InputAttachmentName"] for a in channel["InputAttachments"]]:
+            raise RuntimeError(f"Channel {channel_id} has no input attachment {attachment_name}")
+        previous = _active_input(channel)
+        report = {"channel_id": channel_id, "from": previous, "to": attachment_name, "prepared": True,
+                  "switch_seconds": 0.0}
+        if previous == attachment_name:
+            print(f"Channel {channel_id} is already on input {attachment_name}")
+            return report
+        if self.prepared_input(channel_id) != attachment_name:
+            report["prepared"] = False
+            self.prepare_input(attachment_name, channel_id)
+            print(f"Giving input {attachment_name} {lead_seconds}s to start decoding")
+            time.sleep(lead_seconds)
+
+        print(f"Switching channel {channel_id} from {previous} to {attachment_name}")
+        start = time.monotonic()
+        self._schedule_now(channel_id, "switch", attachment_name)
+        while self.active_input(channel_id) != attachment_name:
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(f"Channel {channel_id} still not on input {attachment_name} after {timeout}s")
+            time.sleep(poll_interval)
+        report["switch_seconds"] = time.monotonic() - start
+        if previous:
+            self.prepare_input(previous, channel_id)
+        return report
+
+    def _schedule_now(self, channel_id, kind, attachment_name):
+        # Action names carry the time they were made, schedules need them unique
+        settings = "InputPrepareSettings" if kind == "prepare" else "InputSwitchSettings"
+        self.client.batch_update_schedule(ChannelId=channel_id, Creates={"ScheduleActions": [{
+            "ActionName": f"{kind}-{attachment_name}-{int(time.time() * 1000)}",
+            "ScheduleActionStartSettings": {"ImmediateModeScheduleActionStartSettings": {}},
+            "ScheduleActionSettings": {settings: {"InputAttachmentNameReference": attachment_name}},
+        }]})
 
     def get_channel_id(self):
+        if self.channel_id:
+            return self.channel_id
+        self.channel_id = self._indexed("channel", self.client.describe_channel, "ChannelId")
         if self.channel_id:
             return self.channel_id
         try:
-            response = self.client.list_channels()
+            for channel_id in self.discovery.find_ids("list_channels", "Channels", "medialive:channel", limit=1):
+                self.channel_id = channel_id
+                self._remember("channel", channel_id)
         except botocore.exceptions.ClientError as e:
             print(e.response['Error']['Code'])
-        for channel in self.filter_by_tags(response['Channels']):
-            self.channel_id = channel['Id']
         if not self.channel_id:
             raise RuntimeError("Unable to determine specified channel ID")
         return self.channel_id
 
+    def list_channel_ids(self):
+        cached = self._indexed("channel", self.client.describe_channel, "ChannelId")
+        if cached:
+            return [cached]
+        return list(self.discovery.find_ids("list_channels", "Channels", "medialive:channel"))
+
+    def list_input_ids(self):
+        cached = [self._indexed(kind, self.client.describe_input, "InputId") for kind in ("input", "standby_input")]
+        if cached[0]:
+            return [input_id for input_id in cached if input_id]
+        return list(self.discovery.find_ids("list_inputs", "Inputs", "medialive:input"))
+
+    def get_input_destinations(self):
+        # Destinations of the primary RTMP input, skipping any standby input
+        for input_id in self.list_input_ids():
+            response = self.client.describe_input(InputId=input_id)
+            if not response["Name"].endswith(STANDBY_INPUT_SUFFIX):
+                self.input_id = input_id
+                self.input_destinations = response["Destinations"]
+                return self.input_destinations
+        raise RuntimeError("Unable to find the RTMP input of this pipeline")
+
+    def list_input_security_group_ids(self):
+        cached = self._indexed(
+            "input_security_group", self.client.describe_input_security_group, "InputSecurityGroupId")
+        if cached:
+            return [cached]
+        return list(self.discovery.find_ids(
+            "list_input_security_groups", "InputSecurityGroups", "medialive:inputSecurityGroup"))
+
+    def _indexed(self, kind, describe, id_parameter):
+        # The indexed ID of this pipeline's resource, checked with one describe call
+        if self.index is None:
+            return None
+        return self.index.lookup(
+            kind, lambda resource_id: ResourceIndex.exists(describe, **{id_parameter: resource_id}))
+
+    def _remember(self, kind, value):
+        if self.index is not None:
+            self.index.put(kind, value)
+
+    def _forget(self, kind, value):
+        if self.index is not None and self.index.get(kind) == value:
+            self.index.forget(kind)
+
     def cleanup(self):
         with suppress(Exception):
             self.stop_channel()
@@ -379,51 +376,228 @@ class MediaLiveHelper:
             self.cleanup_input_security_group()
 
     def cleanup_input_security_group(self):
-        response = self.client.list_input_security_groups()
-
-        for security_group in self.filter_by_tags(response['InputSecurityGroups']):
+        for security_group_id in self.list_input_security_group_ids():
             try:
-                print(f"Deleting Input Security Group with ID: {security_group['Id']}")
-                response = self.client.delete_input_security_group(InputSecurityGroupId=security_group['Id'])
+                self.delete_input_security_group(security_group_id)
             except botocore.exceptions.ClientError as e:
                 print(e.response['Error']['Code'])
                 pprint(e)
 
     def cleanup_inputs(self):
-        response = self.client.list_inputs()
-        for input in self.filter_by_tags(response['Inputs']):
+        for input_id in self.list_input_ids():
             try:
-                print(f"Deleting Input with ID: {input['Id']}")
-                response = self.client.delete_input(InputId=input['Id'])
+                self.delete_input(input_id)
             except botocore.exceptions.ClientError as e:
                 print(e.response['Error']['Code'])
                 pprint(e)
 
     def cleanup_channels(self):
-        response = self.client.list_channels()
-        for channel in self.filter_by_tags(response['Channels']):
-            channel_id = channel['Id']
+        for channel_id in self.list_channel_ids():
             try:
-                print(f"Deleting Channel with ID: {channel['Id']}")
-                response = self.client.delete_channel(ChannelId=channel_id)
+                self.delete_channel(channel_id)
             except botocore.exceptions.ClientError as e:
                 print(e.response['Error']['Code'])
 
-            deletingChannel = True
-            while deletingChannel == True:
-                # Check channel state
-                response = self.client.describe_channel(
-                    ChannelId=channel_id)
-                state = response['State']
-                if state == "DELETING":
-                    print(f"Wait {self.waitTime} seconds for channel to be deleted")
-                    time.sleep(self.waitTime)
-                elif state == "DELETED":
-                    print("Channel " + channel_id + " has been deleted")
-                    deletingChannel = False
-                else:
-                    print("Unknown condition STATE[" + state + "]")
-                    pprint(response)
+    def delete_input_security_group(self, security_group_id):
+        print(f"Deleting Input Security Group with ID: {security_group_id}")
+        self.client.delete_input_security_group(InputSecurityGroupId=security_group_id)
+        self._forget("input_security_group", security_group_id)
+
+    def delete_input(self, input_id):
+        print(f"Deleting Input with ID: {input_id}")
+        self.client.delete_input(InputId=input_id)
+        self._forget("input", input_id)
+        self._forget("standby_input", input_id)
+
+    def teardown_channel(self, channel_id):
+        response = self.client.describe_channel(ChannelId=channel_id)
+        if response['State'] in ("RUNNING", "STARTING", "STOPPING"):
+            self.stop_channel(channel_id)
+        self.delete_channel(channel_id)
+
+    def delete_channel(self, channel_id):
+        self.delete_channel_async(channel_id).result()
+
+    def delete_channel_async(self, channel_id):
+        print(f"Deleting Channel with ID: {channel_id}")
+        self.client.delete_channel(ChannelId=channel_id)
+        self._forget("channel", channel_id)
+        future = self.waiter.watch(channel_id, ("DELETED",), failure_states=())
+        return _chain(future, lambda state: self._report_deleted(channel_id, state))
+
+    def _report_deleted(self, channel_id, state):
+        print("Channel " + channel_id + " has been deleted")
+        return state
 
     def filter_by_tags(self, items):
-        return [x for x in items if "project" in x["Tags"] and x["Tags"]["project"] == self.tags["project"]]
+        return [x for x in items if ResourceDiscovery.matches_tags(x, self.tags)]
+
+
+def _active_input(channel):
+    details = channel.get("PipelineDetails") or [{}]
+    return details[0].get("ActiveInputAttachmentName")
+
+
+def _chain(future, callback):
+    # Run callback with the result of future once it resolves. If the callback
+    # returns another future its outcome becomes the outcome of the chain.
+    chained = Future()
+
+    def resolve(source, then=None):
+        try:
+            result = source.result()
+            if then:
+                result = then(result)
+        except Exception as e:
+            chained.set_exception(e)
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(resolve)
+        else:
+            chained.set_result(result)
+
+    future.add_done_callback(lambda f: resolve(f, callback))
+    return chained
+
+
+# Batch operations over many pipelines. The helpers are expected to share
+# one MediaLive client and ChannelWaiter, as the helpers of a Fleet do.
+# Every state change is one request per MAX_BATCH_IDS channels rather than
+# one per channel, and all channels are waited on together so the waiter
+# can cover them with a single list_channels sweep per poll.
+
+
+class BatchResult:
+    def __init__(self, operation):
+        self.operation = operation
+        self.succeeded = []
+        # resource ID (or pipeline name when its IDs couldn't be found) -> error
+        self.failed = {}
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def report(self):
+        print(f"{self.operation}: {len(self.succeeded)} succeeded, {len(self.failed)} failed")
+        for resource_id, error in self.failed.items():
+            print(f"\t {resource_id}: {error}")
+        return self.ok
+
+
+def batch_start(helpers, max_workers=8, timeout=None):
+    # Starts the channel of every pipeline and waits for all of them to be RUNNING
+    result = BatchResult("BatchStart")
+    if not helpers:
+        return result
+    channel_ids = _discover(helpers, lambda h: [h.get_channel_id()], result, max_workers)
+    states = _wait_all(helpers[0].waiter, channel_ids, ("IDLE", "STARTING", "RUNNING"), result, timeout)
+    idle = [channel_id for channel_id, state in states.items() if state == "IDLE"]
+    print(f"Starting {len(idle)} channels, {len(states) - len(idle)} already starting or running")
+    _batch_call(helpers[0].client.batch_start, "ChannelIds", idle, result)
+    states = _wait_all(helpers[0].waiter, [c for c in states if c not in result.failed], ("RUNNING",), result,
+                       timeout)
+    result.succeeded = list(states)
+    return result
+
+
+def batch_stop(helpers, max_workers=8, timeout=None):
+    # Stops the channel of every pipeline and waits for all of them to be IDLE
+    result = BatchResult("BatchStop")
+    if not helpers:
+        return result
+    channel_ids = _discover(helpers, lambda h: [h.get_channel_id()], result, max_workers)
+    result.succeeded = list(_stop_all(helpers[0], channel_ids, result, timeout))
+    return result
+
+
+def batch_delete(helpers, max_workers=8, timeout=None):
+    # Deletes the channels, inputs and input security groups of every
+    # pipeline, stopping running channels first. Each kind can only go once
+    # nothing depends on it, so there is one round of batch calls per kind.
+    result = BatchResult("BatchDelete")
+    if not helpers:
+        return result
+    client, owners = helpers[0].client, {}
+
+    def discover(helper):
+        found = [("channel", i) for i in helper.list_channel_ids()]
+        found += [("input", i) for i in helper.list_input_ids()]
+        found += [("input_security_group", i) for i in helper.list_input_security_group_ids()]
+        for kind, resource_id in found:
+            owners[resource_id] = (helper, kind)
+        return found
+
+    found = _discover(helpers, discover, result, max_workers)
+    ids = {kind: [i for k, i in found if k == kind] for kind in ("channel", "input", "input_security_group")}
+
+    idle = _stop_all(helpers[0], ids["channel"], result, timeout)
+    print(f"Deleting {len(idle)} channels")
+    deleting = _batch_call(client.batch_delete, "ChannelIds", list(idle), result)
+    deleted = list(_wait_all(helpers[0].waiter, deleting, ("DELETED",), result, timeout, failure_states=()))
+    print(f"Deleting {len(ids['input'])} inputs")
+    deleted += _batch_call(client.batch_delete, "InputIds", ids["input"], result)
+    print(f"Deleting {len(ids['input_security_group'])} input security groups")
+    deleted += _batch_call(client.batch_delete, "InputSecurityGroupIds", ids["input_security_group"], result)
+
+    for resource_id in deleted:
+        helper, kind = owners[resource_id]
+        helper._forget(kind, resource_id)
+        if kind == "input":
+            helper._forget("standby_input", resource_id)
+    result.succeeded = deleted
+    return result
+
+
+def _stop_all(helper, channel_ids, result, timeout):
+    # Stops whichever channels are running, resolves to {channel ID: "IDLE"}
+    states = _wait_all(helper.waiter, channel_ids, ("IDLE", "RUNNING"), result, timeout)
+    running = [channel_id for channel_id, state in states.items() if state == "RUNNING"]
+    if running:
+        print(f"Stopping {len(running)} channels")
+    stopping = _batch_call(helper.client.batch_stop, "ChannelIds", running, result)
+    idle = {channel_id: state for channel_id, state in states.items() if state == "IDLE"}
+    idle.update(_wait_all(helper.waiter, stopping, ("IDLE",), result, timeout))
+    return idle
+
+
+def _discover(helpers, discover, result, max_workers):
+    # Runs discover(helper) for every pipeline concurrently, returns the concatenated IDs
+    found = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for helper, future in [(h, pool.submit(discover, h)) for h in helpers]:
+            try:
+                found += future.result()
+            except Exception as e:
+                result.failed[helper.resource_prefix] = str(e)
+    return found
+
+
+def _batch_call(call, parameter, ids, result):
+    # Issues call in chunks of MAX_BATCH_IDS, records per resource failures
+    # and returns the IDs the service accepted
+    accepted = []
+    for offset in range(0, len(ids), MAX_BATCH_IDS):
+        chunk = ids[offset:offset + MAX_BATCH_IDS]
+        try:
+            response = call(**{parameter: chunk})
+        except botocore.exceptions.ClientError as e:
+            for resource_id in chunk:
+                result.failed[resource_id] = e.response['Error']['Code']
+            continue
+        for failure in response.get("Failed", []):
+            result.failed[failure["Id"]] = f"{failure['Code']}: {failure.get('Message', '')}"
+        accepted += [success["Id"] for success in response.get("Successful", [])]
+    return accepted
+
+
+def _wait_all(waiter, channel_ids, target_states, result, timeout, failure_states=("DELETED",)):
+    # One combined wait, returns {channel ID: state} for the channels that got there
+    futures = {c: waiter.watch(c, target_states, failure_states, timeout) for c in channel_ids}
+    states = {}
+    for channel_id, future in futures.items():
+        try:
+            states[channel_id] = future.result()
+        except Exception as e:
+            result.failed[channel_id] = str(e)
+    return states
@@ -1,10 +1,16 @@
 import time
 from pprint import pprint
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 
 import boto3
 import botocore
 
+import LatencyProfiles
+import PackagingFormats
+import ResourceDiscovery
+import ResourceIndex
+
 # Python Modules with a series of useful helper methods
 # for dealing with Elemental MediaPackage using BOTO3
 
@@ -12,38 +18,147 @@ import botocore
 # with the specified 'tag_name':'tag_value' tags
 
 
+# Kept here too for the modules that refer to MediaPackageHelper.PACKAGING
+PACKAGING = PackagingFormats.PACKAGING
+
+
 class MediaPackageHelper:
-    def __init__(self, resource_prefix, tags,):
-        self.client = boto3.client('mediapackage')
+    def __init__(self, resource_prefix, tags, latency_profile="standard", session=None, index=None,
+                 packaging=("hls",)):
+        self.client = (session or boto3).client('mediapackage')
+        # MediaPackage ARNs carry a generated UUID rather than the channel or
+        # endpoint Id, so discovery here always goes through the list paginators
+        self.discovery = ResourceDiscovery.ResourceDiscovery(self.client, tags)
         self.channel_id = f"{resource_prefix}_package_channel"
-        self.origin_endpoint_id = f"{resource_prefix}_package_origin_endpoint"
+        self.packaging = tuple(PackagingFormats.parse_packaging(list(packaging)))
+        self.origin_endpoint_ids = {f: self._endpoint_id(resource_prefix, f) for f in self.packaging}
+        # The first packaging format is the primary one, e.g. for latency measurements
+        self.origin_endpoint_id = self.origin_endpoint_ids[self.packaging[0]]
+        self.origin_urls = {}
         self.resource_prefix = resource_prefix
         self.tags = tags
+        self.latency_profile = LatencyProfiles.get_profile(latency_profile)
+        # Optional ResourceIndex remembering this pipeline's IDs between runs
+        self.index = index
+
+    @staticmethod
+    def _endpoint_id(resource_prefix, packaging_format):
+        if packaging_format == "hls":
+            return f"{resource_prefix}_package_origin_endpoint"
+        return f"{resource_prefix}_package_{packaging_format}_endpoint"
+
+    @property
+    def origin_url(self):
+        return self.origin_urls.get(self.packaging[0])
 
     def create(self):
         self._create_channel()
-        self._create_hls_endpoint()
+        self._create_endpoints()
 
     def _create_channel(self):
         self.client.create_channel(
             Id=self.channel_id,
             Tags=self.tags,
         )
+        self._remember("package_channel", self.channel_id)
         print(f"Created MediaPackage channel '{self.channel_id}'")
 
-    def _create_hls_endpoint(self):
+    def _create_endpoints(self, packaging=None):
+        # Endpoints don't depend on each other, so they are all created at once
+        packaging = packaging or self.packaging
+        with ThreadPoolExecutor(max_workers=len(packaging)) as pool:
+            for future in [pool.submit(self._create_endpoint, f) for f in packaging]:
+                future.result()
+
+    def _create_endpoint(self, packaging_format):
+        endpoint_id = self.origin_endpoint_ids[packaging_format]
         response = self.client.create_origin_endpoint(
             ChannelId=self.channel_id,
-            Id=self.origin_endpoint_id,
-            HlsPackage={
-                'PlaylistType': 'EVENT',
-                'PlaylistWindowSeconds': 300,
-                'ProgramDateTimeIntervalSeconds': 60,
-                'SegmentDurationSeconds': 4
-            },
-            Tags=self.tags)
-        self.origin_url = response["Url"]
-        print(f"Created HLS origin endpoint with ID: {self.origin_endpoint_id}")
+            Id=endpoint_id,
+            Tags=self.tags,
+            **self._package(packaging_format))
+        self._set_url(packaging_format, playback_url(response))
+        self._remember(f"{packaging_format}_origin_endpoint", endpoint_id)
+        print(f"Created {PACKAGING[packaging_format]} origin endpoint with ID: {endpoint_id}")
+
+    def adopt(self, channel_id, endpoints):
+        # Takes over a channel and its endpoints created under another name,
+        # e.g. from a warm pool, matching the endpoints to packaging formats
+        self.channel_id = channel_id
+        self._remember("package_channel", channel_id)
+        package_keys = {"HlsPackage": "hls", "CmafPackage": "cmaf", "DashPackage": "dash"}
+        for endpoint in endpoints:
+            packaging_format = next((f for key, f in package_keys.items() if endpoint.get(key)), None)
+            if packaging_format in self.packaging:
+                self.origin_endpoint_ids[packaging_format] = endpoint["Id"]
+                self._remember(f"{packaging_format}_origin_endpoint", endpoint["Id"])
+                self._set_url(packaging_format, playback_url(endpoint))
+        self.origin_endpoint_id = self.origin_endpoint_ids[self.packaging[0]]
+
+    def update_endpoints(self, packaging=None):
+        for packaging_format in packaging or self.packaging:
+            endpoint_id = self.origin_endpoint_ids[packaging_format]
+            response = self.client.update_origin_endpoint(Id=endpoint_id, **self._package(packaging_format))
+            self._set_url(packaging_format, playback_url(response))
+            print(f"Updated {PACKAGING[packaging_format]} origin endpoint with ID: {endpoint_id}")
+
+    def _set_url(self, packaging_format, url):
+        self.origin_urls[packaging_format] = url
+        if packaging_format == self.packaging[0]:
+            self._remember("origin_url", url)
+
+    def _package(self, packaging_format):
+        return {
+            "hls": lambda: {"HlsPackage": self._hls_package()},
+            "cmaf": lambda: {"CmafPackage": self._cmaf_package()},
+            "dash": lambda: {"DashPackage": self._dash_package()},
+        }[packaging_format]()
+
+    def packages(self):
+        return {f: self._package(f) for f in self.packaging}
+
+    def _hls_package(self):
+        profile = self.latency_profile
+        return {
+            'PlaylistType': profile.playlist_type,
+            'PlaylistWindowSeconds': profile.playlist_window_seconds,
+            'ProgramDateTimeIntervalSeconds': profile.program_date_time_interval,
+            'SegmentDurationSeconds': profile.segment_seconds
+        }
+
+    def _cmaf_package(self):
+        profile = self.latency_profile
+        return {
+            'HlsManifests': [{
+                'Id': f"{self.resource_prefix}_cmaf_hls",
+                'ManifestName': 'index',
+                'PlaylistType': profile.playlist_type,
+                'PlaylistWindowSeconds': profile.playlist_window_seconds,
+                'ProgramDateTimeIntervalSeconds': profile.program_date_time_interval,
+            }],
+            'SegmentDurationSeconds': profile.segment_seconds
+        }
+
+    def _dash_package(self):
+        profile = self.latency_profile
+        return {
+            'ManifestWindowSeconds': profile.playlist_window_seconds,
+            'MinBufferTimeSeconds': 2 * profile.segment_seconds,
+            'MinUpdatePeriodSeconds': profile.segment_seconds,
+            'Profile': 'NONE',
+            'SegmentDurationSeconds': profile.segment_seconds,
+            'SegmentTemplateFormat': 'NUMBER_WITH_TIMELINE',
+            'SuggestedPresentationDelaySeconds': 3 * profile.segment_seconds
+        }
+
+    def get_origin_url(self):
+        cached = self.index.get("origin_url") if self.index else None
+        if cached:
+            self.origin_urls[self.packaging[0]] = cached
+            return self.origin_url
+        response = self.client.describe_origin_endpoint(Id=self.origin_endpoint_id)
+        self._set_url(self.packaging[0], playback_url(response))
+        return self.origin_url
 
     def cleanup(self):
         with suppress(Exception):
@@ -51,27 +166,73 @@ class MediaPackageHelper:
         with suppress(Exception):
             self.cleanup_channels()
 
-    def cleanup_origin_endpoints(self):
-        response = self.client.list_origin_endpoints()
+    def list_origin_endpoint_ids(self):
+        # Every endpoint of the pipeline's channels, whichever packaging they
+        # were created with, one paginated call per channel
+        paginator = self.client.get_paginator("list_origin_endpoints")
+        return [endpoint["Id"] for channel_id in self.list_channel_ids()
+                for page in paginator.paginate(ChannelId=channel_id) for endpoint in page["OriginEndpoints"]]
+
+    def list_channel_ids(self):
+        cached = self._indexed("package_channel", self.client.describe_channel)
+        if cached:
+            return [cached]
+        return list(self.discovery.find_ids("list_channels", "Channels"))
+
+    def _indexed(self, kind, describe):
+        # The indexed ID of this pipeline's resource, checked with one describe call
+        if self.index is None:
+            return None
+        return self.index.lookup(kind, lambda resource_id: ResourceIndex.exists(describe, Id=resource_id))
+
+    def _remember(self, kind, value):
+        if self.index is not None:
+            self.index.put(kind, value)
+
+    def _forget(self, *kinds):
+        if self.index is not None:
+            for kind in kinds:
+                self.index.forget(kind)
 
-        for endpoint in self.filter_by_tags(response['OriginEndpoints']):
+    def cleanup_origin_endpoints(self):
+        for endpoint_id in self.list_origin_endpoint_ids():
             try:
-                print(f"Deleting Origin Endpoint with ID: {endpoint['Id']}")
-                response = self.client.delete_origin_endpoint(Id=endpoint['Id'])
+                self.delete_origin_endpoint(endpoint_id)
             except botocore.exceptions.ClientError as e:
                 print(e.response['Error']['Code'])
                 pprint(e)
 
     def cleanup_channels(self):
-        response = self.client.list_channels()
-
-        for endpoint in self.filter_by_tags(response['Channels']):
+        for channel_id in self.list_channel_ids():
             try:
-                print(f"Deleting Origin Endpoint with ID: {endpoint['Id']}")
-                response = self.client.delete_channel(Id=endpoint['Id'])
+                self.delete_channel(channel_id)
             except botocore.exceptions.ClientError as e:
                 print(e.response['Error']['Code'])
                 pprint(e)
 
+    def delete_origin_endpoint(self, endpoint_id):
+        print(f"Deleting Origin Endpoint with ID: {endpoint_id}")
+        self.client.delete_origin_endpoint(Id=endpoint_id)
+        for packaging_format in PACKAGING:
+            if endpoint_id == self._endpoint_id(self.resource_prefix, packaging_format):
+                self.origin_urls.pop(packaging_format, None)
+                self._forget(f"{packaging_format}_origin_endpoint")
+        if endpoint_id == self.origin_endpoint_id:
+            self._forget("origin_url")
+
+    def delete_channel(self, channel_id):
+        print(f"Deleting MediaPackage channel with ID: {channel_id}")
+        self.client.delete_channel(Id=channel_id)
+        if channel_id == self.channel_id:
+            self._forget("package_channel")
+
     def filter_by_tags(self, items):
-        return [x for x in items if "project" in x["Tags"] and x["Tags"]["project"] == self.tags["project"]]
+        return [x for x in items if ResourceDiscovery.matches_tags(x, self.tags)]
+
+
+def playback_url(endpoint):
+    # CMAF endpoints publish their URLs per manifest rather than at the top level
+    manifests = endpoint.get("CmafPackage", {}).get("HlsManifests")
+    if manifests:
+        return manifests[0]["Url"]
+    return endpoint["Url"]
@@ -0,0 +1,26 @@
+# Python Module listing the origin endpoint formats MediaPackage can serve
+
+# Kept apart from MediaPackageHelper so that the command line can check
+# --packaging without importing boto3.
+
+# Packaging formats an origin endpoint can be created with, and how they are labelled.
+# MediaPackage v1 CMAF endpoints only carry HLS manifests (over fMP4 segments),
+# DASH is served from an endpoint of its own.
+PACKAGING = {
+    "hls": "HLS",
+    "cmaf": "CMAF (HLS fMP4)",
+    "dash": "DASH",
+}
+
+
+def parse_packaging(value):
+    # "hls,dash" or ["hls", "dash"] -> ["hls", "dash"], rejecting unknown and repeated formats
+    formats = [f.strip() for f in value.split(",")] if isinstance(value, str) else value
+    if not isinstance(formats, (list, tuple)) or not formats:
+        raise ValueError(f"Packaging must be a list of formats, got {value!r}")
+    for packaging_format in formats:
+        if packaging_format not in PACKAGING:
+            raise ValueError(f"Unknown packaging format '{packaging_format}', expected one of {list(PACKAGING)}")
+    if len(set(formats)) != len(formats):
+        raise ValueError(f"Packaging format listed twice in {value!r}")
+    return list(formats)
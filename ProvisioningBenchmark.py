@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import click
+
+import ChannelWaiter
+import CleanupEngine
+import FakeElemental
+import Fleet
+import MediaLiveHelper
+import RateLimiter
+import TaskGraph
+
+# Benchmarks create/start/stop/cleanup against the in-process fakes in
+# FakeElemental, reporting wall-clock, API calls and state polls per phase.
+# With --batch channels are started, stopped and deleted through the
+# MediaLive batch APIs instead of one call per channel.
+
+
+POLL_OPERATIONS = ("medialive.DescribeChannel", "medialive.ListChannels")
+
+
+def run_benchmark(pipeline_count, time_scale, latency, throttle_tps, max_workers, index_path=None, batch=False):
+    session = FakeElemental.FakeSession(time_scale=time_scale, latency=latency, throttle_tps=throttle_tps)
+    waiter = ChannelWaiter.ChannelWaiter(
+        session.client("medialive"),
+        initial_delay=0.05,
+        max_delay=max(0.5, 20 * time_scale),
+        batch_window=0.05,
+        expected_state_seconds=session.state_seconds,
+        verbose=False)
+    pipelines = [{"name": f"bench{i}", "security_cidr": "0.0.0.0/0", "latency_profile": "standard",
+                  "packaging": ["hls"]}
+                 for i in range(pipeline_count)]
+    fleet = Fleet.Fleet(
+        pipelines,
+        max_workers=max_workers,
+        rate_limiter=RateLimiter.RateLimiter(rate=1000, burst=1000, max_rate=1000),
+        session=session,
+        waiter=waiter,
+        index_path=index_path)
+    media_live_helpers = fleet.media_live_helpers()
+
+    def create():
+        graphs = [TaskGraph.build_pipeline_graph(ml, mp, start=False) for ml, mp in fleet.helpers]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for future in [pool.submit(graph.run) for graph in graphs]:
+                future.result()
+
+    def start():
+        if batch:
+            if not MediaLiveHelper.batch_start(media_live_helpers, max_workers).ok:
+                raise RuntimeError("BatchStart reported failures")
+            return
+        wait([h.start_channel_async() for h in media_live_helpers])
+        wait([waiter.watch(h.channel_id, ("RUNNING",)) for h in media_live_helpers])
+
+    def stop():
+        if batch:
+            if not MediaLiveHelper.batch_stop(media_live_helpers, max_workers).ok:
+                raise RuntimeError("BatchStop reported failures")
+            return
+        for future in [h.stop_channel_async() for h in media_live_helpers]:
+            future.result()
+
+    def cleanup():
+        engine = CleanupEngine.CleanupEngine(max_workers=max_workers)
+        if batch:
+            if not MediaLiveHelper.batch_delete(media_live_helpers, max_workers).ok:
+                raise RuntimeError("BatchDelete reported failures")
+        engine.run([] if batch else media_live_helpers, fleet.media_package_helpers())
+        if not all(r.ok for r in engine.results):
+            raise RuntimeError("Cleanup reported failures")
+
+    rows = []
+    for phase, func in (("create", create), ("start", start), ("stop", stop), ("cleanup", cleanup)):
+        session.reset_counters()
+        start_time = time.monotonic()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        elapsed = time.monotonic() - start_time
+        calls = sum(session.calls.values())
+        polls = sum(session.calls[op] for op in POLL_OPERATIONS)
+        rows.append((pipeline_count, phase, elapsed, calls, polls, sum(session.throttled.values())))
+    return rows
+
+
+@click.command()
+@click.option("--pipelines", default="1,10,100", show_default=True, help="Comma separated fleet sizes to benchmark")
+@click.option("--time-scale", default=0.01, show_default=True, help="Multiplier applied to real MediaLive state transition times")
+@click.option("--latency", default=0.005, show_default=True, help="Mean simulated latency of each API call in seconds")
+@click.option("--throttle-tps", type=int, help="Throttle each fake service above this many requests per second")
+@click.option("--max-workers", default=16, show_default=True, help="Concurrent workers used for each phase")
+@click.option("--index", is_flag=True, help="Give every pipeline a ResourceIndex in a temporary database")
+@click.option("--batch", is_flag=True, help="Start, stop and delete channels with the MediaLive batch APIs")
+def main(pipelines, time_scale, latency, throttle_tps, max_workers, index, batch):
+    print(f"{'pipelines':>9} {'phase':<8} {'seconds':>8} {'api calls':>9} {'polls':>6} {'throttled':>9}")
+    for count in [int(n) for n in pipelines.split(",")]:
+        with tempfile.TemporaryDirectory() as directory:
+            index_path = os.path.join(directory, "index.sqlite3") if index else None
+            for row in run_benchmark(count, time_scale, latency, throttle_tps, max_workers, index_path, batch):
+                print("{:>9} {:<8} {:>8.2f} {:>9} {:>6} {:>9}".format(*row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+import time
+
+# Python Module keeping a crash-safe record of the resources created for a pipeline
+
+# Every create is written ahead as an "intent" entry and followed by a
+# "created" entry holding the new resource ID once AWS returns it, each
+# line flushed and fsynced before moving on. Replaying the file gives the
+# resources a pipeline owns, and any intent left without a matching
+# created entry points at the one resource type a crashed run may have
+# leaked.
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".elemental-demo", "journal")
+
+
+class ProvisioningJournal:
+    def __init__(self, pipeline_name, region_name=None, directory=DEFAULT_DIRECTORY):
+        self.pipeline_name = pipeline_name
+        self.path = os.path.join(directory, region_name or "default", f"{pipeline_name}.jsonl")
+        self._lock = threading.Lock()
+
+    def record(self, op, resource_type, resource_id=None, **details):
+        entry = {"time": time.time(), "op": op, "resource": resource_type, "id": resource_id}
+        if details:
+            entry["details"] = details
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a+b") as f:
+                line = json.dumps(entry).encode() + b"\n"
+                if f.tell() and not self._ends_with_newline(f):
+                    # Terminate a line torn by a crash so this entry stays readable
+                    line = b"\n" + line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def entries(self):
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A line torn by a crash mid-write, the entries around it are intact
+                    continue
+        return entries
+
+    @staticmethod
+    def _ends_with_newline(f):
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+    def state(self):
+        resources = {}
+        pending = set()
+        for entry in self.entries():
+            resource_type = entry["resource"]
+            if entry["op"] == "intent":
+                pending.add(resource_type)
+            elif entry["op"] in ("created", "adopted", "updated"):
+                pending.discard(resource_type)
+                resources[resource_type] = {"id": entry["id"], "details": entry.get("details", {})}
+            elif entry["op"] == "deleted":
+                pending.discard(resource_type)
+                if resources.get(resource_type, {}).get("id") == entry["id"]:
+                    del resources[resource_type]
+        return resources, pending
+
+    def archive(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.replace(self.path, f"{self.path}.{int(time.time())}.done")
@@ -0,0 +1,73 @@
+import threading
+import time
+
+# Python Module with a token bucket shared between boto3 clients
+
+# Every HTTP attempt made by an attached client takes a token first. The
+# refill rate halves whenever AWS answers with a throttling error and
+# creeps back up additively while calls succeed, so a fleet of workers
+# settles just under the account's real API limit.
+
+THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+}
+
+
+class RateLimiter:
+    def __init__(self, rate=5.0, burst=5, min_rate=0.5, max_rate=50.0, increase=0.2):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.throttles = 0
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def attach(self, client):
+        # unique_id keeps a shared client from being hooked twice
+        client.meta.events.register("before-send", self._before_send, unique_id=f"rate-limiter-send-{id(self)}")
+        client.meta.events.register("needs-retry", self._needs_retry, unique_id=f"rate-limiter-retry-{id(self)}")
+        return client
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _before_send(self, **kwargs):
+        # Returning anything other than None would short-circuit the request
+        self.acquire()
+
+    def _needs_retry(self, response=None, **kwargs):
+        if response is None:
+            return
+        _, parsed = response
+        if parsed.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES:
+            self.on_throttle()
+        else:
+            self.on_success()
@@ -0,0 +1,352 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import botocore
+
+import CleanupEngine
+import MediaPackageHelper
+import ResourceIndex
+import TaskGraph
+
+# Python Module bringing a pipeline to its desired state idempotently
+
+# The resources a pipeline owns come from its ProvisioningJournal, so the
+# actual state is a handful of direct describe calls rather than a scan of
+# the account. MediaPackage IDs are derived from the pipeline name and are
+# always described directly. Only a resource type whose create was
+# interrupted (an intent without a matching created entry) falls back to
+# tag discovery, limited to the first match.
+
+# Journal resource types, which are also the names of their creation steps.
+# Only pipelines created with a standby input have a standby_input.
+RESOURCE_TYPES = ("mediapackage_channel", "mediapackage_endpoint", "input_security_group", "input", "standby_input",
+                  "channel")
+
+# Discovery used to find a resource whose create was interrupted
+DISCOVERY = {
+    "input_security_group": ("list_input_security_groups", "InputSecurityGroups", "medialive:inputSecurityGroup"),
+    "input": ("list_inputs", "Inputs", "medialive:input"),
+    "channel": ("list_channels", "Channels", "medialive:channel"),
+}
+
+GONE_STATES = ("DELETING", "DELETED")
+
+
+class Reconciler:
+    def __init__(self, media_live_helper, media_package_helper, journal, max_workers=4):
+        self.media_live_helper = media_live_helper
+        self.media_package_helper = media_package_helper
+        self.journal = journal
+        self.max_workers = max_workers
+        # Origin endpoints of formats no longer in the helper's packaging, by format
+        self.removed_endpoints = {}
+
+    def create(self, start=True):
+        graph = TaskGraph.build_pipeline_graph(
+            self.media_live_helper, self.media_package_helper, start=start,
+            max_workers=self.max_workers, wrap=self._journaled)
+        graph.run()
+        return graph
+
+    def apply(self, start=True, prune=False):
+        actual = self.actual_state()
+        self.print_plan(actual)
+        graph = TaskGraph.build_pipeline_graph(
+            self.media_live_helper, self.media_package_helper, start=start, max_workers=self.max_workers,
+            wrap=lambda name, func: self._reconciled(name, func, actual))
+        graph.run()
+        if prune:
+            self.prune()
+        return graph
+
+    def record_adopted(self):
+        # Journals the resources the helpers were handed, e.g. a claimed warm
+        # pipeline, so that rollback and later applies treat them as owned
+        for name in self.resource_types:
+            self.journal.record("adopted", name, self._resource_id(name), **self._details(name))
+
+    @property
+    def resource_types(self):
+        if self.media_live_helper.standby:
+            return RESOURCE_TYPES
+        return tuple(name for name in RESOURCE_TYPES if name != "standby_input")
+
+    def actual_state(self):
+        resources, pending = self.journal.state()
+        with ThreadPoolExecutor(max_workers=len(self.resource_types)) as pool:
+            futures = {name: pool.submit(self._find, name, resources.get(name), name in pending)
+                       for name in self.resource_types}
+        return {name: future.result() for name, future in futures.items()}
+
+    def plan(self, actual):
+        plan = {}
+        for name in self.resource_types:
+            current = actual[name]
+            if current is None:
+                plan[name] = "create"
+            elif current.get("missing") or current.get("digest") != self._digest(name):
+                plan[name] = "update"
+            else:
+                plan[name] = "keep"
+        return plan
+
+    def print_plan(self, actual):
+        print("Plan:")
+        for name, action in self.plan(actual).items():
+            current = actual[name]
+            suffix = f" ({current['id']})" if current else ""
+            print(f"\t {action:<6} {name}{suffix}")
+            if name == "mediapackage_endpoint":
+                for endpoint_id in self.removed_endpoints.values():
+                    print(f"\t {'delete':<6} {name} ({endpoint_id})")
+
+    def rollback(self):
+        resources, pending = self.journal.state()
+        found = {name: self._find(name, resources.get(name), name in pending) for name in RESOURCE_TYPES}
+        helper = self.media_live_helper
+        package_helper = self.media_package_helper
+        chains = [
+            [self._stage(found, "channel", helper.teardown_channel),
+             self._stage(found, "input", helper.delete_input),
+             self._stage(found, "standby_input", helper.delete_input),
+             self._stage(found, "input_security_group", helper.delete_input_security_group)],
+            [self._stage(found, "mediapackage_endpoint", package_helper.delete_origin_endpoint,
+                         self.removed_endpoints.values()),
+             self._stage(found, "mediapackage_channel", package_helper.delete_channel)],
+        ]
+        engine = CleanupEngine.CleanupEngine(max_workers=self.max_workers)
+        engine.run_chains(chains)
+        ok = engine.report()
+        if ok:
+            self.journal.archive()
+        return ok
+
+    def prune(self):
+        # Tagged MediaLive resources this pipeline's journal doesn't own, e.g.
+        # left behind by earlier non-idempotent runs. This one does list.
+        resources, _ = self.journal.state()
+        helper = self.media_live_helper
+        for name, delete in (("channel", helper.teardown_channel),
+                             ("input", helper.delete_input),
+                             ("input_security_group", helper.delete_input_security_group)):
+            owned = {resources.get(name, {}).get("id")}
+            if name == "input":
+                owned.add(resources.get("standby_input", {}).get("id"))
+            for resource_id in helper.discovery.find_ids(*DISCOVERY[name]):
+                if resource_id not in owned:
+                    print(f"Pruning unowned {name} {resource_id}")
+                    delete(resource_id)
+
+    def _stage(self, found, name, delete, extra_ids=()):
+        def discover():
+            ids = found[name].get("ids", [found[name]["id"]]) if found[name] else []
+            return ids + list(extra_ids)
+
+        def delete_and_record(resource_id):
+            try:
+                delete(resource_id)
+            except botocore.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] not in ("NotFoundException", "NotFound"):
+                    raise
+            self.journal.record("deleted", name, resource_id)
+
+        return (name, discover, delete_and_record)
+
+    def _find(self, name, journaled, pending):
+        resource_id = journaled["id"] if journaled else None
+        if name == "mediapackage_channel" and not journaled:
+            resource_id = self.media_package_helper.channel_id
+        elif name == "mediapackage_endpoint":
+            # Adopted endpoints keep the IDs they were created with
+            endpoint_ids = journaled["details"].get("endpoint_ids", {}) if journaled else {}
+            for packaging_format, endpoint_id in endpoint_ids.items():
+                if packaging_format in self.media_package_helper.packaging:
+                    self.media_package_helper.origin_endpoint_ids[packaging_format] = endpoint_id
+            resource_id = self.media_package_helper.origin_endpoint_id = \
+                self.media_package_helper.origin_endpoint_ids[self.media_package_helper.packaging[0]]
+            self.removed_endpoints = self._find_removed_endpoints(endpoint_ids)
+
+        current = self._describe(name, resource_id) if resource_id else None
+        if current is None and pending and name in DISCOVERY:
+            for discovered_id in self.media_live_helper.discovery.find_ids(*DISCOVERY[name], limit=1):
+                current = self._describe(name, discovered_id)
+                if current is not None:
+                    self.journal.record("adopted", name, discovered_id)
+        if current is not None and journaled and journaled["id"] == current["id"]:
+            current["digest"] = journaled["details"].get("digest")
+        return current
+
+    def _describe(self, name, resource_id):
+        ml = self.media_live_helper.client
+        mp = self.media_package_helper.client
+        try:
+            if name == "mediapackage_channel":
+                mp.describe_channel(Id=resource_id)
+                return {"id": resource_id}
+            if name == "mediapackage_endpoint":
+                return self._describe_endpoints()
+            if name == "input_security_group":
+                response = ml.describe_input_security_group(InputSecurityGroupId=resource_id)
+                return None if response["State"] == "DELETED" else {"id": resource_id}
+            if name in ("input", "standby_input"):
+                response = ml.describe_input(InputId=resource_id)
+                if response["State"] in GONE_STATES:
+                    return None
+                return {"id": resource_id, "destinations": response["Destinations"]}
+            if name == "channel":
+                response = ml.describe_channel(ChannelId=resource_id)
+                if response["State"] in GONE_STATES:
+                    return None
+                return {"id": resource_id, "state": response["State"],
+                        "destination_id": response["Destinations"][0]["Id"]}
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("NotFoundException", "NotFound"):
+                return None
+            raise
+
+    def _find_removed_endpoints(self, endpoint_ids):
+        # Endpoints of formats taken out of --packaging. Journals from before
+        # endpoint IDs were recorded fall back to the IDs derived from the name.
+        helper = self.media_package_helper
+        removed = {}
+        for packaging_format in MediaPackageHelper.PACKAGING:
+            if packaging_format in helper.packaging:
+                continue
+            endpoint_id = endpoint_ids.get(packaging_format) or helper._endpoint_id(
+                helper.resource_prefix, packaging_format)
+            if ResourceIndex.exists(helper.client.describe_origin_endpoint, Id=endpoint_id):
+                removed[packaging_format] = endpoint_id
+        return removed
+
+    def _delete_removed_endpoints(self):
+        for packaging_format, endpoint_id in self.removed_endpoints.items():
+            print(f"{MediaPackageHelper.PACKAGING[packaging_format]} is no longer in --packaging")
+            try:
+                self.media_package_helper.delete_origin_endpoint(endpoint_id)
+            except botocore.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] not in ("NotFoundException", "NotFound"):
+                    raise
+            self.journal.record("deleted", "mediapackage_endpoint", endpoint_id)
+        self.removed_endpoints = {}
+
+    def _describe_endpoints(self):
+        # One endpoint per packaging format, present as long as any of them exists
+        helper = self.media_package_helper
+        urls = {}
+        missing = []
+        for packaging_format, endpoint_id in helper.origin_endpoint_ids.items():
+            try:
+                response = helper.client.describe_origin_endpoint(Id=endpoint_id)
+                urls[packaging_format] = MediaPackageHelper.playback_url(response)
+            except botocore.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] not in ("NotFoundException", "NotFound"):
+                    raise
+                missing.append(packaging_format)
+        if not urls:
+            return None
+        return {"id": helper.origin_endpoint_id, "ids": [helper.origin_endpoint_ids[f] for f in urls],
+                "urls": urls, "missing": missing}
+
+    def _journaled(self, name, func):
+        if name not in RESOURCE_TYPES:
+            return func
+
+        def step():
+            self.journal.record("intent", name)
+            result = func()
+            self.journal.record("created", name, self._resource_id(name), **self._details(name))
+            return result
+        return step
+
+    def _reconciled(self, name, func, actual):
+        if name not in RESOURCE_TYPES:
+            return func
+
+        def step():
+            if name == "mediapackage_endpoint":
+                self._delete_removed_endpoints()
+            current = actual[name]
+            if current is None:
+                return self._journaled(name, func)()
+            self._adopt(name, current)
+            if current.get("missing"):
+                self.media_package_helper._create_endpoints(current["missing"])
+            digest = self._digest(name)
+            if current.get("digest") == digest:
+                print(f"{name} {current['id']} is up to date")
+            elif self._update(name, current):
+                self.journal.record("updated", name, current["id"], **self._details(name))
+        return step
+
+    def _adopt(self, name, current):
+        helper = self.media_live_helper
+        if name == "mediapackage_channel":
+            self.media_package_helper.channel_id = current["id"]
+            helper.media_package_channel_id = current["id"]
+        elif name == "mediapackage_endpoint":
+            self.media_package_helper.origin_urls.update(current["urls"])
+        elif name == "input_security_group":
+            helper.security_group_id = current["id"]
+        elif name == "input":
+            helper.input_id = current["id"]
+            helper.input_destinations = current["destinations"]
+        elif name == "standby_input":
+            helper.standby_input_id = current["id"]
+            helper.standby_destinations = current["destinations"]
+        elif name == "channel":
+            helper.channel_id = current["id"]
+
+    def _update(self, name, current):
+        if name == "mediapackage_endpoint":
+            self.media_package_helper.update_endpoints(list(current["urls"]))
+        elif name == "input_security_group":
+            self.media_live_helper.update_input_security_group(current["id"])
+        elif name == "standby_input":
+            # MediaLive can't change the type of an input, so it has to be recreated
+            print(f"Standby input {current['id']} was created for another source, roll back to replace it")
+            return False
+        elif name == "channel":
+            if current["state"] != "IDLE":
+                print(f"Channel {current['id']} is {current['state']}, stop it to apply its new settings")
+                return False
+            self.media_live_helper.update_channel(current["id"], current["destination_id"])
+        return True
+
+    def _resource_id(self, name):
+        return {
+            "mediapackage_channel": lambda: self.media_package_helper.channel_id,
+            "mediapackage_endpoint": lambda: self.media_package_helper.origin_endpoint_id,
+            "input_security_group": lambda: self.media_live_helper.security_group_id,
+            "input": lambda: self.media_live_helper.input_id,
+            "standby_input": lambda: self.media_live_helper.standby_input_id,
+            "channel": lambda: self.media_live_helper.channel_id,
+        }[name]()
+
+    def _channel_digest_settings(self):
+        settings = self.media_live_helper._encoder_settings("destination")
+        if self.media_live_helper.standby:
+            # Attaching a standby input is a channel change too, pipelines
+            # without one keep the digest they were journaled with
+            return {"encoder": settings, "standby": self.media_live_helper.standby}
+        return settings
+
+    def _details(self, name):
+        # What a journal entry records besides the ID
+        details = {"digest": self._digest(name)}
+        if name == "mediapackage_endpoint":
+            details["endpoint_ids"] = dict(self.media_package_helper.origin_endpoint_ids)
+        return details
+
+    def _digest(self, name):
+        # Fingerprint of the settings a resource was created or last updated
+        # with, leaving out the IDs of the resources it refers to
+        desired = {
+            "mediapackage_endpoint": lambda: self.media_package_helper.packages(),
+            "input_security_group": lambda: self.media_live_helper.security_cidr,
+            "channel": self._channel_digest_settings,
+            "standby_input": lambda: self.media_live_helper.standby,
+        }.get(name)
+        if desired is None:
+            return None
+        return hashlib.sha256(json.dumps(desired(), sort_keys=True).encode()).hexdigest()
@@ -0,0 +1,50 @@
+from itertools import islice
+
+# Python Module for finding the resources owned by a pipeline
+# without pulling the whole account into memory first
+
+# Results are streamed page by page through the boto3 paginators and
+# callers can stop as soon as they have what they need. Where the
+# resource ID can be recovered from its ARN the 'project' tag filter is
+# pushed server side to the Resource Groups Tagging API instead.
+
+
+def matches_tags(item, tags):
+    item_tags = item.get("Tags") or {}
+    return "project" in item_tags and item_tags["project"] == tags["project"]
+
+
+class ResourceDiscovery:
+    def __init__(self, client, tags, tagging_client=None):
+        self.client = client
+        self.tags = tags
+        self.tagging_client = tagging_client
+
+    def find(self, operation, result_key, limit=None, **kwargs):
+        return islice(self._iter_tagged(operation, result_key, **kwargs), limit)
+
+    def find_ids(self, operation, result_key, resource_type=None, limit=None):
+        if self.tagging_client and resource_type:
+            ids = self._iter_tagged_arns(resource_type)
+        else:
+            ids = (item["Id"] for item in self._iter_tagged(operation, result_key))
+        return islice(ids, limit)
+
+    def _iter_tagged(self, operation, result_key, **kwargs):
+        paginator = self.client.get_paginator(operation)
+        for page in paginator.paginate(**kwargs):
+            for item in page.get(result_key, []):
+                if matches_tags(item, self.tags):
+                    yield item
+
+    def _iter_tagged_arns(self, resource_type):
+        paginator = self.tagging_client.get_paginator("get_resources")
+        pages = paginator.paginate(
+            TagFilters=[{"Key": "project", "Values": [self.tags["project"]]}],
+            ResourceTypeFilters=[resource_type],
+        )
+        for page in pages:
+            for mapping in page["ResourceTagMappingList"]:
+                # MediaLive ARNs end in the numeric resource ID,
+                # e.g. arn:aws:medialive:region:account:channel:1234567
+                yield mapping["ResourceARN"].rsplit(":", 1)[-1]
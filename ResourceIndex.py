@@ -0,0 +1,111 @@
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+
+# Python Module caching the IDs of a pipeline's resources on disk
+
+# Entries are keyed by pipeline name, region and kind (channel, input,
+# input_security_group, package_channel, <packaging>_origin_endpoint,
+# origin_url, role_arn) and expire after a TTL. Callers validate an entry
+# with a direct describe call the first time they use it and forget it
+# when that fails, falling back to discovery, so a stale entry costs one
+# call rather than a wrong answer.
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".elemental-demo", "index.sqlite3")
+DEFAULT_TTL = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    pipeline TEXT NOT NULL,
+    region TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (pipeline, region, kind)
+)
+"""
+
+
+class ResourceIndex:
+    def __init__(self, pipeline_name, region_name=None, path=DEFAULT_PATH, ttl=DEFAULT_TTL):
+        self.pipeline_name = pipeline_name
+        self.region_name = region_name or "default"
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._validated = set()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # A connection per operation keeps the index usable from worker threads
+        # and from several processes at once
+        with contextlib.closing(sqlite3.connect(self.path, timeout=30)) as connection:
+            with connection:
+                yield connection
+
+    def get(self, kind):
+        with self._lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT value, updated FROM resources WHERE pipeline = ? AND region = ? AND kind = ?",
+                (self.pipeline_name, self.region_name, kind)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def lookup(self, kind, validate):
+        # validate(value) returns False when the cached resource no longer exists
+        value = self.get(kind)
+        if value is None:
+            return None
+        if (kind, value) in self._validated:
+            return value
+        if validate(value):
+            self._validated.add((kind, value))
+            return value
+        self.forget(kind)
+        return None
+
+    def put(self, kind, value):
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO resources (pipeline, region, kind, value, updated) VALUES (?, ?, ?, ?, ?)",
+                (self.pipeline_name, self.region_name, kind, value, time.time()))
+        self._validated.add((kind, value))
+
+    def forget(self, kind=None):
+        query = "DELETE FROM resources WHERE pipeline = ? AND region = ?"
+        params = (self.pipeline_name, self.region_name)
+        if kind is not None:
+            query += " AND kind = ?"
+            params += (kind,)
+        with self._lock, self._connect() as connection:
+            connection.execute(query, params)
+        self._validated = {v for v in self._validated if kind is not None and v[0] != kind}
+
+    def entries(self):
+        with self._lock, self._connect() as connection:
+            rows = connection.execute(
+                "SELECT kind, value, updated FROM resources WHERE pipeline = ? AND region = ? ORDER BY kind",
+                (self.pipeline_name, self.region_name)).fetchall()
+        return {kind: (value, updated) for kind, value, updated in rows}
+
+
+def exists(describe, **kwargs):
+    # Validation for lookup(): a describe call that finds the resource alive
+    try:
+        response = describe(**kwargs)
+    except Exception as e:
+        code = getattr(e, "response", {}).get("Error", {}).get("Code")
+        if code in ("NotFoundException", "NotFound"):
+            return False
+        raise
+    return response.get("State") not in ("DELETING", "DELETED")
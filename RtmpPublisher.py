@@ -0,0 +1,616 @@
+import heapq
+import mmap
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import threading
+import time
+import urllib.parse
+from collections import Counter
+
+# Python Module publishing a test stream to an RTMP ingest such as a
+# MediaLive RTMP_PUSH input
+
+# Performs the RTMP handshake and the connect/createStream/publish
+# exchange, then sends the tags of an FLV file paced by their timestamps
+# so the stream arrives in real time. Tag payloads are memoryview slices
+# of the memory mapped file, written out chunk by chunk with scatter/gather
+# sendmsg() calls, so media is never copied on its way to the socket.
+# LocalRtmpServer is a stand-in ingest on localhost for testing offline.
+
+HANDSHAKE_SIZE = 1536
+DEFAULT_PORT = 1935
+CHUNK_SIZE = 4096
+# Most systems refuse sendmsg() calls with more buffers than this
+MAX_BUFFERS_PER_SEND = 512
+
+# Message types
+SET_CHUNK_SIZE = 1
+ACKNOWLEDGEMENT = 3
+WINDOW_ACK_SIZE = 5
+SET_PEER_BANDWIDTH = 6
+AUDIO = 8
+VIDEO = 9
+DATA = 18
+COMMAND = 20
+
+# Chunk stream IDs used for each kind of message
+COMMAND_CSID = 3
+AUDIO_CSID = 4
+DATA_CSID = 5
+VIDEO_CSID = 6
+
+ACK_WINDOW = 2500000
+
+_AMF0_END = b"\x00\x00\x09"
+
+
+class RtmpError(Exception):
+    pass
+
+
+def amf0_encode(*values):
+    return b"".join(_amf0_value(v) for v in values)
+
+
+def _amf0_value(value):
+    if value is None:
+        return b"\x05"
+    if isinstance(value, bool):
+        return b"\x01" + bytes([value])
+    if isinstance(value, (int, float)):
+        return b"\x00" + struct.pack(">d", value)
+    if isinstance(value, str):
+        encoded = value.encode("utf-8")
+        if len(encoded) > 0xFFFF:
+            return b"\x0c" + struct.pack(">I", len(encoded)) + encoded
+        return b"\x02" + struct.pack(">H", len(encoded)) + encoded
+    if isinstance(value, dict):
+        return b"\x03" + _amf0_properties(value) + _AMF0_END
+    raise TypeError(f"Cannot AMF0 encode {type(value).__name__}")
+
+
+def _amf0_properties(values):
+    encoded = b""
+    for key, value in values.items():
+        name = key.encode("utf-8")
+        encoded += struct.pack(">H", len(name)) + name + _amf0_value(value)
+    return encoded
+
+
+def amf0_decode(data):
+    values = []
+    offset = 0
+    while offset < len(data):
+        value, offset = _amf0_read(data, offset)
+        values.append(value)
+    return values
+
+
+def _amf0_read(data, offset):
+    marker = data[offset]
+    offset += 1
+    if marker == 0x00:
+        return struct.unpack_from(">d", data, offset)[0], offset + 8
+    if marker == 0x01:
+        return bool(data[offset]), offset + 1
+    if marker == 0x02:
+        size = struct.unpack_from(">H", data, offset)[0]
+        return bytes(data[offset + 2:offset + 2 + size]).decode("utf-8"), offset + 2 + size
+    if marker == 0x0C:
+        size = struct.unpack_from(">I", data, offset)[0]
+        return bytes(data[offset + 4:offset + 4 + size]).decode("utf-8"), offset + 4 + size
+    if marker in (0x05, 0x06):
+        return None, offset
+    if marker in (0x03, 0x08):
+        if marker == 0x08:
+            # ECMA arrays carry an (unreliable) entry count before the properties
+            offset += 4
+        values = {}
+        while bytes(data[offset:offset + 3]) != _AMF0_END:
+            size = struct.unpack_from(">H", data, offset)[0]
+            key = bytes(data[offset + 2:offset + 2 + size]).decode("utf-8")
+            values[key], offset = _amf0_read(data, offset + 2 + size)
+        return values, offset + 3
+    if marker == 0x0A:
+        count = struct.unpack_from(">I", data, offset)[0]
+        offset += 4
+        values = []
+        for _ in range(count):
+            value, offset = _amf0_read(data, offset)
+            values.append(value)
+        return values, offset
+    raise RtmpError(f"Unsupported AMF0 type 0x{marker:02x}")
+
+
+def _basic_header(fmt, csid):
+    if csid < 64:
+        return bytes([fmt << 6 | csid])
+    if csid < 320:
+        return bytes([fmt << 6, csid - 64])
+    return bytes([fmt << 6 | 1, (csid - 64) & 0xFF, (csid - 64) >> 8])
+
+
+class ChunkStream:
+    # RTMP messages in and out of a connected socket
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+        self.in_chunk_size = 128
+        self.out_chunk_size = 128
+        self.ack_window = None
+        self.bytes_received = 0
+        self._acknowledged = 0
+        self._incoming = {}
+
+    def client_handshake(self):
+        self.sock.sendall(b"\x03" + struct.pack(">II", 0, 0) + os.urandom(HANDSHAKE_SIZE - 8))
+        response = self._read(1 + 2 * HANDSHAKE_SIZE)
+        if response[0] != 3:
+            raise RtmpError(f"Server answered with RTMP version {response[0]}")
+        # C2 echoes S1
+        self.sock.sendall(response[1:1 + HANDSHAKE_SIZE])
+
+    def server_handshake(self):
+        request = self._read(1 + HANDSHAKE_SIZE)
+        if request[0] != 3:
+            raise RtmpError(f"Client asked for RTMP version {request[0]}")
+        # S2 echoes C1
+        self.sock.sendall(b"\x03" + struct.pack(">II", 0, 0) + os.urandom(HANDSHAKE_SIZE - 8) + request[1:])
+        self._read(HANDSHAKE_SIZE)
+
+    def set_chunk_size(self, size):
+        self.send(2, SET_CHUNK_SIZE, 0, 0, struct.pack(">I", size))
+        self.out_chunk_size = size
+
+    def send_command(self, *values, stream_id=0, csid=COMMAND_CSID):
+        self.send(csid, COMMAND, stream_id, 0, amf0_encode(*values))
+
+    def send(self, csid, type_id, stream_id, timestamp, payload):
+        # One type 0 chunk, then type 3 continuation chunks, each pointing
+        # into the payload rather than copying it
+        payload = memoryview(payload)
+        extended = b""
+        if timestamp >= 0xFFFFFF:
+            extended = struct.pack(">I", timestamp)
+            timestamp = 0xFFFFFF
+        buffers = [_basic_header(0, csid) + struct.pack(">I", timestamp)[1:] + struct.pack(">I", len(payload))[1:]
+                   + bytes([type_id]) + struct.pack("<I", stream_id) + extended]
+        continuation = _basic_header(3, csid) + extended
+        for offset in range(0, len(payload), self.out_chunk_size):
+            if offset:
+                buffers.append(continuation)
+            buffers.append(payload[offset:offset + self.out_chunk_size])
+        self._send_buffers(buffers)
+
+    def _send_buffers(self, buffers):
+        if not hasattr(self.sock, "sendmsg"):
+            for buffer in buffers:
+                self.sock.sendall(buffer)
+            return
+        index = 0
+        while index < len(buffers):
+            sent = self.sock.sendmsg(buffers[index:index + MAX_BUFFERS_PER_SEND])
+            # Skip whatever went out, keeping the unsent end of a partly sent buffer
+            while sent:
+                size = len(buffers[index])
+                if sent >= size:
+                    sent -= size
+                    index += 1
+                else:
+                    buffers[index] = memoryview(buffers[index])[sent:]
+                    sent = 0
+
+    def read_message(self):
+        # Returns (type_id, stream_id, timestamp, payload) of the next whole message
+        while True:
+            first = self._read(1)[0]
+            fmt, csid = first >> 6, first & 0x3F
+            if csid == 0:
+                csid = 64 + self._read(1)[0]
+            elif csid == 1:
+                low, high = self._read(2)
+                csid = 64 + low + high * 256
+            state = self._incoming.setdefault(csid, {
+                "timestamp": 0, "delta": 0, "length": 0, "type_id": 0, "stream_id": 0, "extended": False,
+                "payload": bytearray()})
+            starting = not state["payload"]
+            if fmt < 3:
+                header = self._read((11, 7, 3)[fmt])
+                stamp = int.from_bytes(header[0:3], "big")
+                state["extended"] = stamp == 0xFFFFFF
+                if state["extended"]:
+                    stamp = struct.unpack(">I", self._read(4))[0]
+                if fmt < 2:
+                    state["length"] = int.from_bytes(header[3:6], "big")
+                    state["type_id"] = header[6]
+                if fmt == 0:
+                    state["stream_id"] = struct.unpack("<I", header[7:11])[0]
+                    state["timestamp"] = state["delta"] = stamp
+                else:
+                    state["delta"] = stamp
+                    state["timestamp"] += stamp
+            else:
+                if state["extended"]:
+                    self._read(4)
+                if starting:
+                    state["timestamp"] += state["delta"]
+            payload = state["payload"]
+            payload += self._read(min(self.in_chunk_size, state["length"] - len(payload)))
+            if len(payload) < state["length"]:
+                continue
+            state["payload"] = bytearray()
+            message = state["type_id"], state["stream_id"], state["timestamp"], bytes(payload)
+            self._control(*message)
+            return message
+
+    def _control(self, type_id, stream_id, timestamp, payload):
+        if type_id == SET_CHUNK_SIZE:
+            self.in_chunk_size = struct.unpack(">I", payload[:4])[0] & 0x7FFFFFFF
+        elif type_id == WINDOW_ACK_SIZE:
+            self.ack_window = struct.unpack(">I", payload[:4])[0]
+
+    def _read(self, size):
+        data = self.reader.read(size)
+        if len(data) < size:
+            raise ConnectionError("RTMP peer closed the connection")
+        self.bytes_received += size
+        if self.ack_window and self.bytes_received - self._acknowledged >= self.ack_window:
+            self._acknowledged = self.bytes_received
+            self.send(2, ACKNOWLEDGEMENT, 0, 0, struct.pack(">I", self.bytes_received & 0xFFFFFFFF))
+        return data
+
+
+def parse_url(url, stream_name=None):
+    # rtmp://host[:port]/app[/stream], where a URL with only an application
+    # name (as MediaLive hands out) publishes a stream of the same name
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme != "rtmp":
+        raise ValueError(f"Only rtmp:// URLs are supported, not {url}")
+    app, _, stream = parts.path.strip("/").partition("/")
+    return parts.hostname, parts.port or DEFAULT_PORT, app, stream_name or stream or app, \
+        f"rtmp://{parts.netloc}/{app}"
+
+
+class FlvFile:
+    # Tags of an FLV file as memoryviews into the memory mapped file
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self._mmap)
+        if bytes(self.data[:3]) != b"FLV":
+            self.close()
+            raise ValueError(f"{path} is not an FLV file")
+        # Skip the header and the zero PreviousTagSize that follows it
+        self._first_tag = struct.unpack(">I", self.data[5:9])[0] + 4
+
+    def tags(self):
+        # Yields (tag type, timestamp in ms, payload)
+        offset = self._first_tag
+        while offset + 11 <= len(self.data):
+            tag_type = self.data[offset] & 0x1F
+            size = int.from_bytes(self.data[offset + 1:offset + 4], "big")
+            timestamp = int.from_bytes(self.data[offset + 4:offset + 7], "big") | self.data[offset + 7] << 24
+            start = offset + 11
+            if start + size > len(self.data):
+                return
+            yield tag_type, timestamp, self.data[start:start + size]
+            offset = start + size + 4
+
+    def looped(self, duration):
+        # The tags played back to back until duration seconds of media, with
+        # timestamps carried on across loops and metadata sent only once
+        offset = 0
+        while True:
+            last = 0
+            sent = False
+            for tag_type, timestamp, payload in self.tags():
+                if offset and tag_type == DATA:
+                    continue
+                if offset + timestamp >= duration * 1000:
+                    return
+                last = max(last, timestamp)
+                sent = True
+                yield tag_type, offset + timestamp, payload
+            if not sent:
+                return
+            # Leave one frame's worth of gap before the next loop
+            offset += last + 20
+
+    def close(self):
+        self.data.release()
+        self._mmap.close()
+
+
+def synthetic_tags(duration, video_bitrate=4000000, audio_bitrate=192000, fps=50, gop_seconds=2):
+    # FLV shaped AVC/AAC tags with filler payloads at the given bitrates.
+    # They exercise pacing and ingest throughput but are not decodable, so
+    # they are only for LocalRtmpServer; a real encoder needs test_pattern().
+    frames_per_gop = fps * gop_seconds
+    # Keyframes are sent five times the size of the frames in between
+    frame_size = max(1, int(video_bitrate * gop_seconds / 8 / (frames_per_gop + 4)))
+    keyframe = memoryview(b"\x17\x01\x00\x00\x00" + bytes(frame_size * 5))
+    interframe = memoryview(b"\x27\x01\x00\x00\x00" + bytes(frame_size))
+    audio_frame = memoryview(b"\xaf\x01" + bytes(max(1, int(audio_bitrate * 1024 / 48000 / 8))))
+
+    def video():
+        yield VIDEO, 0, memoryview(b"\x17\x00\x00\x00\x00\x01\x64\x00\x28\xff\xe0\x00")
+        for frame in range(int(duration * fps)):
+            yield VIDEO, frame * 1000 // fps, keyframe if frame % frames_per_gop == 0 else interframe
+
+    def audio():
+        # AAC LC, 48kHz stereo
+        yield AUDIO, 0, memoryview(b"\xaf\x00\x11\x90")
+        for frame in range(int(duration * 48000 / 1024)):
+            yield AUDIO, frame * 1024 * 1000 // 48000, audio_frame
+
+    metadata = amf0_encode("onMetaData", {"videocodecid": 7.0, "audiocodecid": 10.0, "framerate": float(fps),
+                                          "videodatarate": video_bitrate / 1000, "audiodatarate": audio_bitrate / 1000})
+    yield DATA, 0, memoryview(metadata)
+    yield from heapq.merge(video(), audio(), key=lambda tag: tag[1])
+
+
+def test_pattern(path, seconds=10, width=1280, height=720, fps=50, bitrate=3000000, gop_seconds=2):
+    # Encodes a colour bar test pattern with a tone into an FLV file, which
+    # needs ffmpeg to be installed
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("Generating a test pattern needs ffmpeg on the PATH, or pass an FLV file instead")
+    subprocess.run([
+        ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}",
+        "-f", "lavfi", "-i", "sine=frequency=1000:sample_rate=48000",
+        "-t", str(seconds),
+        "-c:v", "libx264", "-preset", "veryfast", "-tune", "zerolatency", "-pix_fmt", "yuv420p",
+        "-b:v", str(bitrate), "-maxrate", str(bitrate), "-bufsize", str(bitrate * 2),
+        "-g", str(fps * gop_seconds), "-keyint_min", str(fps * gop_seconds),
+        "-c:a", "aac", "-b:a", "128k", "-ac", "2",
+        "-f", "flv", path,
+    ], check=True)
+    return path
+
+
+class PublishReport:
+    def __init__(self):
+        self.seconds = 0.0
+        self.media_seconds = 0.0
+        self.messages = Counter()
+        self.bytes = Counter()
+        self.stalls = 0
+        self.stalled_seconds = 0.0
+        self.late_tags = 0
+        self.max_lag = 0.0
+
+    @property
+    def total_bytes(self):
+        return sum(self.bytes.values())
+
+    @property
+    def bitrate(self):
+        return self.total_bytes * 8 / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "seconds": self.seconds,
+            "media_seconds": self.media_seconds,
+            "bytes": self.total_bytes,
+            "video_bytes": self.bytes["video"],
+            "audio_bytes": self.bytes["audio"],
+            "messages": dict(self.messages),
+            "bitrate_mbps": self.bitrate / 1e6,
+            "stalls": self.stalls,
+            "stalled_seconds": self.stalled_seconds,
+            "late_tags": self.late_tags,
+            "max_lag_seconds": self.max_lag,
+        }
+
+
+class RtmpPublisher:
+    def __init__(self, url, stream_name=None, chunk_size=CHUNK_SIZE, timeout=10, stall_threshold=0.05):
+        self.host, self.port, self.app, self.stream_name, self.tc_url = parse_url(url, stream_name)
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        # A send blocking for longer than this counts as a stall
+        self.stall_threshold = stall_threshold
+        self.sock = None
+        self.chunks = None
+        self.stream_id = None
+        self._transaction = 0
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.chunks = ChunkStream(self.sock)
+        self.chunks.client_handshake()
+        self.chunks.set_chunk_size(self.chunk_size)
+        self._call("connect", {"app": self.app, "type": "nonprivate", "flashVer": "FMLE/3.0 (compatible; ElementalDemo)",
+                               "tcUrl": self.tc_url})
+        # Not every server answers these, so don't wait for them
+        self.chunks.send_command("releaseStream", self._next_transaction(), None, self.stream_name)
+        self.chunks.send_command("FCPublish", self._next_transaction(), None, self.stream_name)
+        self.stream_id = int(self._call("createStream")[3])
+        self.chunks.send_command("publish", 0, None, self.stream_name, "live", stream_id=self.stream_id,
+                                 csid=DATA_CSID)
+        self._wait_for_status("NetStream.Publish.Start")
+
+    def _next_transaction(self):
+        self._transaction += 1
+        return self._transaction
+
+    def _call(self, name, *args):
+        transaction = self._next_transaction()
+        self.chunks.send_command(name, transaction, *(args or (None,)))
+        while True:
+            type_id, _, _, payload = self.chunks.read_message()
+            if type_id != COMMAND:
+                continue
+            values = amf0_decode(payload)
+            if values[0] in ("_result", "_error") and values[1] == transaction:
+                if values[0] == "_error":
+                    info = values[3] if len(values) > 3 and isinstance(values[3], dict) else {}
+                    raise RtmpError(f"{name} failed: {info.get('code')} {info.get('description', '')}".strip())
+                return values
+
+    def _wait_for_status(self, code):
+        while True:
+            type_id, _, _, payload = self.chunks.read_message()
+            if type_id != COMMAND:
+                continue
+            values = amf0_decode(payload)
+            if values[0] != "onStatus":
+                continue
+            info = values[3] if len(values) > 3 and isinstance(values[3], dict) else {}
+            if info.get("code") == code:
+                return info
+            if info.get("level") == "error":
+                raise RtmpError(f"{info.get('code')} {info.get('description', '')}".strip())
+
+    def publish(self, tags):
+        # Sends the tags in real time, as paced by their timestamps
+        report = PublishReport()
+        start = time.monotonic()
+        first = None
+        for tag_type, timestamp, payload in tags:
+            first = timestamp if first is None else first
+            due = start + (timestamp - first) / 1000
+            lag = time.monotonic() - due
+            if lag < 0:
+                time.sleep(-lag)
+            elif lag > self.stall_threshold:
+                report.late_tags += 1
+                report.max_lag = max(report.max_lag, lag)
+            if tag_type == DATA:
+                csid, kind = DATA_CSID, "data"
+                payload = amf0_encode("@setDataFrame") + bytes(payload)
+            elif tag_type == AUDIO:
+                csid, kind = AUDIO_CSID, "audio"
+            else:
+                csid, kind = VIDEO_CSID, "video"
+            sending = time.monotonic()
+            self.chunks.send(csid, tag_type, self.stream_id, timestamp, payload)
+            blocked = time.monotonic() - sending
+            if blocked > self.stall_threshold:
+                report.stalls += 1
+                report.stalled_seconds += blocked
+            report.messages[kind] += 1
+            report.bytes[kind] += len(payload)
+            report.media_seconds = (timestamp - first) / 1000
+        report.seconds = time.monotonic() - start
+        return report
+
+    def close(self):
+        if self.sock is None:
+            return
+        try:
+            if self.stream_id is not None:
+                self.chunks.send_command("FCUnpublish", self._next_transaction(), None, self.stream_name)
+                self.chunks.send_command("deleteStream", self._next_transaction(), None, self.stream_id)
+        except OSError:
+            pass
+        self.sock.close()
+        self.sock = None
+
+
+def print_report(report):
+    print(f"Published {report.media_seconds:.1f}s of media in {report.seconds:.1f}s: "
+          f"{report.total_bytes / 1e6:.1f} MB at {report.bitrate / 1e6:.2f} Mbps")
+    for kind, count in sorted(report.messages.items()):
+        print(f"\t {kind}: {count} messages, {report.bytes[kind] / 1e6:.1f} MB")
+    print(f"\t Send stalls: {report.stalls} ({report.stalled_seconds:.2f}s blocked)")
+    print(f"\t Late tags: {report.late_tags} (at most {report.max_lag * 1000:.0f}ms behind real time)")
+
+
+class PublishedStream:
+    def __init__(self, client_address):
+        self.client_address = client_address
+        self.app = None
+        self.stream_name = None
+        self.publishing = False
+        self.messages = Counter()
+        self.bytes = Counter()
+        self.last_timestamp = 0
+
+
+class LocalRtmpServer:
+    # Accepts publishers on localhost, answering connect, createStream and
+    # publish the way an ingest does and counting the media that arrives.
+    # read_rate (bytes per second) throttles reading to simulate a slow link.
+    def __init__(self, port=0, read_rate=None):
+        self.listener = socket.create_server(("127.0.0.1", port))
+        if read_rate:
+            # A small receive window (set before accepting, so the TCP window
+            # scale matches) lets the throttling push back on publishers
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
+        self.read_rate = read_rate
+        self.streams = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"rtmp://127.0.0.1:{self.listener.getsockname()[1]}/live/test"
+
+    def start(self):
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, address = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn, address), daemon=True).start()
+
+    def _serve(self, conn, address):
+        stream = PublishedStream(address)
+        with self._lock:
+            self.streams.append(stream)
+        chunks = ChunkStream(conn)
+        started = time.monotonic()
+        try:
+            chunks.server_handshake()
+            while True:
+                type_id, stream_id, timestamp, payload = chunks.read_message()
+                if type_id == COMMAND:
+                    self._command(chunks, stream, amf0_decode(payload))
+                elif type_id in (AUDIO, VIDEO, DATA):
+                    kind = {AUDIO: "audio", VIDEO: "video", DATA: "data"}[type_id]
+                    stream.messages[kind] += 1
+                    stream.bytes[kind] += len(payload)
+                    stream.last_timestamp = timestamp
+                if self.read_rate:
+                    ahead = chunks.bytes_received / self.read_rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (ConnectionError, OSError, RtmpError):
+            pass
+        finally:
+            stream.publishing = False
+            conn.close()
+
+    def _command(self, chunks, stream, values):
+        name, transaction = values[0], values[1]
+        if name == "connect":
+            stream.app = (values[2] or {}).get("app")
+            chunks.send(2, WINDOW_ACK_SIZE, 0, 0, struct.pack(">I", ACK_WINDOW))
+            chunks.send(2, SET_PEER_BANDWIDTH, 0, 0, struct.pack(">IB", ACK_WINDOW, 2))
+            chunks.ack_window = ACK_WINDOW
+            chunks.set_chunk_size(CHUNK_SIZE)
+            chunks.send_command("_result", transaction, {"fmsVer": "FMS/3,0,1,123", "capabilities": 31},
+                                {"level": "status", "code": "NetConnection.Connect.Success",
+                                 "description": "Connection succeeded.", "objectEncoding": 0})
+        elif name == "createStream":
+            chunks.send_command("_result", transaction, None, 1)
+        elif name == "publish":
+            stream.stream_name = values[3]
+            stream.publishing = True
+            chunks.send_command("onStatus", 0, None, {
+                "level": "status", "code": "NetStream.Publish.Start",
+                "description": f"{stream.stream_name} is now published."}, stream_id=1, csid=DATA_CSID)
+        elif name == "deleteStream":
+            stream.publishing = False
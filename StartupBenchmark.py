@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+# Measures how long DemoPipeline.py takes to start for invocations that
+# never talk to AWS, and fails if that regresses
+
+# Besides the wall-clock budget the import trace is checked for modules
+# that must only be loaded once AWS is actually needed.
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DemoPipeline.py")
+FORBIDDEN_PREFIXES = ("boto3", "botocore", "MediaLiveHelper", "MediaPackageHelper", "ClientFactory", "Fleet",
+                      "Inventory", "Reconciler", "CloudFrontHelper", "HealthMonitor",
+                      "HlsLoadTest", "RtmpPublisher", "WarmPool", "ControlService")
+
+# Command lines that never call AWS. --help is answered by click before
+# main() runs, the ladder commands go through main() and a subcommand.
+COMMAND_LINES = (
+    ["--help"],
+    ["ladder"],
+    ["ladder", "--bandwidths", "1M,2M,4M,8M", "--max-bitrate", "3M"],
+)
+
+
+def time_invocation(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, SCRIPT] + args, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def import_trace(args):
+    result = subprocess.run([sys.executable, "-X", "importtime", SCRIPT] + args,
+                            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        imports.append((int(cumulative), module.strip()))
+    return imports
+
+
+@click.command()
+@click.option("--runs", default=10, show_default=True, help="Invocations to time per command line")
+@click.option("--max-seconds", default=0.5, show_default=True, help="Fail if the median start-up time exceeds this")
+@click.option("--top", default=10, show_default=True, help="Number of slowest imports to list")
+def main(runs, max_seconds, top):
+    failed = False
+    for args in COMMAND_LINES:
+        failed = benchmark(args, runs, max_seconds, top) or failed
+    sys.exit(1 if failed else 0)
+
+
+def benchmark(args, runs, max_seconds, top):
+    failed = False
+    timings = [time_invocation(args) for _ in range(runs)]
+    median = statistics.median(timings)
+    print(f"DemoPipeline.py {' '.join(args)}: median {median * 1000:.0f}ms, "
+          f"min {min(timings) * 1000:.0f}ms, max {max(timings) * 1000:.0f}ms over {runs} runs")
+    if median > max_seconds:
+        print(f"\t FAIL: median start-up exceeds {max_seconds * 1000:.0f}ms")
+        failed = True
+
+    imports = import_trace(args)
+    forbidden = sorted({m for _, m in imports if m.split(".")[0] in FORBIDDEN_PREFIXES})
+    if forbidden:
+        print(f"\t FAIL: imported {', '.join(forbidden)}")
+        failed = True
+    print("\t Slowest top level imports:")
+    top_level = [(t, m) for t, m in imports if "." not in m]
+    for cumulative, module in sorted(top_level, reverse=True)[:top]:
+        print(f"\t\t {cumulative / 1000:7.1f}ms {module}")
+    return failed
+
+
+if __name__ == "__main__":
+    main()
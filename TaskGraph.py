@@ -0,0 +1,118 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Python Module for running dependent provisioning steps concurrently
+
+# Steps are started as soon as everything they depend on has finished,
+# and the start/finish time of every step is kept so the critical path
+# of the run can be printed afterwards.
+
+
+class Step:
+    def __init__(self, name, func, depends_on):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.started = None
+        self.finished = None
+        self.result = None
+
+
+class TaskGraph:
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.steps = {}
+        self._origin = None
+
+    def add(self, name, func, depends_on=()):
+        for dependency in depends_on:
+            if dependency not in self.steps:
+                raise ValueError(f"Step '{name}' depends on unknown step '{dependency}'")
+        self.steps[name] = Step(name, func, depends_on)
+        return self
+
+    def run(self):
+        self._origin = time.monotonic()
+        pending = dict(self.steps)
+        done = set()
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                if error is None:
+                    for step in [s for s in pending.values() if done.issuperset(s.depends_on)]:
+                        del pending[step.name]
+                        running[pool.submit(self._run_step, step)] = step
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    try:
+                        future.result()
+                        done.add(step.name)
+                    except Exception as e:
+                        error = error or e
+
+        if error is not None:
+            raise error
+        return {name: step.result for name, step in self.steps.items()}
+
+    def _run_step(self, step):
+        step.started = time.monotonic()
+        try:
+            step.result = step.func()
+        finally:
+            step.finished = time.monotonic()
+
+    def critical_path(self):
+        completed = [s for s in self.steps.values() if s.finished is not None]
+        if not completed:
+            return []
+        step = max(completed, key=lambda s: s.finished)
+        path = [step]
+        while step.depends_on:
+            step = max((self.steps[d] for d in step.depends_on), key=lambda s: s.finished)
+            path.append(step)
+        return list(reversed(path))
+
+    def print_timings(self):
+        critical = {s.name for s in self.critical_path()}
+        width = max(len(name) for name in self.steps)
+        print("Step timings (* marks the critical path):")
+        for step in sorted(self.steps.values(), key=lambda s: s.started or float("inf")):
+            if step.finished is None:
+                print(f"\t   {step.name:<{width}}  not run")
+                continue
+            marker = "*" if step.name in critical else " "
+            start = step.started - self._origin
+            end = step.finished - self._origin
+            print(f"\t {marker} {step.name:<{width}}  {start:6.1f}s -> {end:6.1f}s  ({end - start:.1f}s)")
+        path = self.critical_path()
+        if path:
+            total = path[-1].finished - self._origin
+            print(f"Critical path: {' -> '.join(s.name for s in path)} ({total:.1f}s)")
+
+
+def build_pipeline_graph(media_live_helper, media_package_helper, start=True, max_workers=4, wrap=None):
+    # wrap(step_name, func) may replace any step's function, e.g. to journal or skip it
+    wrap = wrap or (lambda name, func: func)
+    graph = TaskGraph(max_workers=max_workers)
+    steps = [
+        ("mediapackage_channel", media_package_helper._create_channel, []),
+        ("mediapackage_endpoint", media_package_helper._create_endpoints, ["mediapackage_channel"]),
+        ("iam_role", lambda: media_live_helper.get_medialive_role_arn, []),
+        ("input_security_group", media_live_helper._create_input_security_group, []),
+        ("input", media_live_helper._create_rtmp_input, ["input_security_group", "iam_role"]),
+        ("channel", media_live_helper._create_channel, ["input", "iam_role", "mediapackage_channel"]),
+    ]
+    if media_live_helper.standby:
+        steps.insert(-1, ("standby_input", media_live_helper._create_standby_input,
+                          ["input_security_group", "iam_role"]))
+        steps[-1][2].append("standby_input")
+    if start:
+        steps.append(("start_channel", media_live_helper.start_channel, ["channel"]))
+    for name, func, depends_on in steps:
+        graph.add(name, wrap(name, func), depends_on)
+    return graph
@@ -0,0 +1,170 @@
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import ChannelWaiter
+import CleanupEngine
+import ClientFactory
+import MediaLiveHelper
+import MediaPackageHelper
+import TaskGraph
+
+# Python Module keeping fully created, IDLE pipelines ready to be handed out
+
+# Warm pipelines are ordinary pipelines under a generated name, tagged
+# with the pool they belong to and the settings they were created with.
+# Claiming one retags every resource with the requested pipeline name (the
+# resource IDs and names keep the generated name) so that going live is
+# just a start_channel. The pool is then refilled on a background thread.
+# Idle MediaLive channels and unattached MediaPackage channels cost
+# little, running ones are billed.
+#
+# Only one process may claim from a pool at a time. Claims are serialised
+# by a lock within the process, but MediaLive has no conditional tagging
+# to make taking a pipeline out of the pool atomic across processes.
+
+# Tag marking which pool a warm pipeline belongs to
+POOL_TAG = "warm_pool"
+
+
+class WarmPipeline:
+    def __init__(self, name, channel_id, channel_arn, state):
+        self.name = name
+        self.channel_id = channel_id
+        self.channel_arn = channel_arn
+        self.state = state
+
+
+class WarmPool:
+    def __init__(self, name="default", size=2, latency_profile="standard", packaging=("hls",),
+                 security_cidr="0.0.0.0/0", session=None, waiter=None, max_workers=4):
+        self.name = name
+        self.size = size
+        self.latency_profile = latency_profile
+        self.packaging = tuple(packaging)
+        self.security_cidr = security_cidr
+        self.session = session or ClientFactory.ClientFactory()
+        self.client = self.session.client("medialive")
+        self.package_client = self.session.client("mediapackage")
+        self.waiter = waiter or ChannelWaiter.ChannelWaiter(self.client)
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+
+    @property
+    def tags(self):
+        # Only pipelines created with the same settings are handed out
+        return {POOL_TAG: self.name, "latency_profile": self.latency_profile, "packaging": "+".join(self.packaging)}
+
+    def members(self, states=("IDLE",)):
+        members = []
+        for page in self.client.get_paginator("list_channels").paginate():
+            for channel in page["Channels"]:
+                tags = channel.get("Tags") or {}
+                if channel["State"] in states and all(tags.get(k) == v for k, v in self.tags.items()):
+                    members.append(WarmPipeline(tags.get("project"), channel["Id"], channel["Arn"], channel["State"]))
+        return members
+
+    def fill(self):
+        # Creates pipelines until the pool holds `size`, counting ones still being created
+        missing = self.size - len(self.members(("CREATING", "IDLE")))
+        if missing <= 0:
+            return []
+        names = [f"warm-{self.name}-{uuid.uuid4().hex[:8]}" for _ in range(missing)]
+        print(f"Adding {missing} pipelines to warm pool '{self.name}'...")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(self._create, names))
+
+    def fill_async(self):
+        # Refills the pool on a daemon thread, the Future resolves to the names added
+        future = Future()
+
+        def fill():
+            try:
+                future.set_result(self.fill())
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=fill, daemon=True).start()
+        return future
+
+    def _create(self, name):
+        media_live_helper, media_package_helper = self._helpers(name)
+        TaskGraph.build_pipeline_graph(media_live_helper, media_package_helper, start=False).run()
+        self.waiter.watch(media_live_helper.channel_id, ("IDLE",)).result()
+        print(f"Warm pipeline {name} is ready")
+        return name
+
+    def _helpers(self, name):
+        tags = dict(self.tags, project=name)
+        media_package_helper = MediaPackageHelper.MediaPackageHelper(
+            name, tags, latency_profile=self.latency_profile, session=self.session, packaging=self.packaging)
+        media_live_helper = MediaLiveHelper.MediaLiveHelper(
+            self.security_cidr, media_package_helper.channel_id, name, tags, waiter=self.waiter,
+            latency_profile=self.latency_profile, session=self.session)
+        return media_live_helper, media_package_helper
+
+    def claim(self, media_live_helper, media_package_helper):
+        # Hands an idle warm pipeline over to the pipeline the helpers were
+        # built for, which then point at its resources. False when the pool
+        # is empty. Not safe against another process claiming from the same
+        # pool, both could be handed the same pipeline.
+        with self._lock:
+            members = self.members()
+            if not members:
+                return False
+            member = members[0]
+            # Taking the pool tags off the channel first removes it from the pool
+            self.client.delete_tags(ResourceArn=member.channel_arn, TagKeys=list(self.tags))
+        print(f"Claiming warm pipeline {member.name} from pool '{self.name}'")
+        try:
+            self._hand_over(member, media_live_helper, media_package_helper)
+        except Exception:
+            # Put it back rather than leave it in neither the pool nor the pipeline
+            self.client.create_tags(ResourceArn=member.channel_arn, Tags=dict(self.tags, project=member.name))
+            raise
+        return True
+
+    def _hand_over(self, member, media_live_helper, media_package_helper):
+        tags = {"project": media_live_helper.tags["project"]}
+        channel = self.client.describe_channel(ChannelId=member.channel_id)
+        input_id = channel["InputAttachments"][0]["InputId"]
+        rtmp_input = self.client.describe_input(InputId=input_id)
+        security_group_id = rtmp_input["SecurityGroups"][0]
+        security_group = self.client.describe_input_security_group(InputSecurityGroupId=security_group_id)
+        package_channel = self.package_client.describe_channel(Id=f"{member.name}_package_channel")
+        endpoints = [e for page in self.package_client.get_paginator("list_origin_endpoints").paginate(
+            ChannelId=package_channel["Id"]) for e in page["OriginEndpoints"]]
+
+        retags = [(self._retag_medialive, arn) for arn in (channel["Arn"], rtmp_input["Arn"], security_group["Arn"])]
+        retags += [(self._retag_mediapackage, r["Arn"]) for r in [package_channel] + endpoints]
+        with ThreadPoolExecutor(max_workers=len(retags)) as pool:
+            for future in [pool.submit(retag, arn, tags) for retag, arn in retags]:
+                future.result()
+
+        media_live_helper.adopt(channel["Id"], input_id, rtmp_input["Destinations"], security_group_id)
+        media_package_helper.adopt(package_channel["Id"], endpoints)
+        # Compared with the group itself, the pool may have been filled with another CIDR
+        if [rule["Cidr"] for rule in security_group["WhitelistRules"]] != [media_live_helper.security_cidr]:
+            media_live_helper.update_input_security_group(security_group_id)
+
+    def _retag_medialive(self, arn, tags):
+        self.client.create_tags(ResourceArn=arn, Tags=tags)
+        self.client.delete_tags(ResourceArn=arn, TagKeys=list(self.tags))
+
+    def _retag_mediapackage(self, arn, tags):
+        self.package_client.tag_resource(ResourceArn=arn, Tags=tags)
+        self.package_client.untag_resource(ResourceArn=arn, TagKeys=list(self.tags))
+
+    def print_status(self):
+        members = self.members(("CREATING", "IDLE"))
+        print(f"Warm pool '{self.name}' ({self.latency_profile}, {'+'.join(self.packaging)}): "
+              f"{len(members)} of {self.size} pipelines")
+        for member in members:
+            print(f"\t {member.name}: channel {member.channel_id} {member.state}")
+
+    def drain(self):
+        # Deletes every idle pipeline in the pool
+        helpers = [self._helpers(member.name) for member in self.members()]
+        engine = CleanupEngine.CleanupEngine(max_workers=self.max_workers)
+        engine.run([ml for ml, _ in helpers], [mp for _, mp in helpers])
+        return engine.report()
@@ -0,0 +1,13 @@
+import pytest
+
+import AbrLadder
+
+
+def test_default_qvbr_quality_level():
+    ladder = AbrLadder.parse("1080p:4M,360p:600k")
+    assert [rung.qvbr_quality_level for rung in ladder.rungs] == [9, 7]
+
+
+def test_qvbr_quality_level_of_zero_is_rejected():
+    with pytest.raises(ValueError, match="QVBR quality level 0"):
+        AbrLadder.parse("1080p:4M,720p:2M:0")
@@ -0,0 +1,24 @@
+import ChannelWaiter
+import FakeElemental
+import MediaLiveHelper
+import MediaPackageHelper
+import WarmPool
+
+
+def test_claim_applies_the_requested_cidr():
+    session = FakeElemental.FakeSession(time_scale=0.002)
+    waiter = ChannelWaiter.ChannelWaiter(session.client("medialive"), initial_delay=0.01, max_delay=0.1,
+                                         batch_window=0.01, expected_state_seconds=session.state_seconds)
+    WarmPool.WarmPool("test", size=1, security_cidr="203.0.113.0/24", session=session, waiter=waiter).fill()
+    # Claimed by a pool left at the default CIDR, as another run of the CLI would
+    pool = WarmPool.WarmPool("test", size=1, session=session, waiter=waiter)
+
+    tags = {"project": "event"}
+    media_package_helper = MediaPackageHelper.MediaPackageHelper("event", tags, session=session)
+    media_live_helper = MediaLiveHelper.MediaLiveHelper(
+        "0.0.0.0/0", media_package_helper.channel_id, "event", tags, waiter=waiter, session=session)
+    assert pool.claim(media_live_helper, media_package_helper)
+
+    group = session.client("medialive").describe_input_security_group(
+        InputSecurityGroupId=media_live_helper.security_group_id)
+    assert group["WhitelistRules"] == [{"Cidr": "0.0.0.0/0"}]